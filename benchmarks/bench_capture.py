@@ -0,0 +1,160 @@
+"""
+Traffic capture benchmark: proxy throughput with capture off, capturing
+metadata only and capturing bodies too, and how fast replay.py reads a
+capture back through mmap.
+
+Configurations are measured in turn for several rounds and the best
+round of each is kept, since the load generator shares the machine with
+the proxy. `overhead_pct` is the throughput lost against capture off;
+on small machines it is within the noise, so the cost rows also time
+`record` on the proxy loop and the writer's formatting per request.
+
+    python benchmarks/bench_capture.py
+    python benchmarks/bench_capture.py --requests 50000 --rounds 5 --json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from multidict import CIMultiDict
+
+from bench_proxy import HOST, PythonTarget
+from capture import BodySample, TrafficCapture, read_segment, segment_paths
+from loadgen import free_port, format_result, run_load_in_processes, start_stub_upstream_process
+from replay import load_records
+
+MODES = {
+    'off': {},
+    'metadata': {'capture_body_limit': 0},
+    'bodies': {'capture_body_limit': 4096},
+}
+
+
+class FakeRequest:
+    method = 'GET'
+    host = HOST
+    path_qs = '/static/app.js?v=3'
+    raw_headers = ((b'Host', HOST.encode()), (b'Accept', b'*/*'), (b'Accept-Encoding', b'gzip, deflate, br'),
+                   (b'User-Agent', b'Mozilla/5.0 (X11; Linux x86_64) Gecko/20100101 Firefox/128.0'),
+                   (b'Cookie', b'session=0123456789abcdef'))
+
+
+class FakeResponse:
+    headers = CIMultiDict([('Content-Type', 'application/javascript'), ('Content-Length', '1024'),
+                           ('ETag', '"abc123"'), ('Date', 'Sun, 18 Oct 2026 09:28:14 GMT')])
+
+
+def bench_costs(directory, count=20000):
+    capture = TrafficCapture(os.path.join(directory, 'costs'), flush_interval=3600)
+    request, response = FakeRequest(), FakeResponse()
+    rows = []
+    try:
+        for mode, sample in (('metadata', None), ('bodies', BodySample(4096))):
+            if sample is not None:
+                sample.take_response(os.urandom(1024))
+            start = time.perf_counter()
+            for _ in range(count):
+                capture.record(request, HOST, 'http://127.0.0.1:3000', 200, response, 0, 1024, 0.002, sample)
+            record_us = (time.perf_counter() - start) / count * 1e6
+            entries = list(capture.pending)
+            capture.pending.clear()
+            start = time.perf_counter()
+            for entry in entries:
+                capture.format(entry)
+            format_us = (time.perf_counter() - start) / count * 1e6
+            rows.append({'target': 'capture', 'mode': mode, 'record_us': round(record_us, 3),
+                         'format_us': round(format_us, 3)})
+    finally:
+        capture.close()
+    return rows
+
+
+def bench_read(directory):
+    paths = segment_paths(directory)
+    size = sum(os.path.getsize(path) for path in paths)
+    start = time.perf_counter()
+    count = sum(1 for path in paths for _ in read_segment(path))
+    elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    merged = sum(1 for _ in load_records(directory))
+    merged_elapsed = time.perf_counter() - start
+    return {
+        'target': 'replay',
+        'mode': 'read',
+        'records': count,
+        'mb': round(size / 1e6, 2),
+        'records_per_s': round(count / elapsed) if elapsed else 0,
+        'merged_records_per_s': round(merged / merged_elapsed) if merged_elapsed else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--rounds', type=int, default=3, help='rounds per mode; the best is reported')
+    parser.add_argument('--body-size', type=int, default=1024)
+    parser.add_argument('--loadgen-processes', type=int, default=2)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstream = start_stub_upstream_process(upstream_port, args.body_size)
+    best = {}
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            targets = {}
+            for mode in args.modes:
+                kwargs = dict(MODES[mode])
+                if mode != 'off':
+                    kwargs['capture_dir'] = os.path.join(directory, mode)
+                targets[mode] = PythonTarget(upstream_port, **kwargs)
+                targets[mode].start()
+            try:
+                for _ in range(args.rounds):
+                    for mode, target in targets.items():
+                        result = run_load_in_processes(f'http://127.0.0.1:{target.port}/', args.requests,
+                                                       args.concurrency, HOST, args.loadgen_processes)
+                        if mode not in best or result['rps'] > best[mode]['rps']:
+                            best[mode] = result
+            finally:
+                for target in targets.values():
+                    target.stop()
+
+            results = []
+            for mode, result in best.items():
+                result.update(target='python', mode=mode, concurrency=args.concurrency)
+                if 'off' in best and mode != 'off':
+                    result['overhead_pct'] = round((1 - result['rps'] / best['off']['rps']) * 100, 2)
+                results.append(result)
+            results.extend(bench_costs(directory))
+            captured = next((os.path.join(directory, mode) for mode in ('bodies', 'metadata') if mode in best), None)
+            if captured is not None:
+                results.append(bench_read(captured))
+        finally:
+            upstream.terminate()
+
+    if args.json:
+        print(json.dumps({'benchmark': 'capture', 'results': results}, indent=2))
+        return
+    for row in results:
+        if row['target'] == 'capture':
+            print(f"capture {row['mode']} cost: record {row['record_us']} us on the proxy loop, "
+                  f"format {row['format_us']} us on the writer thread")
+        elif row['target'] == 'replay':
+            print(f"replay read: {row['records']} records, {row['mb']} MB, {row['records_per_s']} records/s "
+                  f"({row['merged_records_per_s']} merged in time order)")
+        else:
+            overhead = f" | overhead {row['overhead_pct']}%" if 'overhead_pct' in row else ''
+            print(format_result(f"capture {row['mode']}", row) + overhead)
+
+
+if __name__ == '__main__':
+    main()
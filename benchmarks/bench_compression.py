@@ -0,0 +1,167 @@
+"""
+Compression benchmark: a JavaScript bundle served through ProxyServer
+with compression on, once per Accept-Encoding.
+
+For each coding it reports the bytes on the wire, the first fetch of a
+new bundle version (compressed on the fly, `cold_ms`), several new
+versions fetched at once (`cold_parallel_ms`, which shows the encoder
+thread pool at work), repeat fetches served from the compressed cache
+after revalidating the ETag upstream (`warm_p50_ms`), and an estimate of
+the transfer time over a slow link such as a VPN (`link_ms`). Codec rows
+time the encoders alone at the proxy's levels.
+
+    python benchmarks/bench_compression.py
+    python benchmarks/bench_compression.py --size 4000000 --link-mbps 10 --json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import ClientSession, web
+
+from bench_proxy import HOST, PythonTarget
+from compression import DEFAULT_LEVELS, ENCODINGS, Encoder
+from loadgen import free_port
+
+CODINGS = ('identity',) + ENCODINGS
+
+
+def make_bundle(size, seed=1):
+    """Minified-looking JavaScript: repetitive structure, varied identifiers and numbers."""
+    rng = random.Random(seed)
+    words = ['state', 'props', 'render', 'effect', 'value', 'index', 'module', 'export', 'default', 'return']
+    parts = []
+    total = 0
+    while total < size:
+        name = rng.choice(words) + str(rng.randrange(100000))
+        line = (f'function {name}(a,b){{const {rng.choice(words)}=a.{rng.choice(words)}'
+                f'({rng.randrange(1000)},b);return {rng.choice(words)}?{name}(b,a):{rng.random():.6f}}}\n')
+        parts.append(line)
+        total += len(line)
+    return ''.join(parts).encode()[:size]
+
+
+def _upstream_main(port, size, ready):
+    bundle = make_bundle(size)
+
+    async def handle(request):
+        # Every ?v= is a new version of the bundle with its own ETag
+        etag = f'"{request.query.get("v", "0")}"'
+        if request.headers.get('If-None-Match') in (etag, f'W/{etag}'):
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=bundle, content_type='application/javascript', headers={'ETag': etag})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        ready.set()
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+def start_upstream_process(port, size):
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=_upstream_main, args=(port, size, ready), daemon=True)
+    process.start()
+    if not ready.wait(10):
+        process.terminate()
+        raise RuntimeError("upstream did not start")
+    return process
+
+
+async def fetch_bundles(port, coding, versions, warm, parallel, link_mbps):
+    headers = {'Host': HOST, 'Accept-Encoding': coding}
+    url = f'http://127.0.0.1:{port}/bundle.js'
+
+    async with ClientSession(auto_decompress=False) as session:
+        async def get(version):
+            start = time.perf_counter()
+            async with session.get(f'{url}?v={version}', headers=headers) as resp:
+                body = await resp.read()
+                if resp.status != 200 or resp.headers.get('Content-Encoding', 'identity') != coding:
+                    raise RuntimeError(f"unexpected response {resp.status} {resp.headers.get('Content-Encoding')}")
+            return (time.perf_counter() - start) * 1000, len(body)
+
+        cold, size = zip(*[await get(f'{coding}-{version}') for version in range(versions)])
+        warm_times = [(await get(f'{coding}-0'))[0] for _ in range(warm)]
+        start = time.perf_counter()
+        await asyncio.gather(*(get(f'{coding}-p{index}') for index in range(parallel)))
+        cold_parallel = (time.perf_counter() - start) * 1000
+
+    return {
+        'bytes': size[0],
+        'cold_ms': round(statistics.median(cold), 3),
+        'cold_parallel_ms': round(cold_parallel, 3),
+        'warm_p50_ms': round(statistics.median(warm_times), 3),
+        'link_ms': round(size[0] * 8 / (link_mbps * 1e6) * 1000 + statistics.median(warm_times), 1),
+    }
+
+
+def bench_codecs(bundle, repeat):
+    rows = []
+    for coding in ENCODINGS:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = Encoder(coding, DEFAULT_LEVELS[coding]).compress(bundle)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        rows.append({
+            'target': 'codec',
+            'coding': coding,
+            'size': len(bundle),
+            'ratio': round(len(output) / len(bundle), 4),
+            'mb_per_s': round(len(bundle) / best / 1e6, 1),
+            'compress_ms': round(best * 1000, 3),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=2 * 1024 * 1024, help='bundle size in bytes')
+    parser.add_argument('--codings', nargs='+', default=list(CODINGS), choices=CODINGS)
+    parser.add_argument('--versions', type=int, default=5, help='new bundle versions fetched one by one')
+    parser.add_argument('--warm', type=int, default=20, help='repeat fetches of an unchanged version')
+    parser.add_argument('--parallel', type=int, default=8, help='new versions fetched at once')
+    parser.add_argument('--link-mbps', type=float, default=20.0, help='link speed for the transfer estimate')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = bench_codecs(make_bundle(args.size), 3)
+    upstream_port = free_port()
+    upstream = start_upstream_process(upstream_port, args.size)
+    target = PythonTarget(upstream_port, compress=True)
+    try:
+        target.start()
+        for coding in args.codings:
+            result = asyncio.run(fetch_bundles(target.port, coding, args.versions, args.warm, args.parallel,
+                                               args.link_mbps))
+            result.update(target='python', coding=coding, size=args.size)
+            results.append(result)
+    finally:
+        target.stop()
+        upstream.terminate()
+
+    if args.json:
+        print(json.dumps({'benchmark': 'compression', 'link_mbps': args.link_mbps, 'results': results}, indent=2))
+        return
+    for row in results:
+        fields = ' | '.join(f'{key} {value}' for key, value in row.items() if key not in ('target', 'coding', 'size'))
+        print(f"{row['target']:<6} {row['coding']:<8} {fields}")
+
+
+if __name__ == '__main__':
+    main()
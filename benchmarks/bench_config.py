@@ -0,0 +1,89 @@
+"""
+Benchmark for Caddy config generation (caddy_config.CaddyConfigCompiler).
+
+Compares the old string-concatenation Caddyfile builder with the compiler
+on a cold cache, a warm cache (nothing changed) and a single changed
+domain, for both the Caddyfile and native JSON output.
+
+    python benchmarks/bench_config.py
+    python benchmarks/bench_config.py --sizes 10 1000 10000 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from caddy_config import CaddyConfigCompiler
+
+
+def build_domains(size):
+    return {f'app{i}.test': f'http://127.0.0.1:{3000 + i % 1000}' for i in range(size)}
+
+
+def legacy_caddyfile(domains):
+    # The generator this compiler replaced
+    caddyfile_content = """
+{
+    admin off
+    local_certs
+}
+"""
+    for domain, target in domains.items():
+        caddyfile_content += f"""
+{domain} {{
+    tls internal
+    reverse_proxy {target}
+}}
+"""
+    return caddyfile_content
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return round(min(timings) * 1000, 3)
+
+
+def bench_size(size):
+    domains = build_domains(size)
+    changed = dict(domains)
+    changed['app0.test'] = 'http://127.0.0.1:9999'
+
+    result = {'domains': size, 'legacy_caddyfile_ms': best_of(lambda: legacy_caddyfile(domains))}
+    for fmt in ('caddyfile', 'json'):
+        result[f'{fmt}_cold_ms'] = best_of(lambda: CaddyConfigCompiler('localhost:2019', fmt).render(domains))
+
+        compiler = CaddyConfigCompiler('localhost:2019', fmt)
+        _, first_hash = compiler.render(domains)
+        result[f'{fmt}_warm_ms'] = best_of(lambda: compiler.render(domains))
+        result[f'{fmt}_one_change_ms'] = best_of(lambda: compiler.render(changed))
+        _, warm_hash = compiler.render(domains)
+        result[f'{fmt}_unchanged_hash_equal'] = first_hash == warm_hash
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = [bench_size(size) for size in args.sizes]
+    if args.json:
+        print(json.dumps({'benchmark': 'config_generation', 'results': results}, indent=2))
+        return
+    for result in results:
+        print(f"{result['domains']:>6} domains: legacy {result['legacy_caddyfile_ms']} ms | "
+              f"caddyfile cold {result['caddyfile_cold_ms']} / warm {result['caddyfile_warm_ms']} ms | "
+              f"json cold {result['json_cold_ms']} / warm {result['json_warm_ms']} / "
+              f"one change {result['json_one_change_ms']} ms")
+
+
+if __name__ == '__main__':
+    main()
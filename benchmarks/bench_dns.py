@@ -0,0 +1,134 @@
+"""
+Benchmark for the local DNS responder (dns_server.LocalDNSServer).
+
+Reports in-process lookup cost for tables of different sizes, then
+per-query latency and throughput over real UDP on localhost.
+
+    python benchmarks/bench_dns.py
+    python benchmarks/bench_dns.py --queries 50000 --concurrency 64 --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dns_server import AnswerTable, LocalDNSServer, TYPE_A
+
+
+def encode_query(query_id, name, qtype=TYPE_A):
+    qname = b''.join(bytes([len(label)]) + label.encode('ascii') for label in name.split('.')) + b'\x00'
+    return struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0) + qname + struct.pack('!HH', qtype, 1)
+
+
+def build_patterns(size):
+    patterns = []
+    for i in range(size):
+        if i % 3 == 0:
+            patterns.append(f'app{i}.test')
+        elif i % 3 == 1:
+            patterns.append(f'*.svc{i}.test')
+        else:
+            patterns.append(f'.zone{i}.test')
+    return patterns
+
+
+def query_names(size, count):
+    rng = random.Random(size)
+    names = []
+    for _ in range(count):
+        i = rng.randrange(size)
+        names.append(f'app{i}.test' if i % 3 == 0 else f'web.svc{i}.test' if i % 3 == 1 else f'a.b.zone{i}.test')
+    return names
+
+
+def bench_lookup(size, number=20):
+    table = AnswerTable()
+    table.sync(build_patterns(size))
+    names = query_names(size, 1000)
+
+    def run():
+        for name in names:
+            table.matches(name)
+
+    best = min(timeit.repeat(run, number=number, repeat=5))
+    return {'names': size, 'ns_per_lookup': round(best / (len(names) * number) * 1e9, 1)}
+
+
+class _Client(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.waiters = {}
+
+    def datagram_received(self, data, addr):
+        waiter = self.waiters.pop(struct.unpack_from('!H', data)[0], None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(data)
+
+
+async def bench_udp(size, total, concurrency):
+    server = LocalDNSServer()
+    server.table.sync(build_patterns(size))
+    host, port = await server.start('127.0.0.1', 0)
+
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(_Client, remote_addr=(host, port))
+    names = query_names(size, total)
+    latencies = []
+    next_index = iter(range(total))
+
+    async def worker():
+        for i in next_index:
+            query_id = i % 0xFFFF + 1
+            waiter = loop.create_future()
+            client.waiters[query_id] = waiter
+            start = time.perf_counter()
+            transport.sendto(encode_query(query_id, names[i]))
+            await asyncio.wait_for(waiter, 2)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    transport.close()
+    server.close()
+
+    latencies.sort()
+    return {
+        'names': size,
+        'queries': total,
+        'concurrency': concurrency,
+        'qps': round(total / elapsed),
+        'p50_us': round(latencies[len(latencies) // 2] * 1e6, 1),
+        'p99_us': round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    lookups = [bench_lookup(size) for size in args.sizes]
+    udp = [asyncio.run(bench_udp(size, args.queries, args.concurrency)) for size in args.sizes]
+
+    if args.json:
+        print(json.dumps({'benchmark': 'dns', 'lookup': lookups, 'udp': udp}, indent=2))
+        return
+    for result in lookups:
+        print(f"{result['names']:>6} names: {result['ns_per_lookup']:>8} ns/lookup")
+    for result in udp:
+        print(f"{result['names']:>6} names: {result['qps']:>7} queries/s over UDP, "
+              f"p50 {result['p50_us']} us, p99 {result['p99_us']} us (concurrency {result['concurrency']})")
+
+
+if __name__ == '__main__':
+    main()
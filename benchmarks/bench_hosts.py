@@ -0,0 +1,84 @@
+"""
+Benchmark for hosts file diffing (hosts_manager.HostsManager).
+
+Times rendering the managed block for an unchanged, one-domain-added and
+fresh hosts file, then update_hosts() against a temporary hosts file to
+check that unchanged syncs skip the write.
+
+    python benchmarks/bench_hosts.py
+    python benchmarks/bench_hosts.py --sizes 10 1000 10000 --json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hosts_manager import HostsManager
+
+SYSTEM_HOSTS = '127.0.0.1 localhost\n::1 localhost\n255.255.255.255 broadcasthost\n'
+
+
+def best_of(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return round(min(timings) * 1000, 3)
+
+
+def bench_size(size, directory):
+    domains = [f'app{i}.test' for i in range(size)]
+    hosts_path = os.path.join(directory, f'hosts-{size}')
+    with open(hosts_path, 'w') as f:
+        f.write(SYSTEM_HOSTS)
+
+    manager = HostsManager(hosts_path=hosts_path)
+    manager.managed_domains = set(domains)
+    fresh_ms = best_of(lambda: manager.render_hosts(SYSTEM_HOSTS))
+    manager.update_hosts()
+    with open(hosts_path) as f:
+        synced = f.read()
+
+    unchanged_ms = best_of(lambda: manager.render_hosts(synced))
+    manager.managed_domains.add('extra.test')
+    added_ms = best_of(lambda: manager.render_hosts(synced))
+    manager.managed_domains.discard('extra.test')
+
+    writes_before = manager.write_count
+    update_unchanged_ms = best_of(manager.update_hosts)
+    skipped = manager.write_count == writes_before
+
+    return {
+        'domains': size,
+        'render_fresh_ms': fresh_ms,
+        'render_unchanged_ms': unchanged_ms,
+        'render_one_added_ms': added_ms,
+        'update_unchanged_ms': update_unchanged_ms,
+        'unchanged_write_skipped': skipped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [bench_size(size, directory) for size in args.sizes]
+    if args.json:
+        print(json.dumps({'benchmark': 'hosts', 'results': results}, indent=2))
+        return
+    for result in results:
+        print(f"{result['domains']:>6} domains: fresh {result['render_fresh_ms']} ms | "
+              f"unchanged {result['render_unchanged_ms']} ms | one added {result['render_one_added_ms']} ms | "
+              f"update (no write) {result['update_unchanged_ms']} ms")
+
+
+if __name__ == '__main__':
+    main()
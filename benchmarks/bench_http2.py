@@ -0,0 +1,176 @@
+"""
+HTTP/2 benchmark: page-load-style fan-out, i.e. a burst of parallel small
+GETs like a browser fetching a dev bundle's modules, over HTTP/1.1 and
+over HTTP/2 (h2c with prior knowledge).
+
+The HTTP/1.1 client is capped at --h1-connections per host like a
+browser (6), so requests queue behind each other; the HTTP/2 client sends
+them all as streams on one connection. The stub upstream can add a
+per-request delay, standing in for a dev server transforming a module.
+Proxied targets also run with an h2c upstream, which the proxy
+multiplexes over a single connection.
+
+    python benchmarks/bench_http2.py
+    python benchmarks/bench_http2.py --requests 200 --delay-ms 0 10 --upstreams http h2c --json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+from bench_proxy import HOST, CaddyTarget, DirectTarget, PythonTarget, find_caddy
+from http2 import H2ServerConnection, H2UpstreamPool, HTTPListener
+from loadgen import free_port, summarize
+
+
+def _upstream_main(port, body_size, ready):
+    body = b'x' * body_size
+
+    async def handle(request):
+        # ?delay=<ms> simulates the upstream's work per request
+        delay = request.query_string.partition('delay=')[2].split('&')[0]
+        if delay and float(delay):
+            await asyncio.sleep(float(delay) / 1000)
+        return web.Response(body=body, content_type='application/javascript')
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        # HTTP/1.1 and h2c on the same port, as the proxy serves them
+        await asyncio.get_running_loop().create_server(
+            lambda: HTTPListener(runner.server, lambda: H2ServerConnection(handle, max_concurrent_streams=256)),
+            '127.0.0.1', port,
+        )
+        ready.set()
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+def start_upstream_process(port, body_size):
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=_upstream_main, args=(port, body_size, ready), daemon=True)
+    process.start()
+    if not ready.wait(10):
+        process.terminate()
+        raise RuntimeError("upstream did not start")
+    return process
+
+
+async def page_load(port, protocol, requests, rounds, delay_ms, h1_connections):
+    """Fetch `requests` paths at once, `rounds` times; the first, unmeasured round opens the connections."""
+    paths = [f'/src/module{index}.js?delay={delay_ms}' for index in range(requests)]
+    headers = {'Host': HOST}
+    latencies = []
+    page_times = []
+    errors = 0
+
+    if protocol == 'h1':
+        client = ClientSession(connector=TCPConnector(limit_per_host=h1_connections),
+                               timeout=ClientTimeout(total=60), auto_decompress=False)
+        url = f'http://127.0.0.1:{port}'
+    else:
+        client = H2UpstreamPool()
+        url = f'h2c://127.0.0.1:{port}'
+
+    async def fetch(path, record):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            async with client.get(url + path, headers=headers) as resp:
+                await resp.read()
+                ok = resp.status == 200
+        except Exception:
+            ok = False
+        if not ok:
+            errors += 1
+        elif record:
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    try:
+        await asyncio.gather(*(fetch(path, False) for path in paths))
+        errors = 0
+        for _ in range(rounds):
+            start = time.perf_counter()
+            await asyncio.gather(*(fetch(path, True) for path in paths))
+            page_times.append((time.perf_counter() - start) * 1000)
+    finally:
+        await client.close()
+
+    result = summarize(latencies, errors, sum(page_times) / 1000)
+    result['page_min_ms'] = round(min(page_times), 3)
+    result['page_median_ms'] = round(statistics.median(page_times), 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', nargs='+', default=['direct', 'python', 'caddy'],
+                        choices=['direct', 'python', 'caddy'])
+    parser.add_argument('--protocols', nargs='+', default=['h1', 'h2'], choices=['h1', 'h2'])
+    parser.add_argument('--upstreams', nargs='+', default=['http', 'h2c'], choices=['http', 'h2c'],
+                        help='how proxied targets talk to the upstream')
+    parser.add_argument('--requests', type=int, default=200, help='parallel GETs per page load')
+    parser.add_argument('--rounds', type=int, default=20, help='page loads per configuration')
+    parser.add_argument('--delay-ms', type=float, nargs='+', default=[0, 10], help='upstream delay per request')
+    parser.add_argument('--body-size', type=int, default=2048)
+    parser.add_argument('--h1-connections', type=int, default=6, help='HTTP/1.1 connections per host, as in browsers')
+    parser.add_argument('--caddy', default=None, help='path to the caddy binary')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstream = start_upstream_process(upstream_port, args.body_size)
+    caddy_path = find_caddy(args.caddy) if 'caddy' in args.targets else None
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            for name in args.targets:
+                if name == 'caddy' and not caddy_path:
+                    print("caddy not found; skipping the caddy target", file=sys.stderr)
+                    continue
+                for scheme in (['http'] if name == 'direct' else args.upstreams):
+                    if name == 'direct':
+                        target = DirectTarget(upstream_port)
+                    elif name == 'python':
+                        target = PythonTarget(upstream_port, scheme=scheme, http2=True)
+                    else:
+                        target = CaddyTarget(caddy_path, upstream_port, directory, scheme=scheme,
+                                             protocols=['h1', 'h2', 'h2c'])
+
+                    target.start()
+                    try:
+                        for delay in args.delay_ms:
+                            for protocol in args.protocols:
+                                result = asyncio.run(page_load(target.port, protocol, args.requests, args.rounds,
+                                                               delay, args.h1_connections))
+                                result.update(target=name, protocol=protocol, upstream=scheme, delay_ms=delay)
+                                results.append(result)
+                                if not args.json:
+                                    print(f"{name:<7} {protocol} upstream {scheme:<4} delay {delay:>4} ms: "
+                                          f"page {result['page_median_ms']:>9} ms (min {result['page_min_ms']}) | "
+                                          f"p50 {result['p50_ms']} ms p99 {result['p99_ms']} ms | "
+                                          f"errors {result['errors']}")
+                    finally:
+                        target.stop()
+        finally:
+            upstream.terminate()
+
+    if args.json:
+        print(json.dumps({'benchmark': 'http2', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+End-to-end proxy benchmark: a stub upstream driven through each proxy
+path by the asyncio load generator.
+
+Targets:
+  direct  the stub upstream with no proxy, as a baseline
+  python  ProxyServer (one worker process)
+  caddy   Caddy's reverse_proxy, using the route the app generates
+
+Caddy is found with --caddy, then in the app's data directory, then on
+PATH; the caddy target is skipped when none is found.
+
+    python benchmarks/bench_proxy.py
+    python benchmarks/bench_proxy.py --targets python caddy --concurrency 32 128 --json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from caddy_config import CaddyConfigCompiler
+from loadgen import format_result, free_port, run_load_in_processes, start_stub_upstream_process, wait_for_port
+from proxy_workers import ProxyWorkerPool
+
+HOST = 'bench.test'
+
+
+def find_caddy(path=None):
+    if path:
+        return path
+    from utils import get_data_dir
+    candidate = os.path.join(get_data_dir(), 'bins', 'caddy.exe' if os.name == 'nt' else 'caddy')
+    if os.path.exists(candidate):
+        return candidate
+    return shutil.which('caddy')
+
+
+class DirectTarget:
+    def __init__(self, upstream_port):
+        self.port = upstream_port
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class PythonTarget:
+    def __init__(self, upstream_port, workers=1, scheme='http', **proxy_kwargs):
+        self.port = free_port()
+        self.pool = ProxyWorkerPool(host='127.0.0.1', port=self.port, workers=workers, **proxy_kwargs)
+        self.pool.add_route(HOST, f'{scheme}://127.0.0.1:{upstream_port}')
+
+    def start(self):
+        self.pool.start()
+        wait_for_port(self.port)
+
+    def stop(self):
+        self.pool.stop()
+
+
+class CaddyTarget:
+    def __init__(self, caddy_path, upstream_port, directory, scheme='http', protocols=None):
+        self.caddy_path = caddy_path
+        self.port = free_port()
+        admin = f'localhost:{free_port()}'
+        # Same route the app generates, on a plain HTTP listener so TLS cost does not skew the comparison
+        route = CaddyConfigCompiler(admin).render_route(HOST, f'{scheme}://127.0.0.1:{upstream_port}')
+        server = {
+            'listen': [f'127.0.0.1:{self.port}'],
+            'automatic_https': {'disable': True},
+            'routes': [route],
+        }
+        if protocols:
+            server['protocols'] = protocols
+        config = {
+            'admin': {'listen': admin},
+            'logging': {'logs': {'default': {'level': 'ERROR'}}},
+            'apps': {'http': {'servers': {'bench': server}}},
+        }
+        self.config_path = os.path.join(directory, 'caddy-bench.json')
+        with open(self.config_path, 'w') as f:
+            json.dump(config, f)
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen([self.caddy_path, 'run', '--config', self.config_path],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        wait_for_port(self.port)
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', nargs='+', default=['direct', 'python', 'caddy'],
+                        choices=['direct', 'python', 'caddy'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[64])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--body-size', type=int, default=1024)
+    parser.add_argument('--loadgen-processes', type=int, default=2)
+    parser.add_argument('--caddy', default=None, help='path to the caddy binary')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstream = start_stub_upstream_process(upstream_port, args.body_size)
+    caddy_path = find_caddy(args.caddy) if 'caddy' in args.targets else None
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            for name in args.targets:
+                if name == 'direct':
+                    target = DirectTarget(upstream_port)
+                elif name == 'python':
+                    target = PythonTarget(upstream_port)
+                elif caddy_path:
+                    target = CaddyTarget(caddy_path, upstream_port, directory)
+                else:
+                    print("caddy not found; skipping the caddy target", file=sys.stderr)
+                    continue
+
+                target.start()
+                try:
+                    for concurrency in args.concurrency:
+                        result = run_load_in_processes(f'http://127.0.0.1:{target.port}/', args.requests,
+                                                       concurrency, HOST, args.loadgen_processes)
+                        result.update(target=name, concurrency=concurrency, body_size=args.body_size)
+                        results.append(result)
+                        if not args.json:
+                            print(format_result(f'{name} c={concurrency}', result))
+                finally:
+                    target.stop()
+        finally:
+            upstream.terminate()
+
+    if args.json:
+        print(json.dumps({'benchmark': 'proxy', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Microbenchmark for RouteTable lookups.
+
+Lookup cost should stay flat as the table grows from 10 to 10,000 routes.
+
+    python benchmarks/bench_route_table.py
+    python benchmarks/bench_route_table.py --sizes 10 1000 10000 --json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from route_table import RouteTable
+
+
+def build_routes(size):
+    routes = {}
+    for i in range(size):
+        kind = i % 4
+        if kind == 0:
+            routes[f'app{i}.test'] = f'http://127.0.0.1:{3000 + i % 1000}'
+        elif kind == 1:
+            routes[f'*.svc{i}.test'] = f'http://127.0.0.1:{4000 + i % 1000}'
+        elif kind == 2:
+            routes[f'.zone{i}.test'] = f'http://127.0.0.1:{5000 + i % 1000}'
+        else:
+            routes[f'api{i}.test/v1'] = f'http://127.0.0.1:{6000 + i % 1000}'
+    return routes
+
+
+def build_queries(size, count=1000):
+    rng = random.Random(size)
+    queries = []
+    for _ in range(count):
+        i = rng.randrange(size)
+        kind = i % 4
+        if kind == 0:
+            queries.append((f'app{i}.test:80', '/'))
+        elif kind == 1:
+            queries.append((f'web.svc{i}.test', '/index.html'))
+        elif kind == 2:
+            queries.append((f'a.b.zone{i}.test', '/'))
+        else:
+            queries.append((f'api{i}.test', '/v1/users'))
+    queries.append(('missing.example', '/'))
+    return queries
+
+
+def bench_size(size, number):
+    table = RouteTable(build_routes(size))
+    queries = build_queries(size)
+    lookup = table.lookup
+
+    def run():
+        for host, path in queries:
+            lookup(host, path)
+
+    misses = sum(1 for host, path in queries[:-1] if lookup(host, path) is None)
+    if misses:
+        raise AssertionError(f'{misses} expected routes did not match at size {size}')
+
+    best = min(timeit.repeat(run, number=number, repeat=5))
+    return {
+        'routes': size,
+        'lookups': len(queries) * number,
+        'ns_per_lookup': round(best / (len(queries) * number) * 1e9, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--number', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = [bench_size(size, args.number) for size in args.sizes]
+    if args.json:
+        print(json.dumps({'benchmark': 'route_table', 'results': results}, indent=2))
+    else:
+        for result in results:
+            print(f"{result['routes']:>6} routes: {result['ns_per_lookup']:>8} ns/lookup")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark for cold start: module import time in a fresh interpreter, CLI
+round trips, and (given a Caddy binary) how long `headless.py run` takes
+until its control socket answers.
+
+Every run also checks that importing the headless entry point pulls in
+none of HEAVY_MODULES; --check turns a violation into a non-zero exit.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --caddy /usr/local/bin/caddy --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from headless import DaemonUnavailable, send_command
+from loadgen import free_port
+
+# Modules the headless path must not import at startup
+HEAVY_MODULES = ('PyQt6', 'requests', 'urllib3', 'aiohttp', 'gui')
+
+IMPORT_TARGETS = ('headless', 'proxy_manager', 'proxy_server')
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted({{name.split('.')[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps({{'ms': elapsed * 1000, 'heavy': heavy}}))
+"""
+
+
+def time_import(module, repeat, env):
+    timings, heavy = [], []
+    for _ in range(repeat):
+        code = IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if result.returncode != 0:
+            # e.g. PyQt6 is not installed on a headless box
+            return {'target': module, 'error': result.stderr.strip().splitlines()[-1]}
+        sample = json.loads(result.stdout)
+        timings.append(sample['ms'])
+        heavy = sample['heavy']
+    return {
+        'target': module,
+        'import_min_ms': round(min(timings), 2),
+        'import_median_ms': round(statistics.median(timings), 2),
+        'heavy_modules': heavy,
+    }
+
+
+def time_command(command, repeat, env):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(min(timings), 2), round(statistics.median(timings), 2)
+
+
+def bench_cli(name, arguments, repeat, env):
+    best, median = time_command([sys.executable, os.path.join(ROOT, 'headless.py'), *arguments], repeat, env)
+    return {'target': name, 'wall_min_ms': best, 'wall_median_ms': median}
+
+
+def bench_daemon(caddy, repeat, env):
+    """Spawn the daemon `repeat` times; each time, wait for the control socket and stop it again."""
+    address = os.path.join(env['WILDCADDY_DATA_DIR'], 'wildcaddy.sock')
+    admin = f'localhost:{free_port()}'
+    ready, caddy_ready = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'headless.py'), 'run', '--caddy', caddy, '--admin', admin, '--quiet'],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"headless daemon exited with code {process.returncode}")
+                try:
+                    status = send_command(address, 'status', timeout=1)
+                    break
+                except DaemonUnavailable:
+                    time.sleep(0.005)
+            ready.append((time.perf_counter() - start) * 1000)
+            caddy_ready.append(status['time_to_ready_ms'])
+            cli = bench_cli('status', ['status'], 1, env)
+            send_command(address, 'stop')
+            process.wait(timeout=15)
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+    return {
+        'target': 'headless run',
+        'ready_min_ms': round(min(ready), 2),
+        'ready_median_ms': round(statistics.median(ready), 2),
+        'caddy_ready_median_ms': round(statistics.median(caddy_ready), 2),
+        'status_cli_ms': cli['wall_min_ms'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--caddy', default=None, help='path to the caddy binary; enables the daemon benchmark')
+    parser.add_argument('--check', action='store_true', help='exit 1 if headless imports a heavy module')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(os.environ, WILDCADDY_DATA_DIR=data_dir)
+        imports = [time_import(module, args.repeat, env) for module in IMPORT_TARGETS]
+        best, median = time_command([sys.executable, '-c', 'pass'], args.repeat, env)
+        cli = [{'target': 'python -c pass', 'wall_min_ms': best, 'wall_median_ms': median}]
+        # No daemon is running yet, so this exercises the offline config path
+        cli.append(bench_cli('list (offline)', ['list'], args.repeat, env))
+        daemon = [bench_daemon(args.caddy, args.repeat, env)] if args.caddy else []
+
+    headless_heavy = next(row.get('heavy_modules', []) for row in imports if row['target'] == 'headless')
+    if args.json:
+        print(json.dumps({'benchmark': 'startup', 'imports': imports, 'cli': cli, 'daemon': daemon}, indent=2))
+    else:
+        for row in imports:
+            if 'error' in row:
+                print(f"import {row['target']:<14} unavailable: {row['error']}")
+                continue
+            heavy = ', '.join(row.get('heavy_modules', [])) or '-'
+            print(f"import {row['target']:<14} {row['import_min_ms']:>8} ms (median {row['import_median_ms']}) heavy: {heavy}")
+        for row in cli + daemon:
+            fields = ' | '.join(f'{key} {value}' for key, value in row.items() if key != 'target')
+            print(f"{row['target']:<21} {fields}")
+    if args.check and headless_heavy:
+        print(f"headless imports heavy modules: {', '.join(headless_heavy)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
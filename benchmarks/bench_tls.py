@@ -0,0 +1,192 @@
+"""
+TLS benchmark: the certificate store and HTTPS handshakes through
+ProxyServer with tls=True.
+
+Store rows time issuing a certificate, loading an issued one from disk
+into a new SSLContext, and the in-memory lookup the SNI callback does on
+every handshake. Python rows time handshakes and complete requests over
+new connections, with a full handshake each time and with the previous
+connection's session resumed, and the first request to a domain whose
+certificate was issued when the route was added, against one issued on
+demand during the handshake.
+
+    python benchmarks/bench_tls.py
+    python benchmarks/bench_tls.py --connections 500 --versions TLSv1.3 --json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import ssl
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+
+from bench_proxy import HOST, PythonTarget
+from certificates import CertificateStore
+from loadgen import free_port, summarize
+
+
+def _upstream_main(port, ready):
+    async def handle(request):
+        return web.Response(text='ok')
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        ready.set()
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+def start_upstream_process(port):
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=_upstream_main, args=(port, ready), daemon=True)
+    process.start()
+    if not ready.wait(10):
+        process.terminate()
+        raise RuntimeError("upstream did not start")
+    return process
+
+
+def timed_ms(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def bench_store(directory, count):
+    store = CertificateStore(os.path.join(directory, 'store'))
+    issue = [timed_ms(store.ensure, f'app{index}.test')[0] for index in range(count)]
+    # A fresh store finds the certificates on disk, as a restarted proxy would
+    store = CertificateStore(os.path.join(directory, 'store'))
+    load = [timed_ms(store.lookup, f'app{index}.test')[0] for index in range(count)]
+    lookups = 100000
+    start = time.perf_counter()
+    for index in range(lookups):
+        store.lookup(f'app{index % count}.test')
+    lookup_us = (time.perf_counter() - start) / lookups * 1e6
+    return [
+        {'target': 'store', 'mode': 'issue', 'p50_ms': round(statistics.median(issue), 3),
+         'max_ms': round(max(issue), 3)},
+        {'target': 'store', 'mode': 'load', 'p50_ms': round(statistics.median(load), 3),
+         'max_ms': round(max(load), 3)},
+        {'target': 'store', 'mode': 'lookup', 'lookup_us': round(lookup_us, 3)},
+    ]
+
+
+def request(port, context, host, session=None):
+    """One GET over a new TLS connection; returns (handshake ms, total ms, session, resumed)."""
+    start = time.perf_counter()
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with context.wrap_socket(sock, server_hostname=host, session=session) as tls:
+            handshake = time.perf_counter()
+            tls.sendall(f'GET / HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+            response = b''
+            while True:
+                data = tls.recv(65536)
+                if not data:
+                    break
+                response += data
+            if not response.startswith(b'HTTP/1.1 200'):
+                raise RuntimeError(f"unexpected response {response[:40]!r}")
+            # TLS 1.3 sends its tickets after the handshake, so the session is read last
+            result = ((handshake - start) * 1000, (time.perf_counter() - start) * 1000, tls.session,
+                      tls.session_reused)
+    return result
+
+
+def bench_handshakes(port, ca_path, version, connections, resume):
+    context = ssl.create_default_context(cafile=ca_path)
+    context.minimum_version = context.maximum_version = getattr(ssl.TLSVersion, version.replace('.', '_'))
+    handshakes, totals = [], []
+    errors = resumed = 0
+    session = None
+    request(port, context, HOST)
+    start = time.perf_counter()
+    for _ in range(connections):
+        try:
+            handshake, total, next_session, reused = request(port, context, HOST, session if resume else None)
+        except (OSError, RuntimeError):
+            errors += 1
+            continue
+        session = next_session
+        resumed += reused
+        handshakes.append(handshake)
+        totals.append(total)
+    result = summarize(totals, errors, time.perf_counter() - start)
+    result['handshake_p50_ms'] = round(statistics.median(handshakes), 3) if handshakes else 0.0
+    result['resumed'] = resumed
+    return result
+
+
+def bench_first_hit(target, upstream_port, ca_path, domains):
+    """First request to new domains: certificate issued when the route was added, or during the handshake."""
+    context = ssl.create_default_context(cafile=ca_path)
+    # '*.ahead.test' is issued by add_route; names two labels under '.demand.test' need their own certificate
+    target.pool.add_route('*.ahead.test', f'http://127.0.0.1:{upstream_port}')
+    target.pool.add_route('.demand.test', f'http://127.0.0.1:{upstream_port}')
+    time.sleep(0.2)
+    rows = []
+    for mode, name in (('issued_ahead', 'site{}.ahead.test'), ('on_demand', 'a.site{}.demand.test')):
+        first, second = [], []
+        for index in range(domains):
+            host = name.format(index)
+            first.append(request(target.port, context, host)[1])
+            second.append(request(target.port, context, host)[1])
+        rows.append({'target': 'python', 'mode': mode, 'first_p50_ms': round(statistics.median(first), 3),
+                     'repeat_p50_ms': round(statistics.median(second), 3)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=300, help='sequential connections per configuration')
+    parser.add_argument('--versions', nargs='+', default=['TLSv1.2', 'TLSv1.3'], choices=['TLSv1.2', 'TLSv1.3'])
+    parser.add_argument('--certificates', type=int, default=50, help='certificates issued and loaded by the store')
+    parser.add_argument('--domains', type=int, default=20, help='new domains for the first-hit rows')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstream = start_upstream_process(upstream_port)
+    with tempfile.TemporaryDirectory() as directory:
+        results = bench_store(directory, args.certificates)
+        tls_dir = os.path.join(directory, 'proxy')
+        target = PythonTarget(upstream_port, tls=True, tls_dir=tls_dir)
+        ca_path = os.path.join(tls_dir, 'root.crt')
+        try:
+            target.start()
+            for version in args.versions:
+                for mode in ('full', 'resumed'):
+                    result = bench_handshakes(target.port, ca_path, version, args.connections, mode == 'resumed')
+                    result.update(target='python', protocol=version, mode=mode)
+                    results.append(result)
+            results.extend(bench_first_hit(target, upstream_port, ca_path, args.domains))
+        finally:
+            target.stop()
+            upstream.terminate()
+
+    if args.json:
+        print(json.dumps({'benchmark': 'tls', 'results': results}, indent=2))
+        return
+    for row in results:
+        label = ' '.join(str(row[key]) for key in ('target', 'protocol', 'mode') if key in row)
+        fields = ' | '.join(f'{key} {value}' for key, value in row.items() if key not in ('target', 'protocol', 'mode'))
+        print(f"{label:<24} {fields}")
+
+
+if __name__ == '__main__':
+    main()
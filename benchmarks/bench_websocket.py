@@ -0,0 +1,153 @@
+"""
+WebSocket relay benchmark: clients ping-pong messages with a local echo
+server, directly and through each proxy, and report messages per second
+and round-trip latency.
+
+Targets are the same as bench_proxy.py: direct (no proxy), python
+(ProxyServer, one worker process) and caddy (skipped when not found).
+
+    python benchmarks/bench_websocket.py
+    python benchmarks/bench_websocket.py --connections 1 50 --size 16 4096 --json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import ClientSession, WSMsgType, web
+
+from bench_proxy import HOST, CaddyTarget, DirectTarget, PythonTarget, find_caddy
+from loadgen import free_port, summarize
+
+
+async def echo(request):
+    ws = web.WebSocketResponse(max_msg_size=0)
+    await ws.prepare(request)
+    async for msg in ws:
+        if msg.type == WSMsgType.BINARY:
+            await ws.send_bytes(msg.data)
+        elif msg.type == WSMsgType.TEXT:
+            await ws.send_str(msg.data)
+    return ws
+
+
+def _echo_main(port, ready):
+    async def run():
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', echo)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        ready.set()
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+def start_echo_process(port):
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=_echo_main, args=(port, ready), daemon=True)
+    process.start()
+    if not ready.wait(10):
+        process.terminate()
+        raise RuntimeError("echo server did not start")
+    return process
+
+
+async def ping_pong(url, connections, messages, size, warmup=50):
+    """Each connection sends `messages` messages of `size` bytes, one at a time, waiting for the echo."""
+    payload = os.urandom(size)
+    latencies = []
+    errors = 0
+
+    async with ClientSession() as session:
+        sockets = await asyncio.gather(*(
+            session.ws_connect(url, headers={'Host': HOST}, max_msg_size=0) for _ in range(connections)
+        ))
+
+        async def run(ws, count, record):
+            nonlocal errors
+            for _ in range(count):
+                start = time.perf_counter()
+                await ws.send_bytes(payload)
+                msg = await ws.receive()
+                if msg.type != WSMsgType.BINARY or len(msg.data) != size:
+                    errors += 1
+                    return
+                if record:
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(run(ws, warmup, False) for ws in sockets))
+        started = time.perf_counter()
+        await asyncio.gather(*(run(ws, messages, True) for ws in sockets))
+        elapsed = time.perf_counter() - started
+        await asyncio.gather(*(ws.close() for ws in sockets))
+
+    result = summarize(latencies, errors, elapsed)
+    # One message is one round trip: the send and its echo
+    result['messages'] = result.pop('requests')
+    result['msgs_per_s'] = result.pop('rps')
+    result['mb_per_s'] = round(2 * result['messages'] * size / elapsed / 1e6, 2) if elapsed else 0.0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', nargs='+', default=['direct', 'python', 'caddy'],
+                        choices=['direct', 'python', 'caddy'])
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 50])
+    parser.add_argument('--size', type=int, nargs='+', default=[64, 16384], help='message sizes in bytes')
+    parser.add_argument('--messages', type=int, default=2000, help='round trips per connection')
+    parser.add_argument('--caddy', default=None, help='path to the caddy binary')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstream = start_echo_process(upstream_port)
+    caddy_path = find_caddy(args.caddy) if 'caddy' in args.targets else None
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            for name in args.targets:
+                if name == 'direct':
+                    target = DirectTarget(upstream_port)
+                elif name == 'python':
+                    target = PythonTarget(upstream_port)
+                elif caddy_path:
+                    target = CaddyTarget(caddy_path, upstream_port, directory)
+                else:
+                    print("caddy not found; skipping the caddy target", file=sys.stderr)
+                    continue
+
+                target.start()
+                try:
+                    for connections in args.connections:
+                        # Keep the total work roughly constant as connections grow
+                        messages = max(50, args.messages // connections)
+                        for size in args.size:
+                            result = asyncio.run(ping_pong(f'http://127.0.0.1:{target.port}/echo',
+                                                           connections, messages, size))
+                            result.update(target=name, concurrency=connections, size=size)
+                            results.append(result)
+                            if not args.json:
+                                print(f"{name:<7} c={connections:<4} {size:>6} B: {result['msgs_per_s']:>9} msg/s "
+                                      f"{result['mb_per_s']:>8} MB/s | p50 {result['p50_ms']} ms "
+                                      f"p99 {result['p99_ms']} ms | errors {result['errors']}")
+                finally:
+                    target.stop()
+        finally:
+            upstream.terminate()
+
+    if args.json:
+        print(json.dumps({'benchmark': 'websocket', 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Throughput of the Python proxy with 1..N worker processes
+(proxy_workers.ProxyWorkerPool) in front of a stub upstream.
+
+The load generator and the stub upstream run in their own processes so
+they do not share a core with the proxy under test. Scaling is only
+visible on a machine with more cores than workers.
+
+    python benchmarks/bench_workers.py --workers 1 2 4
+    python benchmarks/bench_workers.py --requests 50000 --json
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadgen import format_result, free_port, run_load_in_processes, start_stub_upstream_process, wait_for_port
+from proxy_workers import ProxyWorkerPool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=128)
+    parser.add_argument('--loadgen-processes', type=int, default=2)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    upstream = start_stub_upstream_process(upstream_port)
+
+    results = {'cpu_count': os.cpu_count(), 'runs': {}}
+    for workers in args.workers:
+        port = free_port()
+        pool = ProxyWorkerPool(host='127.0.0.1', port=port, workers=workers)
+        pool.add_route('bench.test', f'http://127.0.0.1:{upstream_port}')
+        pool.start()
+        try:
+            wait_for_port(port)
+            result = run_load_in_processes(f'http://127.0.0.1:{port}/', args.requests, args.concurrency,
+                                           'bench.test', args.loadgen_processes)
+        finally:
+            pool.stop()
+
+        results['runs'][workers] = result
+        if not args.json:
+            print(format_result(f'{workers} worker(s)', result))
+
+    upstream.terminate()
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
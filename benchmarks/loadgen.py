@@ -0,0 +1,181 @@
+"""
+Shared load-testing helpers for the benchmarks: a stub upstream that
+returns a fixed body, and an asyncio HTTP load generator that reports
+throughput and latency percentiles.
+
+    python benchmarks/loadgen.py http://127.0.0.1:8080/ --host app.test --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import time
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, web
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def start_stub_upstream(host='127.0.0.1', port=0, body_size=1024):
+    """Start a stub upstream on the current loop; returns (runner, port)."""
+    body = b'x' * body_size
+
+    async def handle(request):
+        await request.read()
+        return web.Response(body=body, content_type='application/octet-stream')
+
+    app = web.Application()
+    app.router.add_route('*', '/{tail:.*}', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, port
+
+
+async def run_load(url, requests=10000, concurrency=64, host_header=None, method='GET', warmup=200,
+                   keep_latencies=False):
+    """Send `requests` requests over `concurrency` connections and return a summary dict."""
+    headers = {'Host': host_header} if host_header else {}
+    connector = TCPConnector(limit=concurrency, force_close=False)
+    latencies = []
+    errors = 0
+    remaining = requests + warmup
+
+    async with ClientSession(connector=connector, timeout=ClientTimeout(total=30), auto_decompress=False) as session:
+        async def one():
+            async with session.request(method, url, headers=headers) as response:
+                await response.read()
+                return response.status
+
+        # Warm the pools (ours, the proxy's and the upstream's) before measuring
+        await asyncio.gather(*(one() for _ in range(min(warmup, remaining))))
+        remaining = requests
+
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    status = await one()
+                    if status >= 500:
+                        errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    result = summarize(latencies, errors, elapsed)
+    if keep_latencies:
+        result['latencies'] = latencies
+    return result
+
+
+def summarize(latencies, errors, elapsed):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10, host='127.0.0.1'):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"port {port} did not open")
+
+
+def _upstream_main(port, body_size, ready):
+    async def run():
+        await start_stub_upstream(port=port, body_size=body_size)
+        ready.set()
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+def start_stub_upstream_process(port, body_size=1024):
+    """Run the stub upstream in its own process so it does not share a core with the code under test."""
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=_upstream_main, args=(port, body_size, ready), daemon=True)
+    process.start()
+    if not ready.wait(10):
+        process.terminate()
+        raise RuntimeError("stub upstream did not start")
+    return process
+
+
+def _load_main(url, requests, concurrency, host_header, queue):
+    queue.put(asyncio.run(run_load(url, requests, concurrency, host_header, keep_latencies=True)))
+
+
+def run_load_in_processes(url, requests=10000, concurrency=64, host_header=None, processes=2):
+    """run_load split across `processes` processes, with percentiles over all of their latencies."""
+    processes = max(1, processes)
+    queue = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=_load_main,
+            args=(url, requests // processes, max(1, concurrency // processes), host_header, queue),
+        )
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    parts = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    latencies = [latency for part in parts for latency in part['latencies']]
+    # The processes ran side by side, so throughput is the sum of each one's
+    result = summarize(latencies, sum(part['errors'] for part in parts), max(part['seconds'] for part in parts))
+    result['rps'] = round(sum(part['rps'] for part in parts), 1)
+    return result
+
+
+def format_result(label, result):
+    return (f"{label:<24} {result['rps']:>10.1f} req/s  p50 {result['p50_ms']:.2f} ms  "
+            f"p95 {result['p95_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms  errors {result['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url')
+    parser.add_argument('--host', default=None, help='Host header to send')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    result = asyncio.run(run_load(args.url, args.requests, args.concurrency, args.host))
+    print(json.dumps(result, indent=2) if args.json else format_result(args.url, result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Run the benchmark suite and save one JSON report, optionally comparing it
+with an earlier report to catch regressions.
+
+The microbenchmarks (route lookup, config generation, hosts diffing, DNS
+lookup) run at 10, 1k and 10k domains. The startup benchmark times cold
+imports and the headless CLI. The proxy benchmark drives the Python proxy
+and Caddy (when available) through the load generator, the websocket
+benchmark measures their upgrade relays against an echo server, and the
+http2 benchmark compares page-load fan-out over HTTP/1.1 and HTTP/2, the
+compression benchmark times on-the-fly and cached br/zstd/gzip, the
+tls benchmark times certificate issuing and full vs resumed handshakes,
+and the capture benchmark measures traffic capture overhead and replay
+reads.
+
+    python benchmarks/run_all.py --output baseline.json
+    python benchmarks/run_all.py --output after.json --compare baseline.json
+    python benchmarks/run_all.py --quick --skip-proxy
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Metric name suffixes where a larger number is better; everything else timed is lower-is-better
+HIGHER_IS_BETTER = ('rps', 'qps', 'msgs_per_s', 'mb_per_s')
+TIMED_SUFFIXES = ('_ms', '_us', 'ns_per_lookup')
+# Fields that identify a result row rather than measure it
+IDENTITY_FIELDS = ('routes', 'domains', 'names', 'target', 'concurrency', 'size', 'protocol', 'upstream', 'delay_ms',
+                   'coding', 'mode')
+
+
+def run_script(name, *args):
+    command = [sys.executable, os.path.join(BENCH_DIR, name), '--json', *args]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    # Skip anything printed before the JSON document, e.g. startup messages
+    return json.loads(output[output.index('{'):])
+
+
+def flatten(report):
+    """{'bench/identity/metric': value} for every numeric measurement in a report."""
+    flat = {}
+
+    def add_rows(prefix, rows):
+        for row in rows:
+            identity = '/'.join(f'{field}={row[field]}' for field in IDENTITY_FIELDS if field in row)
+            for key, value in row.items():
+                if key in IDENTITY_FIELDS or isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                flat[f'{prefix}/{identity}/{key}'] = value
+
+    for name, result in report['benchmarks'].items():
+        for key, value in result.items():
+            if isinstance(value, list):
+                add_rows(f'{name}.{key}', value)
+    return flat
+
+
+def direction(metric):
+    name = metric.rsplit('/', 1)[-1]
+    if name in HIGHER_IS_BETTER:
+        return 1
+    if name.endswith(TIMED_SUFFIXES):
+        return -1
+    return 0
+
+
+def compare(current, baseline, threshold):
+    """Print metrics that moved by more than `threshold`; returns the number of regressions."""
+    now, before = flatten(current), flatten(baseline)
+    regressions = 0
+    for metric in sorted(now):
+        sign = direction(metric)
+        old = before.get(metric)
+        if not sign or not old:
+            continue
+        change = (now[metric] - old) / old
+        if abs(change) < threshold:
+            continue
+        worse = change * sign < 0
+        regressions += worse
+        print(f"{'REGRESSION' if worse else 'improved  '} {metric}: {old} -> {now[metric]} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--output', default=None, help='write the JSON report here')
+    parser.add_argument('--compare', default=None, help='earlier report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative change to report (default 10%%)')
+    parser.add_argument('--quick', action='store_true', help='fewer proxy requests')
+    parser.add_argument('--skip-proxy', action='store_true', help='microbenchmarks only')
+    parser.add_argument('--caddy', default=None, help='path to the caddy binary for the proxy benchmark')
+    args = parser.parse_args()
+
+    sizes = [str(size) for size in args.sizes]
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'benchmarks': {},
+    }
+    steps = [
+        ('route_table', 'bench_route_table.py', ['--sizes', *sizes]),
+        ('config', 'bench_config.py', ['--sizes', *sizes]),
+        ('hosts', 'bench_hosts.py', ['--sizes', *sizes]),
+        ('dns', 'bench_dns.py', ['--sizes', *sizes]),
+        ('startup', 'bench_startup.py', ['--caddy', args.caddy] if args.caddy else []),
+    ]
+    if not args.skip_proxy:
+        proxy_args = ['--requests', '5000' if args.quick else '20000', '--concurrency', '16', '64']
+        if args.caddy:
+            proxy_args += ['--caddy', args.caddy]
+        steps.append(('proxy', 'bench_proxy.py', proxy_args))
+        websocket_args = ['--messages', '500' if args.quick else '2000']
+        if args.caddy:
+            websocket_args += ['--caddy', args.caddy]
+        steps.append(('websocket', 'bench_websocket.py', websocket_args))
+        http2_args = ['--rounds', '5' if args.quick else '20']
+        if args.caddy:
+            http2_args += ['--caddy', args.caddy]
+        steps.append(('http2', 'bench_http2.py', http2_args))
+        steps.append(('compression', 'bench_compression.py', ['--versions', '2' if args.quick else '5']))
+        steps.append(('tls', 'bench_tls.py', ['--connections', '50' if args.quick else '300']))
+        steps.append(('capture', 'bench_capture.py', ['--requests', '5000' if args.quick else '20000',
+                                                       '--rounds', '1' if args.quick else '3']))
+
+    for name, script, script_args in steps:
+        print(f"running {name}...", file=sys.stderr)
+        started = time.perf_counter()
+        report['benchmarks'][name] = run_script(script, *script_args)
+        print(f"  done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
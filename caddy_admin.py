@@ -0,0 +1,94 @@
+import subprocess
+import time
+
+DEFAULT_ADMIN_ADDRESS = 'localhost:2019'
+
+
+class CaddyAdminError(Exception):
+    pass
+
+
+class CaddyAdminClient:
+    """Small client for Caddy's local admin API."""
+
+    def __init__(self, address=DEFAULT_ADMIN_ADDRESS, timeout=10):
+        self.address = address
+        self.base_url = f'http://{address}'
+        self.timeout = timeout
+        self._session = None
+
+    @property
+    def session(self):
+        # requests is imported on first use so a headless start does not pay for it
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def _request(self, method, path, **kwargs):
+        import requests
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', **kwargs)
+        except requests.RequestException as e:
+            raise CaddyAdminError(f"Caddy admin API unreachable at {self.address}: {str(e)}")
+        if response.status_code >= 400:
+            raise CaddyAdminError(
+                f"Caddy admin API {method} {path} failed with {response.status_code}: {response.text.strip()}"
+            )
+        return response
+
+    def is_alive(self):
+        try:
+            self._request('GET', '/config/', timeout=1)
+            return True
+        except CaddyAdminError:
+            return False
+
+    def load_caddyfile(self, content):
+        """Replace the running config with a Caddyfile; Caddy adapts it server-side."""
+        self._request('POST', '/load', data=content.encode('utf-8'),
+                      headers={'Content-Type': 'text/caddyfile'})
+
+    def load_json(self, config):
+        """Replace the running config with native JSON, given as a dict or an already-serialized string."""
+        if isinstance(config, str):
+            self._request('POST', '/load', data=config.encode('utf-8'),
+                          headers={'Content-Type': 'application/json'})
+        else:
+            self._request('POST', '/load', json=config)
+
+    def apply(self, method, path, body=None):
+        """Send one config change, e.g. ('DELETE', '/id/<route id>', None)."""
+        self._request(method, path, json=body)
+
+    def get_config(self, path=''):
+        return self._request('GET', f'/config/{path}').json()
+
+    def metrics(self):
+        """Caddy's Prometheus metrics, as text."""
+        return self._request('GET', '/metrics').text
+
+    def upstreams(self):
+        """Per-upstream state of every reverse_proxy: [{'address', 'num_requests', 'fails'}]."""
+        return self._request('GET', '/reverse_proxy/upstreams').json() or []
+
+
+def reload_with_cli(caddy_path, config_path, address=DEFAULT_ADMIN_ADDRESS, timeout=30):
+    """Fallback reload through `caddy reload`, which talks to the same admin endpoint."""
+    result = subprocess.run(
+        [caddy_path, 'reload', '--config', config_path, '--address', address],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        timeout=timeout,
+    )
+    if result.returncode != 0:
+        raise CaddyAdminError(f"caddy reload exited with {result.returncode}: {result.stderr.strip()}")
+
+
+def timed(func, *args, **kwargs):
+    """Run func and return its elapsed wall time in milliseconds."""
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import re
+from operator import itemgetter
+from urllib.parse import urlsplit
+
+from load_balancer import parse_target
+from route_table import split_pattern
+from utils import atomic_write
+
+SERVER_NAME = 'wildcaddy'
+
+# Passive health settings shared with the Python proxy's UpstreamGroup defaults
+MAX_FAILS = 3
+FAIL_DURATION = '10s'
+UNHEALTHY_STATUS = [502, 503, 504]
+
+
+def parse_upstream(target):
+    """Turn a target such as 'http://127.0.0.1:3000', 'h2c://127.0.0.1:3000' or 'localhost:3000' into (dial, use_tls)."""
+    target = target.strip()
+    if '://' not in target:
+        target = 'http://' + (f'localhost{target}' if target.startswith(':') else target)
+    parts = urlsplit(target)
+    use_tls = parts.scheme == 'https'
+    port = parts.port or (443 if use_tls else 80)
+    host = parts.hostname or 'localhost'
+    if ':' in host:
+        host = f'[{host}]'
+    return f'{host}:{port}', use_tls
+
+
+def selection_policy(policy, key):
+    """Caddy's JSON selection_policy for a load_balancer policy name."""
+    if policy == 'random_choose':
+        return {'policy': 'random_choose', 'choose': 2}
+    if policy == 'header':
+        return {'policy': 'header', 'field': key}
+    if policy == 'cookie':
+        return {'policy': 'cookie', 'name': key}
+    return {'policy': policy}
+
+
+def route_id(pattern):
+    return f"{SERVER_NAME}-{re.sub(r'[^A-Za-z0-9.-]', '_', pattern)}"
+
+
+def route_sort_key(pattern):
+    """Most specific first: exact hosts, then wildcards/suffixes by depth, longer paths first."""
+    host, path = split_pattern(pattern)
+    is_pattern = host.startswith('*.') or host.startswith('.')
+    return (is_pattern, -host.count('.'), -len(path), pattern)
+
+
+def target_key(target):
+    return target if isinstance(target, str) else json.dumps(target, sort_keys=True)
+
+
+class CaddyConfigCompiler:
+    """
+    Renders the Caddy config for a {domain: target} mapping.
+
+    Each route or site block is rendered once and cached per domain until its target changes,
+    and the output is assembled with a single join. The content hash of the
+    result tells callers whether the file write and the reload can be
+    skipped. `fmt` is 'json' (Caddy's native config, loaded without an
+    adapter) or 'caddyfile'.
+    """
+
+    def __init__(self, admin_address, fmt='json'):
+        self.admin_address = admin_address
+        self.fmt = fmt
+        # domain -> (target key, sort key, rendered fragment)
+        self.entries = {}
+        self.last_hash = None
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @property
+    def filename(self):
+        return 'caddy.json' if self.fmt == 'json' else 'Caddyfile'
+
+    def render_route(self, pattern, target):
+        host, path = split_pattern(pattern)
+        upstreams, policy, key = parse_target(target)
+        dials = [parse_upstream(upstream) for upstream in upstreams]
+        handler = {'handler': 'reverse_proxy', 'upstreams': [{'dial': dial} for dial, _ in dials]}
+        if len(dials) > 1:
+            handler['load_balancing'] = {'selection_policy': selection_policy(policy, key)}
+            handler['health_checks'] = {'passive': {
+                'fail_duration': FAIL_DURATION, 'max_fails': MAX_FAILS, 'unhealthy_status': UNHEALTHY_STATUS,
+            }}
+        # One transport per handler, so TLS follows the first upstream
+        if dials[0][1]:
+            handler['transport'] = {'protocol': 'http', 'tls': {}}
+        elif upstreams[0].startswith('h2c://'):
+            handler['transport'] = {'protocol': 'http', 'versions': ['h2c', '2']}
+        if host.startswith('.'):
+            # Caddy host wildcards cover a single label, so deeper names are left to the Python proxy
+            hosts = [host[1:], '*' + host]
+        else:
+            hosts = [host]
+        match = {'host': hosts}
+        if path:
+            match['path'] = [path, path + '/*']
+        return {'@id': route_id(pattern), 'match': [match], 'handle': [handler], 'terminal': True}
+
+    def render_site_block(self, domain, target):
+        upstreams, policy, key = parse_target(target)
+        if len(upstreams) == 1:
+            return f"""
+{domain} {{
+    tls internal
+    reverse_proxy {upstreams[0]}
+}}
+"""
+        policy_args = {'random_choose': ' 2', 'header': f' {key}', 'cookie': f' {key}'}.get(policy, '')
+        return f"""
+{domain} {{
+    tls internal
+    reverse_proxy {' '.join(upstreams)} {{
+        lb_policy {policy}{policy_args}
+        fail_duration {FAIL_DURATION}
+        max_fails {MAX_FAILS}
+        unhealthy_status {' '.join(str(status) for status in UNHEALTHY_STATUS)}
+    }}
+}}
+"""
+
+    def _entry(self, domain, target, entries):
+        key = target if isinstance(target, str) else target_key(target)
+        entry = self.entries.get(domain)
+        if entry is None or entry[0] != key:
+            self.stats['misses'] += 1
+            if self.fmt == 'json':
+                fragment = json.dumps(self.render_route(domain, target), separators=(',', ':'))
+            else:
+                fragment = self.render_site_block(domain, target)
+            entry = (key, route_sort_key(domain), fragment)
+        else:
+            self.stats['hits'] += 1
+        entries[domain] = entry
+        return entry
+
+    def render(self, domains):
+        """Return (content, sha256) for `domains`."""
+        entries = {}
+        rendered = [self._entry(domain, target, entries) for domain, target in domains.items()]
+        # Only keep entries for the current domains so the cache cannot grow without bound
+        self.entries = entries
+
+        if self.fmt == 'json':
+            rendered.sort(key=itemgetter(1))
+            admin = json.dumps({'listen': self.admin_address})
+            parts = [
+                '{"admin":', admin,
+                # per_host labels Caddy's metrics by host so the GUI can show latency per domain
+                ',"apps":{"http":{"metrics":{"per_host":true},"servers":{"', SERVER_NAME, '":{"listen":[":443"],"routes":[',
+                ','.join([entry[2] for entry in rendered]),
+                ']}}},"tls":{"automation":{"policies":[{"issuers":[{"module":"internal"}]}]}}}}\n',
+            ]
+        else:
+            parts = [f"""
+{{
+    admin {self.admin_address}
+    local_certs
+    metrics {{
+        per_host
+    }}
+}}
+"""]
+            parts.extend(entry[2] for entry in rendered)
+
+        content = ''.join(parts)
+        return content, hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def write(self, path, content, content_hash):
+        """Write `content` unless the file already holds exactly this hash; returns True if written."""
+        if self.last_hash is None and os.path.exists(path):
+            # First write this session: the file may already be up to date from the last run
+            with open(path, 'rb') as f:
+                self.last_hash = hashlib.sha256(f.read()).hexdigest()
+        if content_hash == self.last_hash and os.path.exists(path):
+            return False
+        atomic_write(path, content)
+        self.last_hash = content_hash
+        return True
+
+    def route_patches(self, old_domains, new_domains):
+        """
+        Admin API requests that turn `old_domains` into `new_domains` in
+        place, or None if a full load is needed. Added routes would change
+        route order, so only removals and target changes are patched.
+        """
+        if set(new_domains) - set(old_domains):
+            return None
+        patches = []
+        for domain in old_domains:
+            if domain not in new_domains:
+                patches.append(('DELETE', f'/id/{route_id(domain)}', None))
+            elif target_key(old_domains[domain]) != target_key(new_domains[domain]):
+                patches.append(('PATCH', f'/id/{route_id(domain)}', self.render_route(domain, new_domains[domain])))
+        return patches
@@ -0,0 +1,475 @@
+import hashlib
+import json
+import os
+import platform
+import shutil
+import tarfile
+import threading
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from utils import atomic_write, read_install_record
+
+CADDY_RELEASES_API = 'https://api.github.com/repos/caddyserver/caddy/releases'
+CADDY_RELEASES_URL = 'https://github.com/caddyserver/caddy/releases/download'
+
+# platform.system() names mapped to the OS names in Caddy's release archives
+CADDY_OS_NAMES = {
+    'darwin': 'mac',
+    'linux': 'linux',
+    'windows': 'windows',
+}
+
+# platform.machine() names mapped to the arch names in Caddy's release archives
+CADDY_ARCH_ALIASES = {
+    'x86_64': 'amd64',
+    'amd64': 'amd64',
+    'aarch64': 'arm64',
+    'arm64': 'arm64',
+    'armv7l': 'armv7',
+}
+
+# Checksum algorithms by hex digest length
+DIGEST_ALGORITHMS = {64: 'sha256', 128: 'sha512'}
+
+CaddyRelease = namedtuple('CaddyRelease', ['version', 'archive_name', 'archive_url', 'checksums_url', 'cache_key'])
+
+
+class DownloadError(Exception):
+    pass
+
+
+def resolve_caddy_version(version, session, timeout=30, releases_api=CADDY_RELEASES_API):
+    """'2.8.4' for 'v2.8.4' or '2.8.4'; 'latest' is looked up on GitHub."""
+    if version != 'latest':
+        return version.lstrip('v')
+    try:
+        response = session.get(f'{releases_api}/latest', timeout=timeout,
+                               headers={'Accept': 'application/vnd.github+json'})
+        response.raise_for_status()
+        return response.json()['tag_name'].lstrip('v')
+    except (requests.RequestException, ValueError, KeyError) as e:
+        raise DownloadError(f"Failed to look up the latest Caddy release: {str(e)}")
+
+
+def caddy_release(version, releases_url=CADDY_RELEASES_URL):
+    """The release archive and checksums file of a resolved `version` for this platform."""
+    system = platform.system().lower()
+    machine = platform.machine().lower()
+    arch = CADDY_ARCH_ALIASES.get(machine, machine)
+
+    if system not in CADDY_OS_NAMES:
+        raise DownloadError(f"Unsupported operating system: {system}")
+
+    extension = 'zip' if system == 'windows' else 'tar.gz'
+    archive_name = f'caddy_{version}_{CADDY_OS_NAMES[system]}_{arch}.{extension}'
+    return CaddyRelease(
+        version,
+        archive_name,
+        f'{releases_url}/v{version}/{archive_name}',
+        f'{releases_url}/v{version}/caddy_{version}_checksums.txt',
+        f'{version}-{system}-{arch}',
+    )
+
+
+def parse_checksums(text):
+    """{file name: hex digest} from a '<digest>  <file name>' checksums file."""
+    checksums = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            checksums[parts[1].lstrip('*')] = parts[0].lower()
+    return checksums
+
+
+def fetch_checksums(url, session, timeout=30):
+    try:
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        raise DownloadError(f"Failed to download {url}: {str(e)}")
+    return parse_checksums(response.text)
+
+
+def extract_binary(archive_path, dest_path):
+    """Extract the executable named like `dest_path` from a .tar.gz or .zip release archive."""
+    name = os.path.basename(dest_path)
+    tmp_path = dest_path + '.tmp'
+    try:
+        if archive_path.endswith('.zip'):
+            with zipfile.ZipFile(archive_path) as archive, archive.open(name) as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            with tarfile.open(archive_path, 'r:gz') as archive:
+                src = archive.extractfile(name)
+                if src is None:
+                    raise KeyError(name)
+                with src, open(tmp_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+    except (KeyError, tarfile.TarError, zipfile.BadZipFile) as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise DownloadError(f"No {name} in {os.path.basename(archive_path)}: {str(e)}")
+    os.chmod(tmp_path, 0o755)
+    os.replace(tmp_path, dest_path)
+
+
+def file_digests(path, algorithms, chunk_size=1024 * 1024):
+    """{algorithm: hex digest} for every algorithm, reading the file once."""
+    digests = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            for digest in digests.values():
+                digest.update(chunk)
+    return {algorithm: digest.hexdigest() for algorithm, digest in digests.items()}
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    return file_digests(path, ('sha256',), chunk_size)['sha256']
+
+
+class BinaryFetcher:
+    """
+    Downloads a file into `<dest>.part` and moves it into place once it is
+    complete and matches `checksum`, a SHA-256 or SHA-512 hex digest.
+
+    - Interrupted downloads resume from the size of the .part file using an
+      HTTP Range request with If-Range, so they only continue the same
+      file. The ETag or Last-Modified it was started with is kept in
+      `<dest>.part.meta`; a part without one, or from a file that has
+      changed since, is thrown away and fetched again.
+    - With `segments` > 1, and a server that reports a size and accepts
+      ranges, the file is fetched as parallel ranged segments
+      (`<dest>.part.N`). Each segment resumes on its own.
+    - `progress_callback(downloaded, total)` is called at most once per
+      `progress_interval` seconds; `total` is None when the server sends no
+      Content-Length.
+    """
+
+    def __init__(self, url, dest_path, chunk_size=1024 * 1024, segments=1, checksum=None,
+                 progress_callback=None, progress_interval=0.2, timeout=30, session=None):
+        self.url = url
+        self.dest_path = dest_path
+        self.part_path = dest_path + '.part'
+        self.meta_path = self.part_path + '.meta'
+        self.chunk_size = chunk_size
+        self.segments = max(1, segments)
+        self.checksum = checksum.lower() if checksum else None
+        self.checksum_algorithm = DIGEST_ALGORITHMS.get(len(self.checksum)) if self.checksum else None
+        if self.checksum and self.checksum_algorithm is None:
+            raise ValueError(f"Not a SHA-256 or SHA-512 digest: {checksum}")
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.downloaded = 0
+        self.total = None
+        self.validator = None
+        self.progress_lock = threading.Lock()
+        self.last_progress = 0.0
+
+    def fetch(self):
+        """Download the file and return (dest_path, sha256)."""
+        try:
+            total, accepts_ranges, validator = self._probe()
+            self.total = total
+            self.validator = validator
+            self._check_partial(total, validator)
+            if self.segments > 1 and total and accepts_ranges:
+                self._fetch_segments(total)
+            else:
+                self._fetch_single(accepts_ranges)
+        except requests.RequestException as e:
+            raise DownloadError(f"Failed to download {self.url}: {str(e)}")
+
+        algorithms = {'sha256', self.checksum_algorithm} if self.checksum else {'sha256'}
+        digests = file_digests(self.part_path, algorithms)
+        if self.checksum and digests[self.checksum_algorithm] != self.checksum:
+            self._discard_partial()
+            raise DownloadError(f"Checksum mismatch for {self.url}: expected {self.checksum}, "
+                                f"got {digests[self.checksum_algorithm]}")
+
+        os.replace(self.part_path, self.dest_path)
+        self._remove(self.meta_path)
+        self._report(force=True)
+        return self.dest_path, digests['sha256']
+
+    def _probe(self):
+        response = self.session.head(self.url, allow_redirects=True, timeout=self.timeout)
+        if response.status_code >= 400:
+            # Some servers do not implement HEAD; fall back to one plain GET of the whole file
+            return None, False, None
+        length = response.headers.get('Content-Length')
+        total = int(length) if length and length.isdigit() and int(length) > 0 else None
+        accepts_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        # Download from the final location so ranged requests skip the redirect
+        self.url = response.url
+        return total, accepts_ranges, self._validator(response.headers)
+
+    @staticmethod
+    def _validator(headers):
+        """A value for If-Range: a strong ETag, else Last-Modified, else None."""
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return headers.get('Last-Modified')
+
+    @staticmethod
+    def _remove(path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _partial_paths(self):
+        directory = os.path.dirname(self.part_path) or '.'
+        prefix = os.path.basename(self.part_path) + '.'
+        return [self.part_path] + [os.path.join(directory, name) for name in os.listdir(directory)
+                                   if name.startswith(prefix) and name[len(prefix):].isdigit()]
+
+    def _discard_partial(self):
+        for path in self._partial_paths():
+            self._remove(path)
+        self._remove(self.meta_path)
+
+    def _check_partial(self, total, validator):
+        """Keep partial data only if it was started on the same file, then record what this download is."""
+        try:
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            meta = None
+        if validator is None or meta != {'validator': validator, 'total': total}:
+            self._discard_partial()
+        atomic_write(self.meta_path, json.dumps({'validator': validator, 'total': total}))
+
+    def _report(self, force=False):
+        if self.progress_callback is None:
+            return
+        now = time.monotonic()
+        with self.progress_lock:
+            if not force and now - self.last_progress < self.progress_interval:
+                return
+            self.last_progress = now
+            downloaded = self.downloaded
+        self.progress_callback(downloaded, self.total)
+
+    def _add_progress(self, size):
+        with self.progress_lock:
+            self.downloaded += size
+        self._report()
+
+    def _fetch_single(self, accepts_ranges):
+        existing = os.path.getsize(self.part_path) if os.path.exists(self.part_path) else 0
+        if self.total is not None and existing > self.total:
+            existing = 0
+        if self.total is not None and existing == self.total:
+            self.downloaded = existing
+            return
+
+        headers = {'Accept-Encoding': 'identity'}
+        if existing and accepts_ranges and self.validator:
+            # A changed file comes back whole with a 200 and replaces the part
+            headers['Range'] = f'bytes={existing}-'
+            headers['If-Range'] = self.validator
+        with self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416 and existing:
+                # Nothing left to fetch
+                self.downloaded = existing
+                return
+            response.raise_for_status()
+
+            mode = 'ab' if response.status_code == 206 else 'wb'
+            self.downloaded = existing if mode == 'ab' else 0
+            if self.total is None:
+                length = response.headers.get('Content-Length')
+                if length and length.isdigit():
+                    self.total = self.downloaded + int(length)
+
+            with open(self.part_path, mode) as f:
+                for chunk in response.iter_content(self.chunk_size):
+                    f.write(chunk)
+                    self._add_progress(len(chunk))
+
+    def _segment_ranges(self, total):
+        size = -(-total // self.segments)
+        return [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+    def _fetch_segment(self, index, start, end):
+        path = f'{self.part_path}.{index}'
+        existing = os.path.getsize(path) if os.path.exists(path) else 0
+        expected = end - start + 1
+        if existing >= expected:
+            return path
+
+        headers = {'Accept-Encoding': 'identity', 'Range': f'bytes={start + existing}-{end}'}
+        if self.validator:
+            headers['If-Range'] = self.validator
+        with self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise DownloadError(f"Server ignored the range request for segment {index}, "
+                                    f"or the file changed during the download")
+            with open(path, 'ab') as f:
+                for chunk in response.iter_content(self.chunk_size):
+                    f.write(chunk)
+                    self._add_progress(len(chunk))
+
+        if os.path.getsize(path) != expected:
+            raise DownloadError(f"Segment {index} is incomplete")
+        return path
+
+    def _fetch_segments(self, total):
+        ranges = self._segment_ranges(total)
+        self.downloaded = sum(
+            min(os.path.getsize(f'{self.part_path}.{i}'), end - start + 1)
+            for i, (start, end) in enumerate(ranges)
+            if os.path.exists(f'{self.part_path}.{i}')
+        )
+        with ThreadPoolExecutor(max_workers=self.segments) as executor:
+            futures = [executor.submit(self._fetch_segment, i, start, end) for i, (start, end) in enumerate(ranges)]
+            try:
+                paths = [future.result() for future in futures]
+            except DownloadError:
+                # Segments that may belong to different versions of the file cannot be joined
+                executor.shutdown(wait=True)
+                self._discard_partial()
+                raise
+
+        with open(self.part_path, 'wb') as out:
+            for path in paths:
+                with open(path, 'rb') as segment:
+                    shutil.copyfileobj(segment, out, self.chunk_size)
+        for path in paths:
+            os.remove(path)
+
+
+class BinaryCache:
+    """
+    Content-addressed store of downloaded binaries. Each file is stored
+    once under `objects/<sha256>`, and `index.json` maps keys such as
+    '2.8.4-darwin-arm64' to the hash. Reinstalling or switching back to a
+    version does not touch the network.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def lookup(self, key, verify=True):
+        sha256 = self._load_index().get(key)
+        if not sha256:
+            return None
+        path = os.path.join(self.objects_dir, sha256)
+        if not os.path.exists(path):
+            return None
+        if verify and file_sha256(path) != sha256:
+            os.remove(path)
+            return None
+        return path
+
+    def store(self, key, path, sha256=None):
+        sha256 = sha256 or file_sha256(path)
+        object_path = os.path.join(self.objects_dir, sha256)
+        if not os.path.exists(object_path):
+            shutil.copyfile(path, object_path + '.tmp')
+            os.replace(object_path + '.tmp', object_path)
+        index = self._load_index()
+        index[key] = sha256
+        self._save_index(index)
+        return object_path
+
+    def install(self, key, dest_path):
+        """Copy the cached binary for `key` to `dest_path`; returns False on a cache miss."""
+        path = self.lookup(key)
+        if path is None:
+            return False
+        shutil.copyfile(path, dest_path + '.tmp')
+        os.chmod(dest_path + '.tmp', 0o755)
+        os.replace(dest_path + '.tmp', dest_path)
+        return True
+
+
+class CaddyInstaller:
+    """
+    Installs a Caddy release at `dest_path` from its GitHub release
+    archive, verified against the release's checksums file. `version` is
+    a release such as '2.8.4', or 'latest' for the newest one.
+
+    Binaries are kept in a BinaryCache under `cache_dir` keyed by the
+    resolved version, and `<dest_path>.json` records what is installed
+    (see utils.binary_is_current), so changing `version` installs the
+    right binary and 'latest' picks up new releases. `releases_api` and
+    `releases_url` point at GitHub unless given, e.g. a mirror.
+    """
+
+    def __init__(self, dest_path, cache_dir, version='latest', segments=4, progress_callback=None,
+                 timeout=30, session=None, releases_api=CADDY_RELEASES_API, releases_url=CADDY_RELEASES_URL):
+        self.dest_path = dest_path
+        self.releases_api = releases_api.rstrip('/')
+        self.releases_url = releases_url.rstrip('/')
+        self.cache = BinaryCache(cache_dir)
+        self.version = version
+        self.segments = segments
+        self.progress_callback = progress_callback
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def install(self):
+        """Install the requested version unless it is already in place; returns the installed version."""
+        record = read_install_record(self.dest_path)
+        installed = record.get('version') if record and os.path.exists(self.dest_path) else None
+        try:
+            version = resolve_caddy_version(self.version, self.session, self.timeout, self.releases_api)
+        except DownloadError as e:
+            if installed is None:
+                raise
+            # Offline: keep the binary we have; the record is not refreshed, so the next start asks again
+            print(f"{str(e)}; using the installed Caddy {installed}")
+            return installed
+
+        if version != installed:
+            release = caddy_release(version, self.releases_url)
+            if not self.cache.install(release.cache_key, self.dest_path):
+                self.download(release)
+        atomic_write(self.dest_path + '.json', json.dumps({
+            'version': version,
+            'requested': self.version,
+            'checked': time.time(),
+        }))
+        return version
+
+    def download(self, release):
+        checksums = fetch_checksums(release.checksums_url, self.session, self.timeout)
+        checksum = checksums.get(release.archive_name)
+        if checksum is None:
+            raise DownloadError(f"{release.archive_name} is not listed in {release.checksums_url}")
+
+        downloads_dir = os.path.join(self.cache.cache_dir, 'downloads')
+        os.makedirs(downloads_dir, exist_ok=True)
+        archive_path = os.path.join(downloads_dir, release.archive_name)
+        BinaryFetcher(release.archive_url, archive_path, segments=self.segments, checksum=checksum,
+                      progress_callback=self.progress_callback, timeout=self.timeout,
+                      session=self.session).fetch()
+        try:
+            extract_binary(archive_path, self.dest_path)
+        finally:
+            os.remove(archive_path)
+        self.cache.store(release.cache_key, self.dest_path)
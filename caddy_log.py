@@ -0,0 +1,231 @@
+import json
+import os
+import selectors
+import threading
+import time
+from collections import deque, namedtuple
+
+LogRecord = namedtuple('LogRecord', ['seq', 'ts', 'level', 'logger', 'host', 'message', 'stream', 'fields'])
+
+LEVELS = ('debug', 'info', 'warn', 'error', 'panic', 'fatal')
+
+
+def parse_log_line(line, stream, seq):
+    """Turn one line of Caddy output into a LogRecord; Caddy logs JSON objects by default."""
+    line = line.strip()
+    fields = None
+    if line.startswith('{'):
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            fields = None
+
+    if not isinstance(fields, dict):
+        level = 'error' if stream == 'stderr' and 'error' in line.lower() else 'info'
+        return LogRecord(seq, time.time(), level, '', '', line, stream, {})
+
+    request = fields.get('request')
+    host = fields.get('host') or (request.get('host', '') if isinstance(request, dict) else '')
+    return LogRecord(
+        seq,
+        fields.get('ts', time.time()),
+        str(fields.get('level', 'info')).lower(),
+        fields.get('logger', ''),
+        host,
+        fields.get('msg', line),
+        stream,
+        fields,
+    )
+
+
+def format_record(record):
+    parts = [record.level.upper()]
+    if record.logger:
+        parts.append(record.logger)
+    if record.host:
+        parts.append(record.host)
+    return f"{' '.join(parts)}: {record.message}"
+
+
+class LogRingBuffer:
+    """
+    Fixed-size buffer of LogRecords with secondary indexes by level, logger
+    and host. Evicting the oldest record also drops it from the indexes, so
+    memory stays flat however long Caddy runs.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.records = deque(maxlen=capacity)
+        self.indexes = {'level': {}, 'logger': {}, 'host': {}}
+        self.lock = threading.Lock()
+
+    def append(self, record):
+        with self.lock:
+            if len(self.records) == self.capacity:
+                self._unindex(self.records[0])
+            self.records.append(record)
+            for name, index in self.indexes.items():
+                key = getattr(record, name)
+                if key:
+                    index.setdefault(key, deque()).append(record.seq)
+
+    def _unindex(self, record):
+        for name, index in self.indexes.items():
+            key = getattr(record, name)
+            if key:
+                seqs = index[key]
+                seqs.popleft()
+                if not seqs:
+                    del index[key]
+
+    def _get(self, seq):
+        return self.records[seq - self.records[0].seq]
+
+    def query(self, level=None, logger=None, host=None, limit=None):
+        """Return matching records, oldest first, using the smallest index available."""
+        with self.lock:
+            if not self.records:
+                return []
+            filters = {'level': level, 'logger': logger, 'host': host}
+            selected = None
+            for name, value in filters.items():
+                if value is None:
+                    continue
+                seqs = self.indexes[name].get(value)
+                if not seqs:
+                    return []
+                if selected is None or len(seqs) < len(selected):
+                    selected = seqs
+
+            candidates = (self._get(seq) for seq in selected) if selected is not None else iter(self.records)
+            result = [
+                record for record in candidates
+                if all(value is None or getattr(record, name) == value for name, value in filters.items())
+            ]
+        return result[-limit:] if limit else result
+
+    def tail(self, count):
+        with self.lock:
+            return list(self.records)[-count:]
+
+    def __len__(self):
+        return len(self.records)
+
+
+class CaddyLogPipeline:
+    """
+    Reads a process's stdout and stderr concurrently, parses each line into a
+    LogRecord, stores it in a LogRingBuffer and hands records to subscribers
+    in batches (every `batch_interval` seconds or `batch_size` records).
+
+    On POSIX both pipes are multiplexed on one thread with selectors; on
+    Windows, where pipes cannot be selected, each pipe gets its own thread.
+    """
+
+    def __init__(self, process, capacity=10000, batch_interval=0.1, batch_size=500):
+        self.process = process
+        self.buffer = LogRingBuffer(capacity)
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self.subscribers = []
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self.seq = 0
+        self.threads = []
+        self.stopped = threading.Event()
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def start(self):
+        streams = [(self.process.stdout, 'stdout'), (self.process.stderr, 'stderr')]
+        streams = [(pipe, name) for pipe, name in streams if pipe is not None]
+        if os.name == 'nt':
+            for pipe, name in streams:
+                self.threads.append(threading.Thread(target=self._read_pipe, args=(pipe, name), daemon=True))
+            self.threads.append(threading.Thread(target=self._flush_periodically, daemon=True))
+        else:
+            self.threads.append(threading.Thread(target=self._read_selector, args=(streams,), daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=5):
+        """
+        Let the readers drain the pipes to EOF, which comes promptly once
+        the process has exited; they are only cut off after `timeout`.
+        """
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        if any(thread.is_alive() for thread in self.threads):
+            self.stopped.set()
+            for thread in self.threads:
+                thread.join(timeout=1)
+        self.flush()
+
+    def _emit_line(self, raw, stream):
+        line = raw.decode('utf-8', errors='replace')
+        if not line.strip():
+            return
+        with self.pending_lock:
+            self.seq += 1
+            record = parse_log_line(line, stream, self.seq)
+            self.buffer.append(record)
+            self.pending.append(record)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.pending_lock:
+            batch, self.pending = self.pending, []
+        if batch:
+            for callback in self.subscribers:
+                callback(batch)
+
+    def _read_selector(self, streams):
+        selector = selectors.DefaultSelector()
+        partial = {}
+        for pipe, name in streams:
+            selector.register(pipe.fileno(), selectors.EVENT_READ, name)
+            partial[pipe.fileno()] = b''
+
+        last_flush = time.monotonic()
+        try:
+            while partial and not self.stopped.is_set():
+                for key, _ in selector.select(timeout=self.batch_interval):
+                    fd = key.fd
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        # EOF: emit any unterminated last line and stop watching this pipe
+                        if partial[fd]:
+                            self._emit_line(partial[fd], key.data)
+                        selector.unregister(fd)
+                        del partial[fd]
+                        continue
+                    lines = (partial[fd] + chunk).split(b'\n')
+                    partial[fd] = lines.pop()
+                    for line in lines:
+                        self._emit_line(line, key.data)
+
+                now = time.monotonic()
+                if now - last_flush >= self.batch_interval:
+                    self.flush()
+                    last_flush = now
+        finally:
+            selector.close()
+            self.flush()
+
+    def _read_pipe(self, pipe, name):
+        for line in iter(pipe.readline, b''):
+            if self.stopped.is_set():
+                break
+            self._emit_line(line, name)
+
+    def _flush_periodically(self):
+        while not self.stopped.wait(self.batch_interval):
+            self.flush()
+            if not any(thread.is_alive() for thread in self.threads[:-1]):
+                break
+        self.flush()
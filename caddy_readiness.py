@@ -0,0 +1,50 @@
+import socket
+import time
+
+READY_LOG_MARKER = 'serving initial configuration'
+
+
+class CaddyStartupError(Exception):
+    pass
+
+
+def port_is_open(host, port, timeout=0.2):
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def wait_until_ready(process, ports, host='127.0.0.1', deadline=15.0, initial_delay=0.02,
+                     max_delay=0.5, ready_event=None, cancel_event=None):
+    """
+    Block until Caddy is ready and return the time it took in seconds.
+
+    Caddy counts as ready once all `ports` accept connections, or as soon as
+    `ready_event` is set (the log reader sets it when it sees Caddy's
+    "serving initial configuration" line). Checks back off exponentially
+    from `initial_delay` to `max_delay`. Raises CaddyStartupError if the
+    process exits, the probe is cancelled or `deadline` seconds pass.
+    """
+    start = time.monotonic()
+    delay = initial_delay
+    while True:
+        if process.poll() is not None:
+            raise CaddyStartupError(f"Caddy exited during startup with code {process.returncode}")
+        if ready_event is not None and ready_event.is_set():
+            return time.monotonic() - start
+        if all(port_is_open(host, port) for port in ports):
+            return time.monotonic() - start
+
+        elapsed = time.monotonic() - start
+        if elapsed >= deadline:
+            raise CaddyStartupError(f"Caddy did not become ready within {deadline:.0f} s")
+
+        wait = min(delay, deadline - elapsed)
+        if cancel_event is not None:
+            if cancel_event.wait(wait):
+                raise CaddyStartupError("Caddy startup probe was cancelled")
+        else:
+            time.sleep(wait)
+        delay = min(delay * 2, max_delay)
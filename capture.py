@@ -0,0 +1,225 @@
+import base64
+import glob
+import json
+import mmap
+import os
+import threading
+import time
+from collections import deque
+from json.encoder import encode_basestring_ascii as quote
+
+FORMAT_VERSION = 1
+SEGMENT_PATTERN = 'capture-*.jsonl'
+# Credentials are written as REDACTED unless the capture is told to keep them
+REDACTED_HEADERS = frozenset(['authorization', 'proxy-authorization', 'cookie', 'set-cookie'])
+REDACTED = 'REDACTED'
+
+
+class BodySample:
+    """The first `limit` bytes of a request and its response body, kept while they stream through."""
+
+    __slots__ = ('limit', 'request', 'response')
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.request = bytearray()
+        self.response = bytearray()
+
+    def take_request(self, chunk):
+        if len(self.request) < self.limit:
+            self.request += chunk[:self.limit - len(self.request)]
+
+    def take_response(self, chunk):
+        if len(self.response) < self.limit:
+            self.response += chunk[:self.limit - len(self.response)]
+
+
+def header_block(headers, redact=False):
+    """'Name: value' lines joined by CRLF, from a headers mapping or aiohttp's raw (bytes, bytes) pairs."""
+    if headers is None:
+        return ''
+    if hasattr(headers, 'items'):
+        block = '\r\n'.join(map(': '.join, headers.items()))
+    else:
+        block = b'\r\n'.join(map(b': '.join, headers)).decode('latin-1')
+    if redact:
+        block = redact_block(block)
+    return block
+
+
+def redact_block(block):
+    lower = block.lower()
+    # Most blocks carry no credentials; only those that might are split into lines
+    if 'cookie' not in lower and 'authorization' not in lower:
+        return block
+    lines = block.split('\r\n')
+    for index, line in enumerate(lines):
+        name = line.partition(':')[0]
+        if name.lower() in REDACTED_HEADERS:
+            lines[index] = f'{name}: {REDACTED}'
+    return '\r\n'.join(lines)
+
+
+def parse_header_block(block):
+    """[(name, value)] from a header_block string."""
+    return [tuple(line.split(': ', 1)) for line in block.split('\r\n') if line]
+
+
+def encode_body(data, total):
+    if not total:
+        return 'null'
+    return f'{{"data":"{base64.b64encode(data).decode("ascii")}","truncated":{"true" if len(data) < total else "false"}}}'
+
+
+class TrafficCapture:
+    """
+    Records proxied requests to segmented JSONL files in `directory`.
+
+    `record` runs on the proxy loop and only appends a tuple to a queue
+    holding references to the request's and response's headers; a writer
+    thread turns queued records into JSON lines every `flush_interval`
+    seconds and appends them with one write per batch. A segment is
+    closed after `segment_bytes`, and with `max_segments` the oldest of
+    this process's segments are deleted. With `body_limit` the first that
+    many bytes of each body are kept as well. When the writer falls more
+    than `queue_limit` records behind, new records are dropped and counted
+    rather than slowing the proxy down.
+
+    `ts` is when the response completed, the order records are queued
+    in, so every segment is sorted by it. Authorization, Cookie and
+    Set-Cookie values are replaced with REDACTED unless `keep_credentials`.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, max_segments=None, body_limit=0,
+                 flush_interval=0.5, queue_limit=100000, keep_credentials=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.body_limit = body_limit
+        self.flush_interval = flush_interval
+        self.queue_limit = queue_limit
+        self.redact = not keep_credentials
+        os.makedirs(directory, exist_ok=True)
+        # Worker processes capture side by side; the pid keeps their segments apart
+        self.prefix = f'capture-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}'
+        self.pending = deque()
+        self.segments = []
+        self.file = None
+        self.segment_size = 0
+        self.counters = {'records': 0, 'dropped': 0, 'bytes': 0, 'segments': 0, 'deleted': 0}
+        self.stopping = threading.Event()
+        self.writer = threading.Thread(target=self.run, name='traffic-capture', daemon=True)
+        self.writer.start()
+
+    def sample(self):
+        """A BodySample for one request when bodies are captured, else None."""
+        return BodySample(self.body_limit) if self.body_limit else None
+
+    def record(self, request, route, upstream, status, response, bytes_in, bytes_out, duration, sample=None):
+        if len(self.pending) >= self.queue_limit:
+            self.counters['dropped'] += 1
+            return
+        self.pending.append((
+            time.time(), request.method, request.host, request.path_qs,
+            getattr(request, 'raw_headers', None) or request.headers, status,
+            response.headers if response is not None else None,
+            duration, bytes_in, bytes_out, route, upstream, sample,
+        ))
+
+    def format(self, entry):
+        """One JSON line, built directly rather than through a dict since the writer does this for every request."""
+        (ts, method, host, path, request_headers, status, response_headers,
+         duration, bytes_in, bytes_out, route, upstream, sample) = entry
+        redact = self.redact
+        line = (f'{{"ts":{ts:.6f},"method":{quote(method)},"host":{quote(host)},"path":{quote(path)},'
+                f'"status":{status},"duration_ms":{duration * 1000:.3f},"bytes_in":{bytes_in},'
+                f'"bytes_out":{bytes_out},"route":{quote(route)},"upstream":{quote(upstream)},'
+                f'"request_headers":{quote(header_block(request_headers, redact))},'
+                f'"response_headers":{quote(header_block(response_headers, redact))}')
+        if sample is not None:
+            line += (f',"request_body":{encode_body(sample.request, bytes_in)},'
+                     f'"response_body":{encode_body(sample.response, bytes_out)}')
+        return line + '}'
+
+    def open_segment(self):
+        path = os.path.join(self.directory, f'{self.prefix}-{self.counters["segments"]:06d}.jsonl')
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self.file = os.fdopen(fd, 'ab')
+        header = json.dumps({'capture': FORMAT_VERSION, 'pid': os.getpid(), 'started': time.time()}) + '\n'
+        self.file.write(header.encode())
+        self.segment_size = len(header)
+        self.segments.append(path)
+        self.counters['segments'] += 1
+        while self.max_segments and len(self.segments) > self.max_segments:
+            try:
+                os.remove(self.segments.pop(0))
+            except OSError:
+                pass
+            self.counters['deleted'] += 1
+
+    def flush(self):
+        lines = []
+        pending = self.pending
+        while pending:
+            lines.append(self.format(pending.popleft()))
+        if not lines:
+            return
+        if self.file is None:
+            self.open_segment()
+        data = ('\n'.join(lines) + '\n').encode()
+        self.file.write(data)
+        self.file.flush()
+        self.segment_size += len(data)
+        self.counters['records'] += len(lines)
+        self.counters['bytes'] += len(data)
+        if self.segment_size >= self.segment_bytes:
+            self.file.close()
+            self.file = None
+
+    def run(self):
+        while True:
+            stopping = self.stopping.wait(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Traffic capture write failed: {str(e)}")
+            if stopping:
+                return
+
+    def stats(self):
+        return dict(self.counters, queued=len(self.pending), directory=self.directory)
+
+    def close(self):
+        self.stopping.set()
+        self.writer.join()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def segment_paths(path):
+    """Capture segments in a directory, oldest first, or the single file given."""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, SEGMENT_PATTERN)))
+    return [path]
+
+
+def read_segment(path):
+    """Yield the records of one segment, read through mmap so large captures are not loaded into memory."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            position = 0
+            size = len(view)
+            while position < size:
+                end = view.find(b'\n', position)
+                if end == -1:
+                    # A line the writer has not finished yet
+                    return
+                line = view[position:end]
+                position = end + 1
+                if line:
+                    record = json.loads(line)
+                    if 'capture' not in record:
+                        yield record
@@ -0,0 +1,269 @@
+import datetime
+import ipaddress
+import os
+import shutil
+import ssl
+import threading
+from collections import OrderedDict
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+from route_table import normalize_host, split_pattern
+from utils import atomic_write, get_data_dir
+
+ROOT_NAME = 'Wild Caddy Local CA'
+ROOT_LIFETIME = datetime.timedelta(days=3650)
+# Clients reject server certificates valid for more than 398 days
+LEAF_LIFETIME = datetime.timedelta(days=397)
+RENEW_BEFORE = datetime.timedelta(days=30)
+# Served when a client sends no SNI, e.g. https://127.0.0.1/
+DEFAULT_NAMES = ('localhost', '127.0.0.1', '::1')
+
+
+def certificate_name(pattern):
+    """The certificate covering a route pattern: 'app.test', or '*.app.test' for wildcard and suffix routes."""
+    host, _ = split_pattern(pattern)
+    if host.startswith('.'):
+        return '*' + host
+    return host
+
+
+def wildcard_name(host):
+    """The wildcard certificate that would cover `host`, or None for single-label hosts and IPs."""
+    _, dot, parent = host.partition('.')
+    if not dot or '.' not in parent or is_ip(host):
+        return None
+    return '*.' + parent
+
+
+def is_ip(name):
+    try:
+        ipaddress.ip_address(name)
+    except ValueError:
+        return False
+    return True
+
+
+def subject_names(name):
+    """SANs for a certificate name; a wildcard certificate also covers its base domain."""
+    names = [name]
+    if name.startswith('*.'):
+        names.append(name[2:])
+    return names
+
+
+def file_name(name):
+    return name.replace('*', '_wildcard').replace(':', '_') + '.pem'
+
+
+def private_key_pem(key):
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption())
+
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class LocalCA:
+    """
+    A root certificate and key kept under `directory`, created on first use,
+    that signs the proxy's leaf certificates. Add root.crt to the system
+    trust store once to make browsers accept every domain.
+    """
+
+    def __init__(self, directory):
+        self.cert_path = os.path.join(directory, 'root.crt')
+        self.key_path = os.path.join(directory, 'root.key')
+        self.created = False
+        if os.path.exists(self.cert_path) and os.path.exists(self.key_path):
+            with open(self.key_path, 'rb') as f:
+                self.key = serialization.load_pem_private_key(f.read(), None)
+            with open(self.cert_path, 'rb') as f:
+                self.cert = x509.load_pem_x509_certificate(f.read())
+        else:
+            self.create()
+
+    def create(self):
+        self.key = ec.generate_private_key(ec.SECP256R1())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, ROOT_NAME),
+                          x509.NameAttribute(NameOID.ORGANIZATION_NAME, 'Wild Caddy')])
+        start = now() - datetime.timedelta(days=1)
+        public_key = self.key.public_key()
+        self.cert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(public_key)
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(start)
+            .not_valid_after(start + ROOT_LIFETIME)
+            .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+            .add_extension(x509.KeyUsage(digital_signature=True, key_cert_sign=True, crl_sign=True,
+                                         content_commitment=False, key_encipherment=False,
+                                         data_encipherment=False, key_agreement=False,
+                                         encipher_only=False, decipher_only=False), critical=True)
+            .add_extension(x509.SubjectKeyIdentifier.from_public_key(public_key), critical=False)
+            .sign(self.key, hashes.SHA256())
+        )
+        atomic_write(self.key_path, private_key_pem(self.key), 'wb', permissions=0o600)
+        atomic_write(self.cert_path, self.cert.public_bytes(serialization.Encoding.PEM), 'wb')
+        self.created = True
+        print(f"Created local certificate authority {self.cert_path}")
+
+    def issue(self, names):
+        """PEM of a new key and a certificate for `names`, then the root, as load_cert_chain expects."""
+        key = ec.generate_private_key(ec.SECP256R1())
+        sans = [x509.IPAddress(ipaddress.ip_address(name)) if is_ip(name) else x509.DNSName(name)
+                for name in names]
+        start = now() - datetime.timedelta(hours=1)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, names[0])]))
+            .issuer_name(self.cert.subject)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(start)
+            .not_valid_after(start + LEAF_LIFETIME)
+            .add_extension(x509.SubjectAlternativeName(sans), critical=False)
+            .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+            .add_extension(x509.KeyUsage(digital_signature=True, key_cert_sign=False, crl_sign=False,
+                                         content_commitment=False, key_encipherment=False,
+                                         data_encipherment=False, key_agreement=False,
+                                         encipher_only=False, decipher_only=False), critical=True)
+            .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]), critical=False)
+            .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(self.key.public_key()),
+                           critical=False)
+            .sign(self.key, hashes.SHA256())
+        )
+        return (private_key_pem(key) + cert.public_bytes(serialization.Encoding.PEM)
+                + self.cert.public_bytes(serialization.Encoding.PEM))
+
+
+class CertificateStore:
+    """
+    HTTPS certificates for the proxy's routes, signed by a LocalCA.
+
+    `ensure` issues a route's certificate when the route is added (one
+    wildcard certificate for '*.' and '.' routes), so no handshake waits
+    on key generation. Certificates are kept on disk under `directory` and
+    as ready SSLContexts in an LRU of `max_contexts` keyed by server name;
+    `server_context`'s SNI callback picks one with a dict lookup. Names
+    not issued yet are issued on first use if `allow(name)` is true.
+
+    Every handshake starts on `server_context`, whose session ticket keys
+    OpenSSL keeps using after the switch, so tickets issued for any domain
+    resume on the next connection and skip the certificate exchange.
+    """
+
+    def __init__(self, directory=None, max_contexts=256, allow=None):
+        self.directory = directory or os.path.join(get_data_dir(), 'tls')
+        self.certs_dir = os.path.join(self.directory, 'certs')
+        os.makedirs(self.directory, exist_ok=True)
+        self.ca = LocalCA(self.directory)
+        if self.ca.created and os.path.isdir(self.certs_dir):
+            # Signed by a root that no longer exists
+            shutil.rmtree(self.certs_dir)
+        os.makedirs(self.certs_dir, exist_ok=True)
+        self.max_contexts = max_contexts
+        self.allow = allow
+        self.alpn_protocols = None
+        # server name -> SSLContext, most recently used last
+        self.contexts = OrderedDict()
+        # certificate name -> SSLContext, so names under one wildcard share a context
+        self.loaded = {}
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'loaded': 0, 'issued': 0, 'evictions': 0, 'rejected': 0}
+        self.server_context = self.new_context(self.ensure_name('localhost', DEFAULT_NAMES))
+        self.server_context.sni_callback = self.sni_callback
+
+    def path(self, name):
+        return os.path.join(self.certs_dir, file_name(name))
+
+    def expires(self, path):
+        with open(path, 'rb') as f:
+            cert = x509.load_pem_x509_certificate(f.read())
+        return cert.not_valid_after_utc
+
+    def ensure(self, pattern):
+        """Issue the certificate for a route pattern unless a current one is on disk; returns its path."""
+        return self.ensure_name(certificate_name(pattern))
+
+    def ensure_name(self, name, names=None):
+        path = self.path(name)
+        with self.lock:
+            if os.path.exists(path) and self.expires(path) - now() > RENEW_BEFORE:
+                return path
+            atomic_write(path, self.ca.issue(names or subject_names(name)), 'wb', permissions=0o600)
+            self.counters['issued'] += 1
+            self.loaded.pop(name, None)
+        return path
+
+    def new_context(self, path):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.load_cert_chain(path)
+        if self.alpn_protocols:
+            context.set_alpn_protocols(self.alpn_protocols)
+        return context
+
+    def set_alpn_protocols(self, protocols):
+        # ALPN is negotiated after the SNI callback, on the context it switched to
+        self.alpn_protocols = list(protocols)
+        self.server_context.set_alpn_protocols(self.alpn_protocols)
+        for context in self.loaded.values():
+            context.set_alpn_protocols(self.alpn_protocols)
+
+    def load(self, name):
+        context = self.loaded.get(name)
+        if context is not None:
+            return context
+        path = self.path(name)
+        if not os.path.exists(path) or self.expires(path) - now() <= RENEW_BEFORE:
+            return None
+        context = self.new_context(path)
+        self.loaded[name] = context
+        self.counters['loaded'] += 1
+        return context
+
+    def lookup(self, server_name):
+        """The SSLContext for a server name, or None to stay on the default certificate."""
+        context = self.contexts.get(server_name)
+        if context is not None:
+            self.contexts.move_to_end(server_name)
+            self.counters['hits'] += 1
+            return context
+        self.counters['misses'] += 1
+
+        # The name's own certificate, a wildcard one issued for it as a base domain, or its parent's wildcard
+        wildcard = wildcard_name(server_name)
+        context = (self.load(server_name) or self.load('*.' + server_name)
+                   or (self.load(wildcard) if wildcard else None))
+        if context is None:
+            if self.allow is not None and not self.allow(server_name):
+                self.counters['rejected'] += 1
+                return None
+            context = self.new_context(self.ensure_name(server_name))
+            self.loaded[server_name] = context
+
+        self.contexts[server_name] = context
+        if len(self.contexts) > self.max_contexts:
+            self.contexts.popitem(last=False)
+            self.counters['evictions'] += 1
+            # Drop contexts no server name refers to any more
+            live = {id(context) for context in self.contexts.values()}
+            self.loaded = {name: context for name, context in self.loaded.items() if id(context) in live}
+        return context
+
+    def sni_callback(self, ssl_object, server_name, default_context):
+        if server_name:
+            context = self.lookup(normalize_host(server_name))
+            if context is not None:
+                ssl_object.context = context
+
+    def stats(self):
+        return dict(self.counters, contexts=len(self.contexts), certificates=len(self.loaded),
+                    root=self.ca.cert_path)
@@ -0,0 +1,338 @@
+import asyncio
+import os
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import brotli
+import zstandard
+from multidict import CIMultiDict
+
+# Server preference between codings a client accepts equally
+ENCODINGS = ('br', 'zstd', 'gzip')
+# Fast settings for on-the-fly use; each asset version is compressed once thanks to the cache
+DEFAULT_LEVELS = {'br': 4, 'zstd': 3, 'gzip': 6}
+
+COMPRESSIBLE_TYPES = frozenset([
+    'application/javascript', 'application/x-javascript', 'application/json', 'application/manifest+json',
+    'application/xml', 'application/xhtml+xml', 'application/wasm', 'image/svg+xml', 'font/ttf', 'font/otf',
+])
+# Event streams must reach the client as each event is written, which a compressor's buffering prevents
+INCOMPRESSIBLE_TYPES = frozenset(['text/event-stream'])
+
+# Only the encoded body is cached; headers always come from the live upstream response
+CompressedEntry = namedtuple('CompressedEntry', ['etag', 'representation', 'body'])
+# Describe the body itself, so a 304 that omits them still gets them from the held copy
+REPRESENTATION_HEADERS = ('Content-Type', 'Content-Language', 'Content-Location', 'Last-Modified')
+
+
+def parse_accept_encoding(value):
+    """{coding: qvalue} from an Accept-Encoding header."""
+    accepted = {}
+    for item in value.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, number = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+@lru_cache(maxsize=256)
+def negotiate(accept_encoding, encodings=ENCODINGS):
+    """The best of `encodings` for an Accept-Encoding value, or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_encoding(accept_encoding)
+    default = accepted.get('*', 0.0)
+    best, best_q = None, 0.0
+    for coding in encodings:
+        q = accepted.get(coding, accepted.get('x-gzip', default) if coding == 'gzip' else default)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def is_compressible(content_type, types=COMPRESSIBLE_TYPES):
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    if media_type in INCOMPRESSIBLE_TYPES:
+        return False
+    return (media_type.startswith('text/') or media_type in types
+            or media_type.endswith(('+json', '+xml')))
+
+
+def is_shareable(request, headers):
+    """Whether an encoded body may be kept and served to other clients."""
+    if 'Set-Cookie' in headers or 'Authorization' in request.headers:
+        return False
+    cache_control = headers.get('Cache-Control', '').lower()
+    return 'private' not in cache_control and 'no-store' not in cache_control
+
+
+def representation(headers):
+    return {name: headers[name] for name in REPRESENTATION_HEADERS if name in headers}
+
+
+def weak_etag(etag):
+    # The compressed body is not byte-identical to what the upstream's strong ETag names
+    return etag if etag.startswith('W/') else f'W/{etag}'
+
+
+def run_timed(function, *args):
+    """Run on a pool thread; returns (result, CPU seconds spent by that thread)."""
+    start = time.thread_time()
+    result = function(*args)
+    return result, time.thread_time() - start
+
+
+class Encoder:
+    """Streaming compressor for one response body."""
+
+    __slots__ = ('process', 'finish')
+
+    def __init__(self, coding, level):
+        if coding == 'br':
+            compressor = brotli.Compressor(quality=level)
+            self.process, self.finish = compressor.process, compressor.finish
+        elif coding == 'zstd':
+            compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self.process, self.finish = compressor.compress, compressor.flush
+        else:
+            # wbits 31: a gzip header and trailer around the deflate stream
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.process, self.finish = compressor.compress, compressor.flush
+
+    def compress(self, data):
+        return self.process(data) + self.finish()
+
+
+async def iterate(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def chain(head, rest):
+    for chunk in head:
+        yield chunk
+    async for chunk in rest:
+        yield chunk
+
+
+class CompressedCache:
+    """Compressed bodies per (host, path, coding), valid while the upstream's ETag is unchanged; an LRU by size."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entry_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.counters = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stores': 0, 'evictions': 0}
+
+    def get(self, key, etag=None):
+        entry = self.entries.get(key)
+        if entry is None or (etag is not None and entry.etag != etag):
+            self.counters['misses'] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.counters['hits'] += 1
+        return entry
+
+    def peek(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, entry):
+        size = len(entry.body)
+        if size > self.max_entry_bytes or size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= len(old.body)
+        self.entries[key] = entry
+        self.current_bytes += size
+        self.counters['stores'] += 1
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.current_bytes -= len(evicted.body)
+            self.counters['evictions'] += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        return dict(self.counters, entries=len(self.entries), bytes=self.current_bytes, max_bytes=self.max_bytes)
+
+
+class Compressor:
+    """
+    Compresses proxied responses with the best of br, zstd and gzip that
+    the client accepts, for compressible types of at least `min_size`
+    bytes. Encoding runs on a thread pool, where the codecs release the
+    GIL, so large bundles neither block the event loop nor queue behind
+    one another. Outputs for responses with an ETag are cached until
+    that ETag changes, so each asset version is compressed only once.
+    Only the encoded body is kept, and never for responses with
+    Set-Cookie, private or no-store, or to requests with Authorization;
+    headers always come from the live upstream response or 304.
+
+    `types` replaces the non-text media types considered compressible;
+    text/*, +json and +xml types always are. CPU time and bytes in/out
+    per coding go to `metrics` (a metrics.ProxyMetrics).
+    """
+
+    def __init__(self, encodings=ENCODINGS, levels=None, min_size=1024, types=None, workers=None,
+                 cache_max_bytes=32 * 1024 * 1024, cache_max_entry_bytes=8 * 1024 * 1024, metrics=None):
+        self.encodings = tuple(encodings)
+        self.levels = dict(DEFAULT_LEVELS, **(levels or {}))
+        self.min_size = min_size
+        self.types = frozenset(types) if types is not None else COMPRESSIBLE_TYPES
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1),
+                                           thread_name_prefix='compress')
+        self.cache = CompressedCache(cache_max_bytes, cache_max_entry_bytes) if cache_max_bytes else None
+        self.metrics = metrics
+
+    def negotiate(self, request):
+        return negotiate(request.headers.get('Accept-Encoding'), self.encodings)
+
+    def choose(self, request, status, headers):
+        """The coding to compress this response with, or None to send it as-is."""
+        if status != 200 or request.method == 'HEAD':
+            return None
+        if 'Content-Encoding' in headers or 'Content-Range' in headers:
+            return None
+        if 'no-transform' in headers.get('Cache-Control', '').lower():
+            return None
+        if not is_compressible(headers.get('Content-Type', ''), self.types):
+            return None
+        length = headers.get('Content-Length')
+        if length is not None and length.isdigit() and int(length) < self.min_size:
+            return None
+        return self.negotiate(request)
+
+    @staticmethod
+    def cache_key(request, coding):
+        return (request.host.lower(), request.path_qs, coding)
+
+    def cache_key_for(self, request, coding, headers):
+        """The cache key for this response, or None when its encoded body must not be cached."""
+        if self.cache is None or not headers.get('ETag') or not is_shareable(request, headers):
+            return None
+        return self.cache_key(request, coding)
+
+    def held(self, request):
+        """A compressed copy of this URL in the coding the client would get, for revalidating upstream."""
+        if self.cache is None or 'Authorization' in request.headers:
+            return None
+        coding = self.negotiate(request)
+        return self.cache.peek(self.cache_key(request, coding)) if coding is not None else None
+
+    def encoded_headers(self, headers, coding, representation=None):
+        headers = CIMultiDict(headers)
+        for name, value in (representation or {}).items():
+            if name not in headers:
+                headers[name] = value
+        headers.popall('Content-Length', None)
+        headers['Content-Encoding'] = coding
+        vary = headers.get('Vary', '')
+        if 'accept-encoding' not in vary.lower() and vary.strip() != '*':
+            headers['Vary'] = f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding'
+        etag = headers.get('ETag')
+        if etag:
+            headers['ETag'] = weak_etag(etag)
+        return headers
+
+    def record(self, coding, bytes_in, bytes_out, cpu_seconds):
+        if self.metrics is not None:
+            self.metrics.compressed(coding, bytes_in, bytes_out, cpu_seconds)
+
+    async def encode_body(self, request, coding, headers, body):
+        """Compress a complete body; returns (headers, body), unchanged when it is below min_size."""
+        if len(body) < self.min_size:
+            return headers, body
+        etag = headers.get('ETag')
+        key = self.cache_key_for(request, coding, headers)
+        if key is not None:
+            entry = self.cache.get(key, etag)
+            if entry is not None:
+                return self.encoded_headers(headers, coding), entry.body
+        encoder = Encoder(coding, self.levels[coding])
+        compressed, cpu = await asyncio.get_running_loop().run_in_executor(
+            self.executor, run_timed, encoder.compress, body)
+        self.record(coding, len(body), len(compressed), cpu)
+        if key is not None:
+            self.cache.put(key, CompressedEntry(etag, representation(headers), compressed))
+        return self.encoded_headers(headers, coding), compressed
+
+    async def encode_stream(self, request, coding, headers, chunks):
+        """Compress a body as it streams; returns (headers, chunks)."""
+        etag = headers.get('ETag')
+        key = self.cache_key_for(request, coding, headers)
+        if key is not None:
+            entry = self.cache.get(key, etag)
+            if entry is not None:
+                if hasattr(chunks, 'aclose'):
+                    await chunks.aclose()
+                return self.encoded_headers(headers, coding), iterate([entry.body])
+
+        # Without a Content-Length, read ahead far enough to tell whether the body reaches min_size
+        iterator = chunks.__aiter__()
+        head = []
+        size = 0
+        while size < self.min_size:
+            try:
+                chunk = await iterator.__anext__()
+            except StopAsyncIteration:
+                return headers, iterate(head)
+            head.append(chunk)
+            size += len(chunk)
+        kept = representation(headers) if key is not None else None
+        return self.encoded_headers(headers, coding), self._encode(coding, head, iterator, key, etag, kept)
+
+    async def _encode(self, coding, head, rest, key, etag, kept_headers):
+        loop = asyncio.get_running_loop()
+        encoder = Encoder(coding, self.levels[coding])
+        # Output kept for the cache while it stays small enough to store
+        kept = [] if key is not None else None
+        bytes_in = bytes_out = 0
+        cpu = 0.0
+        complete = False
+        try:
+            async for chunk in chain(head, rest):
+                bytes_in += len(chunk)
+                output, spent = await loop.run_in_executor(self.executor, run_timed, encoder.process, chunk)
+                cpu += spent
+                if output:
+                    bytes_out += len(output)
+                    if kept is not None:
+                        kept = kept if bytes_out <= self.cache.max_entry_bytes else None
+                    if kept is not None:
+                        kept.append(output)
+                    yield output
+            output, spent = await loop.run_in_executor(self.executor, run_timed, encoder.finish)
+            cpu += spent
+            bytes_out += len(output)
+            if kept is not None:
+                kept.append(output)
+            complete = True
+            if output:
+                yield output
+        finally:
+            self.record(coding, bytes_in, bytes_out, cpu)
+            if complete and kept is not None:
+                self.cache.put(key, CompressedEntry(etag, kept_headers, b''.join(kept)))
+
+    def stats(self):
+        return self.cache.stats() if self.cache is not None else None
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -1,32 +1,162 @@
+import atexit
 import json
 import os
-from utils import get_data_dir
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from utils import get_data_dir, atomic_write
+
+# added/changed map domain -> new target, removed is a set of domains
+ChangeSet = namedtuple('ChangeSet', ['version', 'added', 'removed', 'changed'])
+
+_MISSING = object()
+
 
 class ConfigManager:
-    def __init__(self):
+    """
+    Domain -> target mapping persisted to proxy_config.json.
+
+    Edits are grouped with `with config.batch(): ...`. Every committed edit
+    (or batch) bumps `version` and sends a ChangeSet to subscribers.
+    Writes are debounced by `save_delay` seconds and done atomically, so
+    importing 10k domains costs one write.
+    """
+
+    def __init__(self, save_delay=0.5):
         self.data_dir = get_data_dir()
         self.config_file = os.path.join(self.data_dir, 'proxy_config.json')
+        self.save_delay = save_delay
+        self.lock = threading.RLock()
+        self.version = 0
+        self.listeners = []
+        self.batch_depth = 0
+        self.pending_changes = {}
+        self.dirty = False
+        self.save_timer = None
+        self.write_count = 0
         self.load_config()
+        atexit.register(self.flush)
 
     def load_config(self):
         try:
             with open(self.config_file, 'r') as f:
-                self.config = json.load(f)
+                config = json.load(f)
         except FileNotFoundError:
-            self.config = {}
+            config = {}
+        with self.lock:
+            self.config = config
 
     def save_config(self):
-        with open(self.config_file, 'w') as f:
-            json.dump(self.config, f, indent=2)
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            content = json.dumps(self.config, indent=2)
+            self.dirty = False
+            # Written under the lock so a debounced write of older content cannot land after a newer one
+            atomic_write(self.config_file, content)
+            self.write_count += 1
+
+    def flush(self):
+        """Write pending changes now instead of waiting for the debounce timer."""
+        if self.dirty:
+            self.save_config()
+
+    def schedule_save(self):
+        if self.save_delay <= 0:
+            self.save_config()
+            return
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+            self.save_timer = threading.Timer(self.save_delay, self.flush)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def subscribe(self, callback):
+        """Call `callback(change_set)` after every committed change."""
+        self.listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    @contextmanager
+    def batch(self):
+        """
+        Group edits into one version bump, one notification and one write.
+        If the block raises, its edits are undone and nothing is committed.
+        """
+        with self.lock:
+            self.batch_depth += 1
+            snapshot = dict(self.config), dict(self.pending_changes)
+        try:
+            yield self
+        except BaseException:
+            with self.lock:
+                self.batch_depth -= 1
+                self.config, self.pending_changes = snapshot
+            raise
+        with self.lock:
+            self.batch_depth -= 1
+            outermost = self.batch_depth == 0
+        if outermost:
+            self._commit()
+
+    def _set(self, domain, target):
+        with self.lock:
+            old = self.config.get(domain, _MISSING)
+            if target is _MISSING:
+                self.config.pop(domain, None)
+            else:
+                self.config[domain] = target
+            # Keep the value from before the batch so net no-ops drop out
+            original, _ = self.pending_changes.get(domain, (old, None))
+            self.pending_changes[domain] = (original, target)
+
+    def _commit(self):
+        with self.lock:
+            if self.batch_depth:
+                return None
+            pending, self.pending_changes = self.pending_changes, {}
+            added, removed, changed = {}, set(), {}
+            for domain, (old, new) in pending.items():
+                if old is _MISSING and new is not _MISSING:
+                    added[domain] = new
+                elif old is not _MISSING and new is _MISSING:
+                    removed.add(domain)
+                elif old is not _MISSING and old != new:
+                    changed[domain] = new
+            if not (added or removed or changed):
+                return None
+            self.version += 1
+            self.dirty = True
+            change_set = ChangeSet(self.version, added, removed, changed)
+
+        self.schedule_save()
+        for callback in list(self.listeners):
+            callback(change_set)
+        return change_set
 
     def add_domain(self, domain, target):
-        self.config[domain] = target
-        self.save_config()
+        self._set(domain, target)
+        return self._commit()
 
     def remove_domain(self, domain):
         if domain in self.config:
-            del self.config[domain]
-            self.save_config()
+            self._set(domain, _MISSING)
+        return self._commit()
+
+    def update_domains(self, domains):
+        with self.batch():
+            for domain, target in domains.items():
+                self._set(domain, target)
+
+    def remove_domains(self, domains):
+        with self.batch():
+            for domain in domains:
+                if domain in self.config:
+                    self._set(domain, _MISSING)
 
     def get_domains(self):
-        return self.config
\ No newline at end of file
+        return self.config
@@ -0,0 +1,286 @@
+"""
+Optional local DNS responder for Wild Caddy domains.
+
+Answers A/AAAA queries for configured domains (and '*.app.test' /
+'.app.test' patterns) straight from memory, so names resolve without
+editing the hosts file. Everything else is forwarded to an upstream
+resolver, or refused when no upstream is configured.
+
+    python dns_server.py --port 5353
+"""
+import argparse
+import asyncio
+import ipaddress
+import itertools
+import socket
+import struct
+
+from route_table import split_pattern
+
+TYPE_A = 1
+TYPE_AAAA = 28
+CLASS_IN = 1
+
+RCODE_NOERROR = 0
+RCODE_FORMERR = 1
+RCODE_REFUSED = 5
+
+# Answers point back at the question name (offset 12), so one record serves every name
+NAME_POINTER = b'\xc0\x0c'
+
+
+def parse_question(data):
+    """Return (name, qtype, qclass, end_offset) for the first question, or None if malformed."""
+    if len(data) < 12:
+        return None
+    qdcount = struct.unpack_from('!H', data, 4)[0]
+    if qdcount != 1:
+        return None
+
+    labels = []
+    offset = 12
+    while True:
+        if offset >= len(data):
+            return None
+        length = data[offset]
+        offset += 1
+        if length == 0:
+            break
+        if length & 0xC0 or offset + length > len(data):
+            return None
+        labels.append(data[offset:offset + length])
+        offset += length
+
+    if offset + 4 > len(data):
+        return None
+    qtype, qclass = struct.unpack_from('!HH', data, offset)
+    name = b'.'.join(labels).decode('ascii', errors='replace').lower()
+    return name, qtype, qclass, offset + 4
+
+
+def build_record(rtype, address, ttl):
+    rdata = ipaddress.ip_address(address).packed
+    return NAME_POINTER + struct.pack('!HHIH', rtype, CLASS_IN, ttl, len(rdata)) + rdata
+
+
+class AnswerTable:
+    """
+    In-memory answer table. The A/AAAA records are encoded once and shared
+    by every name. Exact names are a set hit, and patterns are found by
+    stripping leading labels, so a lookup is O(labels) however many domains
+    are configured.
+    """
+
+    def __init__(self, ipv4='127.0.0.1', ipv6='::1', ttl=5):
+        self.records = {
+            TYPE_A: build_record(TYPE_A, ipv4, ttl),
+            TYPE_AAAA: build_record(TYPE_AAAA, ipv6, ttl),
+        }
+        self.exact = set()
+        self.wildcards = set()
+        self.suffixes = set()
+
+    def _classify(self, pattern):
+        host, _ = split_pattern(pattern)
+        if host.startswith('*.'):
+            return 'wildcards', host[2:]
+        if host.startswith('.'):
+            return 'suffixes', host[1:]
+        return 'exact', host
+
+    def add(self, pattern):
+        kind, name = self._classify(pattern)
+        getattr(self, kind).add(name)
+
+    def remove(self, pattern):
+        kind, name = self._classify(pattern)
+        getattr(self, kind).discard(name)
+
+    def sync(self, patterns):
+        """Bring the table in line with `patterns`, touching only what changed."""
+        wanted = {'exact': set(), 'wildcards': set(), 'suffixes': set()}
+        for pattern in patterns:
+            kind, name = self._classify(pattern)
+            wanted[kind].add(name)
+        for kind, target in wanted.items():
+            names = getattr(self, kind)
+            names.difference_update(names - target)
+            names.update(target - names)
+
+    def matches(self, name):
+        if name in self.exact or name in self.suffixes:
+            return True
+        labels = name.split('.')
+        if len(labels) > 1 and '.'.join(labels[1:]) in self.wildcards:
+            return True
+        for i in range(1, len(labels)):
+            if '.'.join(labels[i:]) in self.suffixes:
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.exact) + len(self.wildcards) + len(self.suffixes)
+
+
+def build_response(query, question_end, rcode, answer=None, recursion_available=False):
+    # Keep the ID, opcode and RD bit from the query, and set QR and AA
+    flags = struct.unpack_from('!H', query, 2)[0]
+    flags = 0x8000 | (flags & 0x7900) | 0x0400 | (0x0080 if recursion_available else 0) | rcode
+    header = query[:2] + struct.pack('!HHHHH', flags, 1, 1 if answer else 0, 0, 0)
+    return header + query[12:question_end] + (answer or b'')
+
+
+class _ForwarderProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.forward_response(data)
+
+
+class LocalDNSServer(asyncio.DatagramProtocol):
+    def __init__(self, table=None, upstream=None, forward_timeout=2.0):
+        self.table = table or AnswerTable()
+        self.upstream = upstream
+        self.forward_timeout = forward_timeout
+        self.transport = None
+        self.forward_transport = None
+        self.pending = {}
+        self.ids = itertools.cycle(range(1, 0x10000))
+        self.stats = {'queries': 0, 'answered': 0, 'forwarded': 0, 'refused': 0, 'errors': 0}
+
+    async def start(self, host='127.0.0.1', port=5353):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        if self.upstream:
+            self.forward_transport, _ = await loop.create_datagram_endpoint(
+                lambda: _ForwarderProtocol(self), remote_addr=self.upstream
+            )
+        return self.transport.get_extra_info('sockname')
+
+    def close(self):
+        for _, _, timer in self.pending.values():
+            timer.cancel()
+        self.pending.clear()
+        if self.forward_transport is not None:
+            self.forward_transport.close()
+        if self.transport is not None:
+            self.transport.close()
+
+    def sync_from_config(self, config_manager):
+        self.table.sync(config_manager.get_domains())
+
+    def datagram_received(self, data, addr):
+        self.stats['queries'] += 1
+        question = parse_question(data)
+        if question is None:
+            self.stats['errors'] += 1
+            if len(data) >= 12:
+                self.transport.sendto(data[:2] + struct.pack('!HHHHH', 0x8000 | RCODE_FORMERR, 0, 0, 0, 0), addr)
+            return
+
+        name, qtype, qclass, end = question
+        if self.table.matches(name):
+            self.stats['answered'] += 1
+            # Other record types for our names get an empty NOERROR answer
+            answer = self.table.records.get(qtype) if qclass == CLASS_IN else None
+            self.transport.sendto(build_response(data, end, RCODE_NOERROR, answer), addr)
+        elif self.forward_transport is not None:
+            self.stats['forwarded'] += 1
+            self.forward(data, addr)
+        else:
+            self.stats['refused'] += 1
+            self.transport.sendto(build_response(data, end, RCODE_REFUSED), addr)
+
+    def forward(self, data, addr):
+        # Rewrite the ID so concurrent clients cannot collide upstream
+        upstream_id = next(self.ids)
+        if upstream_id in self.pending:
+            self.pending.pop(upstream_id)[2].cancel()
+        timer = asyncio.get_running_loop().call_later(self.forward_timeout, self.forward_timeout_expired, upstream_id)
+        self.pending[upstream_id] = (addr, data[:2], timer)
+        self.forward_transport.sendto(struct.pack('!H', upstream_id) + data[2:])
+
+    def forward_response(self, data):
+        if len(data) < 12:
+            return
+        entry = self.pending.pop(struct.unpack_from('!H', data)[0], None)
+        if entry is None:
+            return
+        addr, original_id, timer = entry
+        timer.cancel()
+        self.transport.sendto(original_id + data[2:], addr)
+
+    def forward_timeout_expired(self, upstream_id):
+        entry = self.pending.pop(upstream_id, None)
+        if entry is not None:
+            self.stats['errors'] += 1
+
+
+def parse_upstream(value, default_port=53):
+    """(host, port) from '1.1.1.1', '1.1.1.1:53', '2606:4700::1111' or '[2606:4700::1111]:53'."""
+    value = value.strip()
+    if value.startswith('['):
+        end = value.find(']')
+        if end == -1:
+            raise ValueError(f"unterminated IPv6 address: {value}")
+        host, rest = value[1:end], value[end + 1:]
+        if rest and not rest.startswith(':'):
+            raise ValueError(f"unexpected text after IPv6 address: {value}")
+        port = rest[1:]
+    elif value.count(':') == 1:
+        host, port = value.split(':')
+    else:
+        # A bare IPv6 address has several colons and no port
+        host, port = value, ''
+    if not host:
+        raise ValueError(f"missing upstream host: {value}")
+    return host, int(port) if port else default_port
+
+
+def resolve_upstream(value):
+    """The socket address to forward to, resolved once at startup; IPv6 upstreams work too."""
+    host, port = parse_upstream(value)
+    return socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0][4][:2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5353)
+    parser.add_argument('--upstream', default=None,
+                        help='resolver to forward other names to, e.g. 1.1.1.1, 1.1.1.1:53 or [2606:4700::1111]:53')
+    parser.add_argument('--reload-interval', type=float, default=2.0, help='seconds between config re-reads')
+    args = parser.parse_args()
+
+    from config_manager import ConfigManager
+
+    upstream = None
+    if args.upstream:
+        try:
+            upstream = resolve_upstream(args.upstream)
+        except (ValueError, OSError) as e:
+            parser.error(f"--upstream {args.upstream}: {e}")
+
+    async def run():
+        config_manager = ConfigManager()
+        server = LocalDNSServer(upstream=upstream)
+        server.sync_from_config(config_manager)
+        sockname = await server.start(args.host, args.port)
+        print(f"DNS responder listening on {sockname[0]}:{sockname[1]} for {len(server.table)} names")
+        try:
+            while True:
+                await asyncio.sleep(args.reload_interval)
+                config_manager.load_config()
+                server.sync_from_config(config_manager)
+        finally:
+            server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
-from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QLabel
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QLabel, QComboBox
+from load_balancer import POLICIES, make_target
 
 class AddDomainDialog(QDialog):
     def __init__(self, parent=None):
@@ -17,9 +18,22 @@ class AddDomainDialog(QDialog):
         target_layout = QHBoxLayout()
         target_layout.addWidget(QLabel("Target:"))
         self.target_input = QLineEdit()
+        self.target_input.setPlaceholderText("http://localhost:3000, http://localhost:3001")
         target_layout.addWidget(self.target_input)
         layout.addLayout(target_layout)
 
+        policy_layout = QHBoxLayout()
+        policy_layout.addWidget(QLabel("Load balancing:"))
+        self.policy_input = QComboBox()
+        self.policy_input.addItems(POLICIES)
+        self.policy_input.currentTextChanged.connect(self.on_policy_changed)
+        policy_layout.addWidget(self.policy_input)
+        self.key_input = QLineEdit()
+        self.key_input.setPlaceholderText("header or cookie name")
+        self.key_input.setEnabled(False)
+        policy_layout.addWidget(self.key_input)
+        layout.addLayout(policy_layout)
+
         button_layout = QHBoxLayout()
         ok_button = QPushButton("OK")
         ok_button.clicked.connect(self.accept)
@@ -29,5 +43,11 @@ class AddDomainDialog(QDialog):
         button_layout.addWidget(cancel_button)
         layout.addLayout(button_layout)
 
+    def on_policy_changed(self, policy):
+        self.key_input.setEnabled(policy in ('header', 'cookie'))
+
     def get_input(self):
-        return self.domain_input.text(), self.target_input.text()
\ No newline at end of file
+        upstreams = [upstream.strip() for upstream in self.target_input.text().split(',') if upstream.strip()]
+        policy = self.policy_input.currentText()
+        key = self.key_input.text().strip() if self.key_input.isEnabled() else None
+        return self.domain_input.text(), make_target(upstreams or [''], policy, key)
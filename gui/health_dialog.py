@@ -0,0 +1,95 @@
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QLabel, QPushButton, QHeaderView
+from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtGui import QColor
+
+COLUMNS = ["Domain", "HTTPS", "Latency", "Upstream", "Upstream Latency", "Success Rate", "Avg Latency"]
+UPSTREAM_COLUMNS = ["Upstream", "Active Requests", "Recent Fails"]
+
+
+def status_text(result):
+    if result.status is not None:
+        return str(result.status)
+    return "unreachable"
+
+
+class HealthDialog(QDialog):
+    refresh_requested = pyqtSignal()
+
+    def __init__(self, health_checker, parent=None):
+        super().__init__(parent)
+        self.health_checker = health_checker
+        self.setWindowTitle("Domain Health")
+        self.resize(760, 360)
+
+        layout = QVBoxLayout(self)
+
+        self.status_label = QLabel("Checking...")
+        layout.addWidget(self.status_label)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.setSortingEnabled(True)
+        layout.addWidget(self.table)
+
+        layout.addWidget(QLabel("Upstream traffic"))
+        self.upstream_table = QTableWidget(0, len(UPSTREAM_COLUMNS))
+        self.upstream_table.setHorizontalHeaderLabels(UPSTREAM_COLUMNS)
+        self.upstream_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.upstream_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.upstream_table)
+
+        button_layout = QHBoxLayout()
+        refresh_button = QPushButton("Refresh")
+        refresh_button.clicked.connect(self.refresh_requested.emit)
+        button_layout.addWidget(refresh_button)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+    def set_status(self, message):
+        self.status_label.setText(message)
+
+    def update_results(self, results):
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(results))
+        for row, (domain, result) in enumerate(sorted(results.items())):
+            https, upstream = result['domain'], result['upstream']
+            success_rate, avg_latency = self.health_checker.summary(https.url)
+            cells = [
+                (domain, None),
+                (status_text(https), https.ok),
+                (f"{https.latency_ms:.0f} ms", None),
+                (status_text(upstream), upstream.ok),
+                (f"{upstream.latency_ms:.0f} ms", None),
+                (f"{success_rate * 100:.0f}%" if success_rate is not None else "-", None),
+                (f"{avg_latency:.0f} ms" if avg_latency is not None else "-", None),
+            ]
+            for column, (text, ok) in enumerate(cells):
+                item = QTableWidgetItem(text)
+                if ok is not None:
+                    item.setForeground(QColor('darkgreen') if ok else QColor('red'))
+                if column == 1 and https.error:
+                    item.setToolTip(https.error)
+                elif column == 3 and upstream.error:
+                    item.setToolTip(upstream.error)
+                if column > 0:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignRight)
+                self.table.setItem(row, column, item)
+        self.table.setSortingEnabled(True)
+
+    def update_upstreams(self, upstreams):
+        """Show Caddy's per-upstream counters (in-flight requests, fails within fail_duration)."""
+        self.upstream_table.setRowCount(len(upstreams))
+        for row, upstream in enumerate(sorted(upstreams, key=lambda upstream: upstream.get('address', ''))):
+            fails = upstream.get('fails', 0)
+            cells = [upstream.get('address', ''), str(upstream.get('num_requests', 0)), str(fails)]
+            for column, text in enumerate(cells):
+                item = QTableWidgetItem(text)
+                if column > 0:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignRight)
+                if column == 2 and fails:
+                    item.setForeground(QColor('red'))
+                self.upstream_table.setItem(row, column, item)
@@ -0,0 +1,189 @@
+import time
+
+from PyQt6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QListView, QComboBox, QLineEdit, QPushButton, QLabel
+)
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QSortFilterProxyModel, QTimer, pyqtSlot
+from PyQt6.QtGui import QBrush, QColor, QFont
+
+from caddy_log import LEVELS, LogRecord, format_record
+
+LEVEL_COLORS = {
+    'debug': QColor('gray'),
+    'warn': QColor('darkorange'),
+    'error': QColor('red'),
+    'panic': QColor('darkred'),
+    'fatal': QColor('darkred'),
+}
+
+
+class LogListModel(QAbstractListModel):
+    """Capped list of LogRecords; rows beyond `capacity` are dropped from the top."""
+
+    def __init__(self, capacity=50000, parent=None):
+        super().__init__(parent)
+        self.capacity = capacity
+        self.records = []
+        self.texts = []
+        self.brushes = {level: QBrush(color) for level, color in LEVEL_COLORS.items()}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.texts[index.row()]
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return self.brushes.get(self.records[index.row()].level)
+        return None
+
+    def append_records(self, records):
+        if not records:
+            return
+        records = records[-self.capacity:]
+
+        overflow = len(self.records) + len(records) - self.capacity
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            del self.records[:overflow]
+            del self.texts[:overflow]
+            self.endRemoveRows()
+
+        first = len(self.records)
+        self.beginInsertRows(QModelIndex(), first, first + len(records) - 1)
+        self.records.extend(records)
+        # Format once on insert so painting never re-formats
+        self.texts.extend(format_record(record) for record in records)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.records = []
+        self.texts = []
+        self.endResetModel()
+
+
+class LogFilterProxyModel(QSortFilterProxyModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.level = None
+        self.host = ''
+        self.search = ''
+
+    def set_filters(self, level, host, search):
+        self.level = level
+        self.host = host.lower()
+        self.search = search.lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self.level is None and not self.host and not self.search:
+            return True
+        model = self.sourceModel()
+        record = model.records[source_row]
+        if self.level is not None and record.level != self.level:
+            return False
+        if self.host and self.host not in record.host.lower():
+            return False
+        if self.search and self.search not in model.texts[source_row].lower():
+            return False
+        return True
+
+
+class LogPane(QWidget):
+    """
+    Log viewer backed by a capped model. Incoming records are queued and
+    applied to the model on a timer, so a busy Caddy costs one model update
+    per `flush_interval_ms` instead of one widget reflow per line.
+    """
+
+    def __init__(self, capacity=50000, flush_interval_ms=100, parent=None):
+        super().__init__(parent)
+        self.pending = []
+        self.seq = 0
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Level:"))
+        self.level_combo = QComboBox()
+        self.level_combo.addItem("All", None)
+        for level in LEVELS:
+            self.level_combo.addItem(level.capitalize(), level)
+        filter_layout.addWidget(self.level_combo)
+
+        self.host_input = QLineEdit()
+        self.host_input.setPlaceholderText("Host")
+        filter_layout.addWidget(self.host_input)
+
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search logs")
+        filter_layout.addWidget(self.search_input)
+
+        clear_button = QPushButton("Clear")
+        clear_button.clicked.connect(self.clear)
+        filter_layout.addWidget(clear_button)
+        layout.addLayout(filter_layout)
+
+        self.model = LogListModel(capacity, self)
+        self.proxy = LogFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+
+        self.view = QListView()
+        self.view.setModel(self.proxy)
+        # Uniform rows let the view skip measuring every item
+        self.view.setUniformItemSizes(True)
+        self.view.setEditTriggers(QListView.EditTrigger.NoEditTriggers)
+        self.view.setFont(QFont("Menlo", 11))
+        layout.addWidget(self.view)
+
+        # Restart the timer on every keystroke so typing only filters once
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(150)
+        self.filter_timer.timeout.connect(self.apply_filters)
+        self.level_combo.currentIndexChanged.connect(self.apply_filters)
+        self.host_input.textChanged.connect(self.filter_timer.start)
+        self.search_input.textChanged.connect(self.filter_timer.start)
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setInterval(flush_interval_ms)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start()
+
+    def append_records(self, records):
+        self.pending.extend(records)
+        if len(self.pending) > self.model.capacity:
+            del self.pending[:-self.model.capacity]
+
+    def append_message(self, message, level='info'):
+        self.seq += 1
+        self.pending.append(LogRecord(-self.seq, time.time(), level, 'wildcaddy', '', message, 'app', {}))
+
+    @pyqtSlot()
+    def flush(self):
+        if not self.pending:
+            return
+        records, self.pending = self.pending, []
+
+        scrollbar = self.view.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum()
+        self.model.append_records(records)
+        if at_bottom:
+            self.view.scrollToBottom()
+
+    @pyqtSlot()
+    def apply_filters(self):
+        self.proxy.set_filters(
+            self.level_combo.currentData(),
+            self.host_input.text().strip(),
+            self.search_input.text().strip(),
+        )
+
+    @pyqtSlot()
+    def clear(self):
+        self.pending = []
+        self.model.clear()
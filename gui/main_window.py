@@ -2,13 +2,17 @@ import logging
 import os
 
 from PyQt6.QtWidgets import (
-    QMainWindow, QVBoxLayout, QHBoxLayout, QPushButton, QListWidget, QWidget,
-    QMessageBox, QProgressDialog, QTextEdit, QLabel, QMenu, QMenuBar, QDialog,
+    QMainWindow, QVBoxLayout, QHBoxLayout, QPushButton, QListWidget, QListWidgetItem, QWidget,
+    QMessageBox, QProgressDialog, QLabel, QMenu, QMenuBar, QDialog,
     QVBoxLayout, QLabel, QTextBrowser
 )
 from PyQt6.QtCore import pyqtSlot, Qt
 from PyQt6.QtGui import QAction, QIcon
+from load_balancer import describe_target
 from .add_domain_dialog import AddDomainDialog
+from .health_dialog import HealthDialog
+from .log_view import LogPane
+from .metrics_dialog import MetricsDialog
 from .status_bar_app import StatusBarApp
 
 logging.basicConfig(
@@ -93,20 +97,27 @@ class MainWindow(QMainWindow):
 
         layout.addLayout(button_layout)
 
-        self.log_display = QTextEdit()
-        self.log_display.setReadOnly(True)
+        self.log_display = LogPane()
         layout.addWidget(self.log_display)
 
         self.update_domain_list()
+        self.config_manager.subscribe(self.on_config_changed)
 
         self.caddy_manager.caddy_started.connect(self.on_caddy_started)
         self.caddy_manager.caddy_stopped.connect(self.on_caddy_stopped)
         self.caddy_manager.caddy_error.connect(self.on_caddy_error)
         self.caddy_manager.caddy_download_progress.connect(self.on_caddy_download_progress)
         self.caddy_manager.caddy_log.connect(self.on_caddy_log)
+        self.caddy_manager.caddy_log_batch.connect(self.on_caddy_log_batch)
         self.caddy_manager.caddy_status.connect(self.on_caddy_status)
+        self.caddy_manager.caddy_reloaded.connect(self.on_caddy_reloaded)
+        self.caddy_manager.health_updated.connect(self.on_health_updated)
+        self.caddy_manager.upstreams_updated.connect(self.on_upstreams_updated)
+        self.caddy_manager.metrics_updated.connect(self.on_metrics_updated)
 
         self.download_progress_dialog = None
+        self.health_dialog = None
+        self.metrics_dialog = None
 
     def load_app_icon(self):
         icon_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'resources', 'wild_caddy_icon.png'))
@@ -145,6 +156,10 @@ class MainWindow(QMainWindow):
         check_status_action.triggered.connect(self.check_status)
         caddy_menu.addAction(check_status_action)
 
+        metrics_action = QAction("Live Metrics", self)
+        metrics_action.triggered.connect(self.show_metrics)
+        caddy_menu.addAction(metrics_action)
+
         restart_caddy_action = QAction("Restart Caddy", self)
         restart_caddy_action.triggered.connect(self.restart_caddy)
         caddy_menu.addAction(restart_caddy_action)
@@ -182,7 +197,6 @@ class MainWindow(QMainWindow):
             
             self.caddy_manager.reload_caddy()
             logging.debug("Caddy reloaded.")
-            self.update_domain_list()
 
     @pyqtSlot()
     def remove_domain(self):
@@ -192,17 +206,30 @@ class MainWindow(QMainWindow):
             self.config_manager.remove_domain(domain)
             #self.hosts_manager.remove_domain(domain)
             self.caddy_manager.reload_caddy()
-            self.update_domain_list()
 
     def update_domain_list(self):
         self.domain_list.clear()
+        self.domain_items = {}
         domains = self.config_manager.get_domains()
         for domain, target in domains.items():
-            self.domain_list.addItem(f"{domain} -> {target}")
+            self.domain_items[domain] = QListWidgetItem(f"{domain} -> {describe_target(target)}", self.domain_list)
+
+    def on_config_changed(self, change_set):
+        """Apply only the domains that changed instead of rebuilding the list."""
+        for domain in change_set.removed:
+            item = self.domain_items.pop(domain, None)
+            if item is not None:
+                self.domain_list.takeItem(self.domain_list.row(item))
+        for domain, target in {**change_set.added, **change_set.changed}.items():
+            item = self.domain_items.get(domain)
+            if item is None:
+                self.domain_items[domain] = QListWidgetItem(f"{domain} -> {describe_target(target)}", self.domain_list)
+            else:
+                item.setText(f"{domain} -> {describe_target(target)}")
 
     @pyqtSlot()
     def on_caddy_started(self):
-        self.log_display.append("Caddy has started successfully.")
+        self.log_display.append_message("Caddy has started successfully.")
         self.status_label.setText("Caddy is running")
         self.add_button.setEnabled(True)
         self.remove_button.setEnabled(True)
@@ -210,7 +237,7 @@ class MainWindow(QMainWindow):
 
     @pyqtSlot()
     def on_caddy_stopped(self):
-        self.log_display.append("Caddy has stopped.")
+        self.log_display.append_message("Caddy has stopped.")
         self.status_label.setText("Caddy is stopped")
         self.add_button.setEnabled(False)
         self.remove_button.setEnabled(False)
@@ -218,9 +245,13 @@ class MainWindow(QMainWindow):
 
     @pyqtSlot(str)
     def on_caddy_error(self, error_message):
-        self.log_display.append(f"Error: {error_message}")
+        self.log_display.append_message(f"Error: {error_message}", level='error')
         QMessageBox.critical(self, "Caddy Error", error_message)
 
+    @pyqtSlot(str, float)
+    def on_caddy_reloaded(self, method, elapsed_ms):
+        self.status_label.setText(f"Caddy is running (last reload {elapsed_ms:.0f} ms via {method})")
+
     @pyqtSlot(int)
     def on_caddy_download_progress(self, progress):
         if self.download_progress_dialog is None and progress < 100:
@@ -239,26 +270,57 @@ class MainWindow(QMainWindow):
 
     @pyqtSlot(str)
     def on_caddy_log(self, log_message):
-        self.log_display.append(log_message)
+        self.log_display.append_message(log_message)
+
+    @pyqtSlot(list)
+    def on_caddy_log_batch(self, records):
+        self.log_display.append_records(records)
 
     @pyqtSlot()
     def check_status(self):
+        if self.health_dialog is None:
+            self.health_dialog = HealthDialog(self.caddy_manager.health_checker, self)
+            self.health_dialog.refresh_requested.connect(self.caddy_manager.check_status)
+        self.health_dialog.set_status("Checking...")
+        self.health_dialog.show()
+        self.health_dialog.raise_()
         self.caddy_manager.check_status()
 
     @pyqtSlot(bool, str)
     def on_caddy_status(self, is_running, status_message):
-        if is_running:
-            QMessageBox.information(self, "Caddy Status", status_message)
-        else:
-            QMessageBox.warning(self, "Caddy Status", status_message)
-        self.log_display.append(f"Status check: {status_message}")
+        if self.health_dialog is not None:
+            self.health_dialog.set_status(status_message)
+        self.log_display.append_message(f"Status check: {status_message}", level='info' if is_running else 'warn')
+
+    @pyqtSlot(dict)
+    def on_health_updated(self, results):
+        if self.health_dialog is not None:
+            self.health_dialog.update_results(results)
+
+    @pyqtSlot(list)
+    def on_upstreams_updated(self, upstreams):
+        if self.health_dialog is not None:
+            self.health_dialog.update_upstreams(upstreams)
+
+    @pyqtSlot()
+    def show_metrics(self):
+        if self.metrics_dialog is None:
+            self.metrics_dialog = MetricsDialog(self)
+            self.metrics_dialog.active_changed.connect(self.caddy_manager.set_metrics_active)
+        self.metrics_dialog.show()
+        self.metrics_dialog.raise_()
+
+    @pyqtSlot(dict)
+    def on_metrics_updated(self, summary):
+        if self.metrics_dialog is not None:
+            self.metrics_dialog.update_metrics(summary)
 
     @pyqtSlot()
     def restart_caddy(self):
         """Restart the Caddy server."""
         logging.debug("Restarting Caddy...")
-        self.caddy_manager.reload_caddy()
-        self.log_display.append("Restarting Caddy...")
+        self.caddy_manager.restart_caddy()
+        self.log_display.append_message("Restarting Caddy...")
         self.status_bar_app.show_message("Wild Caddy", "Caddy server restarted")
 
     @pyqtSlot()
@@ -0,0 +1,60 @@
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QLabel, QPushButton, QHeaderView
+from PyQt6.QtCore import Qt, pyqtSignal
+
+COLUMNS = ["Domain", "Req/s", "p50", "p95", "p99"]
+
+
+def latency_text(value):
+    return f"{value:.1f} ms" if value is not None else "-"
+
+
+class MetricsDialog(QDialog):
+    """Live per-domain latency from Caddy's metrics; scraping runs only while the dialog is visible."""
+    active_changed = pyqtSignal(bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Live Metrics")
+        self.resize(560, 320)
+
+        layout = QVBoxLayout(self)
+
+        self.status_label = QLabel("Waiting for data...")
+        layout.addWidget(self.status_label)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.close)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.active_changed.emit(True)
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.active_changed.emit(False)
+
+    def update_metrics(self, summary):
+        self.status_label.setText(f"{len(summary)} domains with traffic")
+        self.table.setRowCount(len(summary))
+        for row, (host, stats) in enumerate(sorted(summary.items())):
+            cells = [
+                host,
+                f"{stats['rps']:.1f}",
+                latency_text(stats['p50_ms']),
+                latency_text(stats['p95_ms']),
+                latency_text(stats['p99_ms']),
+            ]
+            for column, text in enumerate(cells):
+                item = QTableWidgetItem(text)
+                if column > 0:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignRight)
+                self.table.setItem(row, column, item)
@@ -0,0 +1,492 @@
+"""
+Headless Wild Caddy, for build agents and remote dev boxes.
+
+Runs Caddy from the saved domain config without importing Qt, and takes
+commands from a local control socket:
+
+    python headless.py run [--manage-hosts] [--caddy PATH]
+    python headless.py add app.test http://127.0.0.1:3000
+    python headless.py remove app.test
+    python headless.py list | status [--health] | reload | logs | stop
+
+requests, the binary downloader and the health checker are only imported
+by the commands that need them, so starting the daemon and running a CLI
+command stay cheap.
+"""
+import argparse
+import json
+import os
+import platform
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+from caddy_admin import CaddyAdminClient, CaddyAdminError, DEFAULT_ADMIN_ADDRESS, reload_with_cli, timed
+from caddy_config import CaddyConfigCompiler
+from caddy_log import CaddyLogPipeline, format_record
+from caddy_readiness import CaddyStartupError, READY_LOG_MARKER, wait_until_ready
+from config_manager import ConfigManager
+from load_balancer import POLICIES, describe_target, make_target, parse_target
+from utils import binary_is_current, get_data_dir
+
+CONTROL_SOCKET_NAME = 'wildcaddy.sock'
+# Used where AF_UNIX is unavailable (older Windows builds); loopback only
+DEFAULT_CONTROL_PORT = 2029
+
+
+class ControlError(Exception):
+    pass
+
+
+class DaemonUnavailable(ControlError):
+    pass
+
+
+def default_control_address():
+    """A Unix socket in the data directory, or a loopback TCP port without AF_UNIX."""
+    if hasattr(socket, 'AF_UNIX'):
+        return os.path.join(get_data_dir(), CONTROL_SOCKET_NAME)
+    return ('127.0.0.1', DEFAULT_CONTROL_PORT)
+
+
+def parse_control_address(value):
+    if not value:
+        return default_control_address()
+    host, sep, port = value.rpartition(':')
+    if sep and port.isdigit() and os.sep not in value:
+        return (host or '127.0.0.1', int(port))
+    return value
+
+
+def send_command(address, command, timeout=30, **arguments):
+    """Send one command to a running daemon and return its result; raises ControlError."""
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    request = dict(arguments, command=command)
+    try:
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(address)
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as reader:
+                line = reader.readline()
+    except OSError as e:
+        raise DaemonUnavailable(f"Wild Caddy daemon not reachable at {address}: {str(e)}")
+    if not line:
+        raise ControlError("Wild Caddy daemon closed the connection without replying")
+    reply = json.loads(line)
+    if not reply.get('ok'):
+        raise ControlError(reply.get('error', 'unknown error'))
+    return reply.get('result')
+
+
+class HeadlessCaddy:
+    """
+    Qt-free counterpart of proxy_manager.CaddyManager. Owns the Caddy
+    process and keeps its config, and optionally the hosts file, in step
+    with the ConfigManager. Commands arrive on control socket threads and
+    are serialized by `lock`.
+    """
+
+    def __init__(self, config_manager, admin_address=DEFAULT_ADMIN_ADDRESS, caddy_path=None,
+                 caddy_version='latest', config_format='json', startup_timeout=15.0,
+                 hosts_manager=None, echo_logs=True):
+        self.config_manager = config_manager
+        self.data_dir = get_data_dir()
+        self.caddy_path = caddy_path
+        self.caddy_version = caddy_version
+        self.admin = CaddyAdminClient(admin_address)
+        self.config_compiler = CaddyConfigCompiler(admin_address, fmt=config_format)
+        self.startup_timeout = startup_timeout
+        self.hosts_manager = hosts_manager
+        self.echo_logs = echo_logs
+        self.lock = threading.RLock()
+        self.caddy_process = None
+        self.log_pipeline = None
+        self.ready_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.applied_hash = None
+        self.applied_domains = {}
+        self.started_at = None
+        self.time_to_ready_ms = None
+        self.last_reload_ms = None
+        self.last_reload_method = None
+        self.reloads = 0
+
+    def ensure_binary(self):
+        if self.caddy_path:
+            return self.caddy_path
+        bins_folder = os.path.join(self.data_dir, 'bins')
+        os.makedirs(bins_folder, exist_ok=True)
+        path = os.path.join(bins_folder, 'caddy.exe' if platform.system() == 'Windows' else 'caddy')
+        if not binary_is_current(path, self.caddy_version):
+            # Only installs and version checks download, so other starts never import the fetcher or requests
+            from caddy_fetcher import CaddyInstaller
+            version = CaddyInstaller(path, os.path.join(self.data_dir, 'cache', 'caddy'), self.caddy_version).install()
+            print(f"Using Caddy {version}")
+        self.caddy_path = path
+        return path
+
+    def generate_config(self):
+        domains = dict(self.config_manager.get_domains())
+        content, content_hash = self.config_compiler.render(domains)
+        config_path = os.path.join(self.data_dir, self.config_compiler.filename)
+        self.config_compiler.write(config_path, content, content_hash)
+        return config_path, content, content_hash, domains
+
+    def readiness_ports(self, domains):
+        ports = [int(self.admin.address.rsplit(':', 1)[1])]
+        if domains:
+            ports.append(443)
+        return ports
+
+    def start(self):
+        """Start Caddy and block until it is ready; returns the time that took in ms."""
+        with self.lock:
+            caddy_path = self.ensure_binary()
+            config_path, _, content_hash, domains = self.generate_config()
+            self.ready_event.clear()
+            try:
+                self.caddy_process = subprocess.Popen(
+                    [caddy_path, 'run', '--config', config_path],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+            except (OSError, subprocess.SubprocessError) as e:
+                raise CaddyStartupError(f"Failed to start Caddy: {str(e)}")
+
+            self.applied_hash = content_hash
+            self.applied_domains = domains
+            self.started_at = time.time()
+            self.log_pipeline = CaddyLogPipeline(self.caddy_process)
+            self.log_pipeline.subscribe(self.on_log_batch)
+            self.log_pipeline.start()
+
+            try:
+                elapsed = wait_until_ready(
+                    self.caddy_process,
+                    self.readiness_ports(domains),
+                    deadline=self.startup_timeout,
+                    ready_event=self.ready_event,
+                )
+            except CaddyStartupError as e:
+                pipeline = self.log_pipeline
+                self.stop()  # Drains the pipes, so the tail includes Caddy's last words
+                tail = pipeline.buffer.tail(20)
+                raise CaddyStartupError('\n'.join([str(e)] + [format_record(record) for record in tail]))
+
+            self.time_to_ready_ms = elapsed * 1000
+            self.sync_hosts(domains)
+            return self.time_to_ready_ms
+
+    def stop(self):
+        with self.lock:
+            if self.caddy_process is None:
+                return
+            self.caddy_process.terminate()
+            try:
+                self.caddy_process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.caddy_process.kill()
+                self.caddy_process.wait()
+            # The pipes are at EOF now, so the pipeline finishes promptly
+            if self.log_pipeline is not None:
+                self.log_pipeline.stop()
+            self.caddy_process = None
+
+    def is_running(self):
+        return self.caddy_process is not None and self.caddy_process.poll() is None
+
+    def on_log_batch(self, records):
+        if not self.ready_event.is_set() and any(READY_LOG_MARKER in record.message for record in records):
+            self.ready_event.set()
+        if self.echo_logs:
+            for record in records:
+                print(format_record(record))
+
+    def sync_hosts(self, domains):
+        if self.hosts_manager is not None:
+            # The hosts file has no wildcards; those patterns need a DNS resolver instead
+            self.hosts_manager.set_domains([domain for domain in domains if '*' not in domain])
+
+    def reload(self):
+        """Push the current config into Caddy, starting it if it is not running."""
+        with self.lock:
+            if not self.is_running():
+                self.stop()
+                return {'method': 'start', 'ms': self.start()}
+
+            config_path, content, content_hash, domains = self.generate_config()
+            if content_hash == self.applied_hash:
+                return {'method': 'unchanged', 'ms': 0.0}
+
+            try:
+                elapsed_ms, method = self.push_config(content, domains)
+            except CaddyAdminError as admin_error:
+                try:
+                    elapsed_ms = timed(reload_with_cli, self.caddy_path, config_path, self.admin.address)
+                    method = 'caddy reload'
+                except (CaddyAdminError, OSError, subprocess.SubprocessError) as e:
+                    raise CaddyAdminError(f"Failed to reload Caddy: {str(admin_error)}; fallback failed: {str(e)}")
+
+            self.applied_hash = content_hash
+            self.applied_domains = domains
+            self.last_reload_ms = elapsed_ms
+            self.last_reload_method = method
+            self.reloads += 1
+            self.sync_hosts(domains)
+            return {'method': method, 'ms': elapsed_ms}
+
+    def push_config(self, content, domains):
+        patches = None
+        if self.config_compiler.fmt == 'json':
+            patches = self.config_compiler.route_patches(self.applied_domains, domains)
+
+        if patches:
+            def apply_patches():
+                for method, path, body in patches:
+                    self.admin.apply(method, path, body)
+            return timed(apply_patches), f'admin API ({len(patches)} route patches)'
+        if self.config_compiler.fmt == 'json':
+            return timed(self.admin.load_json, content), 'admin API'
+        return timed(self.admin.load_caddyfile, content), 'admin API'
+
+    def dispatch(self, request):
+        handler = getattr(self, f"command_{request.get('command')}", None)
+        if handler is None:
+            raise ValueError(f"unknown command '{request.get('command')}'")
+        arguments = {name: value for name, value in request.items() if name != 'command'}
+        return handler(**arguments)
+
+    def command_ping(self):
+        return 'pong'
+
+    def command_add(self, domain, target):
+        parse_target(target)
+        self.config_manager.add_domain(domain, target)
+        return self.reload()
+
+    def command_remove(self, domain):
+        if domain not in self.config_manager.get_domains():
+            raise ValueError(f"'{domain}' is not configured")
+        self.config_manager.remove_domain(domain)
+        return self.reload()
+
+    def command_list(self):
+        return dict(self.config_manager.get_domains())
+
+    def command_reload(self):
+        return self.reload()
+
+    def command_status(self, health=False):
+        process = self.caddy_process
+        status = {
+            'running': self.is_running(),
+            'pid': process.pid if process is not None else None,
+            'exit_code': process.returncode if process is not None else None,
+            'uptime_s': time.time() - self.started_at if self.started_at and self.is_running() else None,
+            'time_to_ready_ms': self.time_to_ready_ms,
+            'domains': len(self.config_manager.get_domains()),
+            'config_version': self.config_manager.version,
+            'config_hash': self.applied_hash,
+            'admin': self.admin.address,
+            'reloads': self.reloads,
+            'last_reload_ms': self.last_reload_ms,
+            'last_reload_method': self.last_reload_method,
+        }
+        if health:
+            from health_checker import HealthChecker
+            results = HealthChecker().check_all(dict(self.config_manager.get_domains()), force=True)
+            status['health'] = {
+                domain: {name: result._asdict() for name, result in checks.items()}
+                for domain, checks in results.items()
+            }
+        return status
+
+    def command_logs(self, count=50):
+        if self.log_pipeline is None:
+            return []
+        return [format_record(record) for record in self.log_pipeline.buffer.tail(int(count))]
+
+    def command_stop(self):
+        self.stop_event.set()
+        return 'stopping'
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    """One JSON object per line in, one {'ok', 'result' or 'error'} line out."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = {'ok': True, 'result': self.server.caddy.dispatch(json.loads(line))}
+            except (ValueError, TypeError, KeyError, OSError, CaddyAdminError, CaddyStartupError) as e:
+                reply = {'ok': False, 'error': str(e)}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+
+def start_control_server(address, caddy):
+    """Serve the control socket on a background thread and return the server."""
+    if isinstance(address, str):
+        if os.path.exists(address):
+            try:
+                send_command(address, 'ping', timeout=1)
+            except DaemonUnavailable:
+                os.remove(address)  # Left behind by a daemon that did not shut down cleanly
+            else:
+                raise ControlError(f"A Wild Caddy daemon is already listening on {address}")
+        server = socketserver.ThreadingUnixStreamServer(address, ControlHandler)
+        os.chmod(address, 0o600)
+    else:
+        server = socketserver.ThreadingTCPServer(address, ControlHandler)
+    server.daemon_threads = True
+    server.caddy = caddy
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_daemon(args):
+    config_manager = ConfigManager()
+    hosts_manager = None
+    if args.manage_hosts:
+        from hosts_manager import HostsManager
+        hosts_manager = HostsManager()
+    daemon = HeadlessCaddy(
+        config_manager,
+        admin_address=args.admin,
+        caddy_path=args.caddy,
+        caddy_version=args.caddy_version,
+        config_format=args.format,
+        startup_timeout=args.startup_timeout,
+        hosts_manager=hosts_manager,
+        echo_logs=not args.quiet,
+    )
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: daemon.stop_event.set())
+
+    try:
+        elapsed_ms = daemon.start()
+        server = start_control_server(args.address, daemon)
+    except (CaddyStartupError, ControlError, OSError) as e:
+        daemon.stop()
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+    print(f"Caddy ready in {elapsed_ms:.0f} ms; control socket at {args.address}")
+    exit_code = 0
+    while not daemon.stop_event.wait(0.5):
+        if daemon.caddy_process is not None and daemon.caddy_process.poll() is not None:
+            print(f"Caddy exited with code {daemon.caddy_process.returncode}", file=sys.stderr)
+            exit_code = 1
+            break
+
+    server.shutdown()
+    server.server_close()
+    if isinstance(args.address, str) and os.path.exists(args.address):
+        os.remove(args.address)
+    daemon.stop()
+    config_manager.flush()
+    return exit_code
+
+
+def edit_offline(args):
+    """add/remove/list straight on the config file when no daemon is running."""
+    config_manager = ConfigManager(save_delay=0)
+    if args.command == 'add':
+        config_manager.add_domain(args.domain, args.target)
+    elif args.command == 'remove':
+        config_manager.remove_domain(args.domain)
+    return dict(config_manager.get_domains())
+
+
+def print_result(command, result):
+    if command == 'list':
+        for domain, target in sorted(result.items()):
+            print(f"{domain} -> {describe_target(target)}")
+    elif command == 'logs':
+        for line in result:
+            print(line)
+    elif command in ('add', 'remove', 'reload') and result['method'] == 'unchanged':
+        print("Config unchanged; reload skipped")
+    elif command in ('add', 'remove', 'reload'):
+        print(f"Applied via {result['method']} in {result['ms']:.1f} ms")
+    elif isinstance(result, dict):
+        print(json.dumps(result, indent=2))
+    else:
+        print(result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='headless.py', description="Run and control Wild Caddy without the GUI.")
+    parser.add_argument('--control', help="control socket path or host:port (default: in the data directory)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help="start Caddy and serve the control socket until stopped")
+    run.add_argument('--admin', default=DEFAULT_ADMIN_ADDRESS, help="Caddy admin API address")
+    run.add_argument('--caddy', help="use this Caddy binary instead of the managed download")
+    run.add_argument('--caddy-version', default='latest')
+    run.add_argument('--format', choices=('json', 'caddyfile'), default='json')
+    run.add_argument('--startup-timeout', type=float, default=15.0)
+    run.add_argument('--manage-hosts', action='store_true', help="keep the hosts file in step with the domains")
+    run.add_argument('--quiet', action='store_true', help="do not echo Caddy's log")
+
+    add = subparsers.add_parser('add', help="add or update a domain")
+    add.add_argument('domain')
+    add.add_argument('upstreams', nargs='+', help="one or more upstream URLs")
+    add.add_argument('--policy', choices=POLICIES, default='round_robin')
+    add.add_argument('--key', help="header or cookie name for the header/cookie policies")
+
+    remove = subparsers.add_parser('remove', help="remove a domain")
+    remove.add_argument('domain')
+
+    subparsers.add_parser('list', help="list the configured domains")
+    subparsers.add_parser('reload', help="re-render the config and push it to Caddy")
+    status = subparsers.add_parser('status', help="show the daemon and Caddy state")
+    status.add_argument('--health', action='store_true', help="also probe every domain and upstream")
+    logs = subparsers.add_parser('logs', help="show Caddy's most recent log lines")
+    logs.add_argument('-n', '--count', type=int, default=50)
+    subparsers.add_parser('stop', help="stop Caddy and the daemon")
+
+    args = parser.parse_args(argv)
+    args.address = parse_control_address(args.control)
+
+    if args.command == 'run':
+        return run_daemon(args)
+
+    arguments = {}
+    if args.command == 'add':
+        args.target = make_target(args.upstreams, args.policy, args.key)
+        try:
+            parse_target(args.target)
+        except ValueError as e:
+            parser.error(str(e))
+        arguments = {'domain': args.domain, 'target': args.target}
+    elif args.command == 'remove':
+        arguments = {'domain': args.domain}
+    elif args.command == 'status':
+        arguments = {'health': args.health}
+    elif args.command == 'logs':
+        arguments = {'count': args.count}
+
+    try:
+        result = send_command(args.address, args.command, **arguments)
+    except DaemonUnavailable as e:
+        if args.command not in ('add', 'remove', 'list'):
+            print(f"Error: {str(e)}", file=sys.stderr)
+            return 1
+        # No daemon: edit the config file directly; the next `run` picks it up
+        print_result('list', edit_offline(args))
+        return 0
+    except ControlError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    print_result(args.command, result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import urllib3
+
+from load_balancer import parse_target
+
+HealthResult = namedtuple('HealthResult', ['url', 'ok', 'status', 'latency_ms', 'error', 'checked_at'])
+
+
+def upstream_url(target):
+    # Routes with several upstreams are probed through their first one
+    target = parse_target(target)[0][0]
+    if target.startswith('h2c://'):
+        # Probed over HTTP/1.1; requests has no HTTP/2 support
+        return 'http://' + target[len('h2c://'):]
+    return target if '://' in target else f'http://{target}'
+
+
+class HealthChecker:
+    """
+    Probes every configured domain (through Caddy over HTTPS) and its raw
+    upstream target concurrently, with at most `max_workers` probes in
+    flight. Results are cached for `ttl` seconds and the last
+    `history_size` results are kept per URL.
+    """
+
+    def __init__(self, max_workers=8, timeout=3, ttl=15, history_size=50):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='health')
+        self.timeout = timeout
+        self.ttl = ttl
+        self.history_size = history_size
+        self.cache = {}
+        self.history = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # Caddy serves its internal CA, so certificate warnings are expected
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    def _session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def probe(self, url):
+        start = time.perf_counter()
+        try:
+            response = self._session().get(url, timeout=self.timeout, verify=False, allow_redirects=False)
+            latency_ms = (time.perf_counter() - start) * 1000
+            result = HealthResult(url, response.status_code < 500, response.status_code, latency_ms, None, time.time())
+        except requests.RequestException as e:
+            latency_ms = (time.perf_counter() - start) * 1000
+            result = HealthResult(url, False, None, latency_ms, str(e), time.time())
+
+        with self.lock:
+            self.cache[url] = result
+            self.history.setdefault(url, deque(maxlen=self.history_size)).append(result)
+        return result
+
+    def cached(self, url):
+        with self.lock:
+            result = self.cache.get(url)
+        if result is not None and time.time() - result.checked_at < self.ttl:
+            return result
+        return None
+
+    def check_all(self, domains, force=False):
+        """
+        Check all `domains` ({domain: target}) and return
+        {domain: {'domain': HealthResult, 'upstream': HealthResult}}.
+        Fresh cached results are reused unless `force` is set.
+        """
+        urls = {}
+        for domain, target in domains.items():
+            urls[domain] = {'domain': f'https://{domain}', 'upstream': upstream_url(target)}
+
+        futures = {}
+        for endpoints in urls.values():
+            for url in endpoints.values():
+                if url in futures:
+                    continue
+                result = None if force else self.cached(url)
+                futures[url] = result if result is not None else self.executor.submit(self.probe, url)
+
+        results = {}
+        for domain, endpoints in urls.items():
+            results[domain] = {}
+            for kind, url in endpoints.items():
+                outcome = futures[url]
+                results[domain][kind] = outcome if isinstance(outcome, HealthResult) else outcome.result()
+        return results
+
+    def get_history(self, url):
+        with self.lock:
+            return list(self.history.get(url, ()))
+
+    def summary(self, url):
+        """Success rate and average latency over the kept history for one URL."""
+        history = self.get_history(url)
+        if not history:
+            return None, None
+        success_rate = sum(1 for result in history if result.ok) / len(history)
+        avg_latency = sum(result.latency_ms for result in history) / len(history)
+        return success_rate, avg_latency
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -1,13 +1,56 @@
 import os
+import subprocess
 import tempfile
-import shutil
+from contextlib import contextmanager
+from utils import atomic_write
+
+BEGIN_MARKER = '# BEGIN Wild Caddy managed block'
+END_MARKER = '# END Wild Caddy managed block'
+
+
+def split_managed_block(lines):
+    """Split hosts file lines into (before, block, after) around the managed block markers."""
+    try:
+        begin = lines.index(BEGIN_MARKER)
+        end = lines.index(END_MARKER, begin + 1)
+    except ValueError:
+        return lines, [], []
+    return lines[:begin], lines[begin + 1:end], lines[end + 1:]
+
 
 class HostsManager:
-    def __init__(self):
-        self.hosts_path = '/etc/hosts' if os.name != 'nt' else r'C:\Windows\System32\drivers\etc\hosts'
+    """
+    Keeps the managed domains in a single block between BEGIN/END markers in
+    the hosts file. Nothing outside the block is touched. The file is only
+    rewritten when the block actually changes, and changes made inside
+    batch() are written with one privileged operation.
+    """
+
+    def __init__(self, hosts_path=None, address='127.0.0.1'):
+        self.hosts_path = hosts_path or ('/etc/hosts' if os.name != 'nt' else r'C:\Windows\System32\drivers\etc\hosts')
         self.temp_hosts_path = os.path.join(tempfile.gettempdir(), 'temp_hosts')
+        self.address = address
         self.original_content = None
-        self.managed_domains = set()
+        self.batch_depth = 0
+        self.pending = False
+        self.write_count = 0
+        self.last_diff = ([], [])
+        # Start from the block a previous run left, so the first change does not forget it
+        self.managed_domains = self.read_managed_domains()
+
+    def read_managed_domains(self):
+        """Domains in the hosts file's managed block, or an empty set if there is none."""
+        try:
+            with open(self.hosts_path, 'r') as hosts_file:
+                lines = hosts_file.read().splitlines()
+        except OSError:
+            return set()
+        _, block, _ = split_managed_block(lines)
+        domains = set()
+        for line in block:
+            fields = line.split('#', 1)[0].split()
+            domains.update(fields[1:])
+        return domains
 
     def backup_hosts(self):
         with open(self.hosts_path, 'r') as hosts_file:
@@ -15,41 +58,105 @@ class HostsManager:
 
     def restore_hosts(self):
         if self.original_content is not None:
-            with open(self.hosts_path, 'w') as hosts_file:
-                hosts_file.write(self.original_content)
+            self.write_hosts(self.original_content)
 
     def add_domain(self, domain):
-        self.managed_domains.add(domain)
-        self.update_hosts()
+        self.add_domains([domain])
 
     def remove_domain(self, domain):
-        self.managed_domains.discard(domain)
+        self.remove_domains([domain])
+
+    def add_domains(self, domains):
+        self.managed_domains.update(domains)
+        self.update_hosts()
+
+    def remove_domains(self, domains):
+        self.managed_domains.difference_update(domains)
+        self.update_hosts()
+
+    def set_domains(self, domains):
+        self.managed_domains = set(domains)
         self.update_hosts()
 
+    @contextmanager
+    def batch(self):
+        """Defer hosts file writes until the outermost batch exits."""
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0 and self.pending:
+                self.update_hosts()
+
+    def render_block(self):
+        return [f'{self.address} {domain}' for domain in sorted(self.managed_domains)]
+
+    def render_hosts(self, content):
+        """Return (new_content, added_lines, removed_lines) for the current managed domains."""
+        before, old_block, after = split_managed_block(content.splitlines())
+        new_block = self.render_block()
+
+        # Drop entries written by older versions, which appended plain lines outside any block
+        legacy = {f'{self.address} {domain}' for domain in self.managed_domains}
+        before = [line for line in before if ' '.join(line.split()) not in legacy]
+        after = [line for line in after if ' '.join(line.split()) not in legacy]
+
+        old_set = set(old_block)
+        new_set = set(new_block)
+        added = [line for line in new_block if line not in old_set]
+        removed = [line for line in old_block if line not in new_set]
+
+        lines = before
+        if new_block:
+            lines = before + [BEGIN_MARKER] + new_block + [END_MARKER]
+        lines += after
+        return '\n'.join(lines) + '\n', added, removed
+
     def update_hosts(self):
+        """Write the managed block if it changed; returns True when the file was written."""
+        if self.batch_depth:
+            self.pending = True
+            return False
+        self.pending = False
+
         with open(self.hosts_path, 'r') as hosts_file:
-            content = hosts_file.readlines()
+            content = hosts_file.read()
 
-        with open(self.temp_hosts_path, 'w') as temp_file:
-            for line in content:
-                if not any(domain in line for domain in self.managed_domains):
-                    temp_file.write(line)
+        new_content, added, removed = self.render_hosts(content)
+        if new_content == content:
+            return False
+
+        self.last_diff = (added, removed)
+        self.write_hosts(new_content)
+        return True
 
-            for domain in self.managed_domains:
-                temp_file.write(f'127.0.0.1 {domain}\n')
+    def write_hosts(self, content):
+        self.write_count += 1
+        directory = os.path.dirname(self.hosts_path)
+        if os.access(self.hosts_path, os.W_OK) and os.access(directory, os.W_OK):
+            atomic_write(self.hosts_path, content)
+            return
 
         # Use elevated privileges to replace the hosts file
+        with open(self.temp_hosts_path, 'w') as temp_file:
+            temp_file.write(content)
+
         if os.name == 'nt':  # Windows
-            import ctypes
-            import win32con
-            MOVEFILE_DELAY_UNTIL_REBOOT = 0x4
-            ctypes.windll.kernel32.MoveFileExW(self.temp_hosts_path, self.hosts_path, MOVEFILE_DELAY_UNTIL_REBOOT)
+            # Needs an elevated process; there is no sudo to fall back on
+            os.replace(self.temp_hosts_path, self.hosts_path)
         else:  # macOS and Linux
-            os.system(f'sudo cp {self.temp_hosts_path} {self.hosts_path}')
+            # Copy next to the hosts file, then rename, so the swap is atomic
+            staged_path = self.hosts_path + '.wildcaddy'
+            subprocess.run(
+                ['sudo', 'sh', '-c', 'cp "$1" "$2" && chmod 644 "$2" && mv -f "$2" "$3"',
+                 'sh', self.temp_hosts_path, staged_path, self.hosts_path],
+                check=True,
+            )
 
     def __enter__(self):
         self.backup_hosts()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.restore_hosts()
\ No newline at end of file
+        self.restore_hosts()
@@ -0,0 +1,782 @@
+import asyncio
+import time
+from collections import deque
+from http import HTTPStatus
+from urllib.parse import unquote, urlsplit
+
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.errors import ErrorCodes
+from h2.events import (ConnectionTerminated, DataReceived, RemoteSettingsChanged, RequestReceived,
+                       ResponseReceived, StreamEnded, StreamReset, WindowUpdated)
+from h2.exceptions import ProtocolError
+from h2.settings import SettingCodes
+from multidict import CIMultiDict
+
+PREFACE = b'PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n'
+
+# Not allowed in HTTP/2 (RFC 9113 section 8.2.2); 'te' is only allowed as 'trailers'
+CONNECTION_HEADERS = frozenset([
+    'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'upgrade', 'te', 'host',
+])
+
+# The spec's initial window; larger windows are granted with SETTINGS and WINDOW_UPDATE
+DEFAULT_WINDOW = 65535
+
+
+def response_reason(status):
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ''
+
+
+class H2Body:
+    """
+    DATA received on one stream. Flow-control credit is handed back as the
+    consumer reads, so a reader that falls behind throttles the peer
+    instead of buffering without bound.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.chunks = deque()
+        self.total_bytes = 0
+        self.eof = False
+        self.error = None
+        self.waiter = None
+
+    def feed_data(self, data, flow_length):
+        self.total_bytes += len(data)
+        if data:
+            self.chunks.append((data, flow_length))
+            self._wake()
+        else:
+            # Padding only; nothing for the reader to take
+            self.stream.endpoint.acknowledge(self.stream.stream_id, flow_length)
+
+    def feed_eof(self):
+        self.eof = True
+        self._wake()
+
+    def set_exception(self, exc):
+        self.error = exc
+        self._wake()
+
+    def _wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    @property
+    def at_eof(self):
+        return self.eof and not self.chunks
+
+    async def readany(self):
+        while not self.chunks:
+            if self.error is not None:
+                raise self.error
+            if self.eof:
+                return b''
+            self.waiter = self.stream.endpoint.loop.create_future()
+            await self.waiter
+        data, flow_length = self.chunks.popleft()
+        self.stream.endpoint.acknowledge(self.stream.stream_id, flow_length)
+        return data
+
+    async def iter_chunked(self, n):
+        while True:
+            data = await self.readany()
+            if not data:
+                return
+            for start in range(0, len(data), n):
+                yield data[start:start + n]
+
+    async def read(self):
+        parts = []
+        while True:
+            data = await self.readany()
+            if not data:
+                return b''.join(parts)
+            parts.append(data)
+
+    def discard(self):
+        """Drop unread DATA, returning its credit to the connection window."""
+        while self.chunks:
+            _, flow_length = self.chunks.popleft()
+            self.stream.endpoint.acknowledge(self.stream.stream_id, flow_length)
+
+
+class H2Stream:
+    __slots__ = ('endpoint', 'stream_id', 'body', 'reset', 'window_waiter', 'headers_sent', 'task', 'response')
+
+    def __init__(self, endpoint, stream_id):
+        self.endpoint = endpoint
+        self.stream_id = stream_id
+        self.body = H2Body(self)
+        # Error code once either side reset the stream
+        self.reset = None
+        self.window_waiter = None
+        self.headers_sent = False
+        # Server side: the task handling the request; client side: a future for the response headers
+        self.task = None
+        self.response = None
+
+    def wake_window(self, exc=None):
+        waiter = self.window_waiter
+        if waiter is not None and not waiter.done():
+            if exc is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(exc)
+
+
+class H2Endpoint(asyncio.Protocol):
+    """
+    What both ends of an HTTP/2 connection share: feeding received bytes to
+    the h2 state machine, sends that respect the peer's flow-control
+    windows, and transport backpressure.
+    """
+
+    client_side = False
+
+    def __init__(self, window_size=1024 * 1024, max_concurrent_streams=128):
+        self.loop = asyncio.get_running_loop()
+        self.conn = H2Connection(H2Configuration(client_side=self.client_side, header_encoding='utf-8'))
+        self.window_size = window_size
+        self.max_concurrent_streams = max_concurrent_streams
+        self.transport = None
+        self.streams = {}
+        self.paused = False
+        self.drain_waiter = None
+        self.flush_handle = None
+        self.closed = False
+        self.streams_total = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        conn = self.conn
+        conn.initiate_connection()
+        conn.update_settings({
+            SettingCodes.INITIAL_WINDOW_SIZE: self.window_size,
+            SettingCodes.MAX_CONCURRENT_STREAMS: self.max_concurrent_streams,
+        })
+        if self.window_size > DEFAULT_WINDOW:
+            # SETTINGS only covers streams; the connection window has to be raised separately
+            conn.increment_flow_control_window(self.window_size - DEFAULT_WINDOW)
+        self.flush()
+
+    def data_received(self, data):
+        try:
+            events = self.conn.receive_data(data)
+        except ProtocolError:
+            # h2 has queued a GOAWAY with the reason
+            self.flush()
+            self.transport.close()
+            return
+        for event in events:
+            self.handle_event(event)
+        self.flush()
+
+    def handle_event(self, event):
+        if isinstance(event, DataReceived):
+            stream = self.streams.get(event.stream_id)
+            if stream is None:
+                self.acknowledge(event.stream_id, event.flow_controlled_length)
+            else:
+                stream.body.feed_data(event.data, event.flow_controlled_length)
+        elif isinstance(event, StreamEnded):
+            stream = self.streams.get(event.stream_id)
+            if stream is not None:
+                stream.body.feed_eof()
+        elif isinstance(event, StreamReset):
+            stream = self.streams.get(event.stream_id)
+            if stream is not None:
+                self.stream_reset(stream, event.error_code)
+        elif isinstance(event, WindowUpdated):
+            if event.stream_id:
+                stream = self.streams.get(event.stream_id)
+                if stream is not None:
+                    stream.wake_window()
+            else:
+                self.wake_windows()
+        elif isinstance(event, RemoteSettingsChanged):
+            # A new initial window size changes every stream's window at once
+            self.wake_windows()
+        elif isinstance(event, ConnectionTerminated):
+            self.connection_terminated(event)
+
+    def stream_reset(self, stream, error_code):
+        stream.reset = error_code
+        exc = ConnectionResetError(f"HTTP/2 stream {stream.stream_id} reset ({error_code!s})")
+        stream.body.set_exception(exc)
+        stream.wake_window(exc)
+        stream.body.discard()
+        self.streams.pop(stream.stream_id, None)
+
+    def connection_terminated(self, event):
+        self.transport.close()
+
+    def wake_windows(self):
+        for stream in self.streams.values():
+            stream.wake_window()
+
+    def acknowledge(self, stream_id, flow_length):
+        if flow_length and not self.closed:
+            self.conn.acknowledge_received_data(flow_length, stream_id)
+            self.flush_soon()
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        data = self.conn.data_to_send()
+        if data and not self.closed:
+            self.transport.write(data)
+
+    def flush_soon(self):
+        # Frames queued by many streams in one loop iteration go out in a single write
+        if self.flush_handle is None:
+            self.flush_handle = self.loop.call_soon(self.flush)
+
+    def send_headers(self, stream, headers, end_stream=False):
+        self.check_stream(stream)
+        self.conn.send_headers(stream.stream_id, headers, end_stream=end_stream)
+        stream.headers_sent = True
+        self.flush_soon()
+
+    async def send_data(self, stream, data, end_stream=False):
+        conn = self.conn
+        view = memoryview(data)
+        while view:
+            self.check_stream(stream)
+            size = min(conn.local_flow_control_window(stream.stream_id), conn.max_outbound_frame_size, len(view))
+            if size <= 0:
+                stream.window_waiter = self.loop.create_future()
+                await stream.window_waiter
+                continue
+            conn.send_data(stream.stream_id, view[:size], end_stream=end_stream and size == len(view))
+            view = view[size:]
+            self.flush()
+            if self.paused:
+                await self.drain()
+        if end_stream and not data:
+            self.check_stream(stream)
+            conn.end_stream(stream.stream_id)
+            self.flush_soon()
+
+    def check_stream(self, stream):
+        if self.closed:
+            raise ConnectionResetError("HTTP/2 connection closed")
+        if stream.reset is not None:
+            raise ConnectionResetError(f"HTTP/2 stream {stream.stream_id} reset ({stream.reset!s})")
+
+    def reset_stream(self, stream, error_code=ErrorCodes.CANCEL):
+        if stream.reset is None and not self.closed:
+            try:
+                self.conn.reset_stream(stream.stream_id, error_code)
+            except ProtocolError:
+                # Already closed on both sides
+                pass
+            self.flush_soon()
+        stream.reset = error_code
+        stream.body.discard()
+        self.streams.pop(stream.stream_id, None)
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        if self.drain_waiter is not None and not self.drain_waiter.done():
+            self.drain_waiter.set_result(None)
+
+    async def drain(self):
+        if self.closed:
+            raise ConnectionResetError("HTTP/2 connection closed")
+        if self.drain_waiter is None or self.drain_waiter.done():
+            self.drain_waiter = self.loop.create_future()
+        # Shared by every stream waiting to write; one being cancelled must not cancel the others
+        await asyncio.shield(self.drain_waiter)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        error = ConnectionResetError("HTTP/2 connection lost")
+        for stream in list(self.streams.values()):
+            stream.reset = ErrorCodes.CANCEL
+            stream.body.set_exception(error)
+            stream.wake_window(error)
+        if self.drain_waiter is not None and not self.drain_waiter.done():
+            self.drain_waiter.set_exception(error)
+            # Nobody may be waiting on it
+            self.drain_waiter.exception()
+
+    def close(self):
+        """Send GOAWAY and close the connection."""
+        if not self.closed:
+            self.conn.close_connection()
+            self.flush()
+            self.transport.close()
+
+
+class H2Request(dict):
+    """
+    The parts of aiohttp's web.Request that ProxyServer.handle uses, for one
+    HTTP/2 stream. Like web.Request it doubles as a mapping for
+    per-request state.
+    """
+
+    def __init__(self, stream, headers, body_exists):
+        super().__init__()
+        self.stream = stream
+        pseudo = {}
+        self.headers = CIMultiDict()
+        cookies = []
+        for name, value in headers:
+            if name.startswith(':'):
+                pseudo[name] = value
+            elif name == 'cookie':
+                # HTTP/2 may split cookies across fields; HTTP/1.1 upstreams expect one
+                cookies.append(value)
+            else:
+                self.headers.add(name, value)
+        if cookies:
+            self.headers['Cookie'] = '; '.join(cookies)
+        self.method = pseudo.get(':method', 'GET')
+        self.scheme = pseudo.get(':scheme', 'http')
+        self.path_qs = pseudo.get(':path', '/')
+        path, _, self.query_string = self.path_qs.partition('?')
+        self.path = unquote(path)
+        self.host = pseudo.get(':authority') or self.headers.get('Host', '')
+        if 'Host' not in self.headers:
+            self.headers['Host'] = self.host
+        self.body_exists = body_exists
+        self.content = stream.body
+        self.version = (2, 0)
+
+    @property
+    def transport(self):
+        return self.stream.endpoint.transport
+
+    @property
+    def remote(self):
+        peername = self.transport.get_extra_info('peername')
+        return peername[0] if peername else None
+
+    async def read(self):
+        return await self.content.read()
+
+    def new_stream_response(self, status=200, reason=None):
+        return H2StreamResponse(self.stream, status, reason)
+
+
+class H2StreamResponse(dict):
+    """Stands in for aiohttp's web.StreamResponse on an HTTP/2 stream."""
+
+    def __init__(self, stream, status=200, reason=None):
+        super().__init__()
+        self.stream = stream
+        self.status = status
+        self.reason = reason
+        self.headers = CIMultiDict()
+
+    @property
+    def content_length(self):
+        length = self.headers.get('Content-Length')
+        return int(length) if length is not None and length.isdigit() else None
+
+    def enable_chunked_encoding(self):
+        # DATA frames carry the body; there is no chunked encoding in HTTP/2
+        pass
+
+    async def prepare(self, request):
+        self.stream.endpoint.send_response_headers(self.stream, self.status, self.headers)
+
+    async def write(self, data):
+        await self.stream.endpoint.send_data(self.stream, data)
+
+    async def write_eof(self):
+        await self.stream.endpoint.send_data(self.stream, b'', end_stream=True)
+
+    def force_close(self):
+        self.stream.endpoint.reset_stream(self.stream, ErrorCodes.INTERNAL_ERROR)
+
+
+class H2ServerConnection(H2Endpoint):
+    """
+    Server side of an HTTP/2 connection. Every request stream runs
+    `handler` (ProxyServer.handle) in its own task, so one slow response
+    never holds up the others on the connection.
+    """
+
+    def __init__(self, handler, window_size=1024 * 1024, max_concurrent_streams=128, connections=None,
+                 counters=None):
+        super().__init__(window_size, max_concurrent_streams)
+        self.handler = handler
+        self.connections = connections
+        # Shared with the server so failures outlive the connection they happened on
+        self.counters = counters if counters is not None else {'failed_streams': 0}
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        if self.connections is not None:
+            self.connections.add(self)
+
+    def handle_event(self, event):
+        if isinstance(event, RequestReceived):
+            stream = self.streams[event.stream_id] = H2Stream(self, event.stream_id)
+            self.streams_total += 1
+            request = H2Request(stream, event.headers, event.stream_ended is None)
+            if event.stream_ended is not None:
+                stream.body.feed_eof()
+            stream.task = self.loop.create_task(self.run_stream(stream, request))
+        else:
+            super().handle_event(event)
+
+    def stream_reset(self, stream, error_code):
+        super().stream_reset(stream, error_code)
+        # The client gave up on it, e.g. a navigation away; stop the upstream request too
+        if stream.task is not None:
+            stream.task.cancel()
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        for stream in list(self.streams.values()):
+            if stream.task is not None:
+                stream.task.cancel()
+        self.streams.clear()
+        if self.connections is not None:
+            self.connections.discard(self)
+
+    async def run_stream(self, stream, request):
+        try:
+            response = await self.handler(request)
+            if not stream.headers_sent:
+                await self.send_response(stream, request, response)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self.counters['failed_streams'] += 1
+            self.reset_stream(stream, ErrorCodes.INTERNAL_ERROR)
+        finally:
+            stream.body.discard()
+            self.streams.pop(stream.stream_id, None)
+
+    def send_response_headers(self, stream, status, headers, end_stream=False, content_length=None):
+        fields = [(':status', str(status))]
+        for name, value in headers.items():
+            name = name.lower()
+            if name not in CONNECTION_HEADERS and name != 'content-length':
+                fields.append((name, value))
+        if content_length is None:
+            content_length = headers.get('Content-Length')
+        if content_length is not None:
+            fields.append(('content-length', str(content_length)))
+        self.send_headers(stream, fields, end_stream=end_stream)
+
+    async def send_response(self, stream, request, response):
+        """Send a complete aiohttp web.Response."""
+        body = response.body
+        if body is None:
+            body = b''
+        elif not isinstance(body, (bytes, bytearray, memoryview)):
+            # aiohttp wraps memoryview bodies, e.g. cache hits, in a BytesPayload
+            body = body._value
+        if request.method == 'HEAD' or response.status in (204, 304):
+            # No body on the wire; a HEAD keeps the length the GET would have had
+            length = response.headers.get('Content-Length', len(body)) if request.method == 'HEAD' else None
+            self.send_response_headers(stream, response.status, response.headers, True, length)
+            return
+        self.send_response_headers(stream, response.status, response.headers, not body, len(body))
+        if body:
+            await self.send_data(stream, body, end_stream=True)
+
+
+class HTTPListener(asyncio.Protocol):
+    """
+    Accepts a connection and hands it to HTTP/2 or to aiohttp's HTTP/1.1
+    handler: by ALPN on TLS connections, and on plain ones by whether the
+    client opens with the HTTP/2 preface (h2c with prior knowledge).
+    """
+
+    def __init__(self, http1_factory, http2_factory):
+        self.http1_factory = http1_factory
+        self.http2_factory = http2_factory
+        self.transport = None
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+        ssl_object = transport.get_extra_info('ssl_object')
+        if ssl_object is not None:
+            http2 = ssl_object.selected_alpn_protocol() == 'h2'
+            self.switch(self.http2_factory if http2 else self.http1_factory)
+
+    def data_received(self, data):
+        self.buffer += data
+        if len(self.buffer) < len(PREFACE) and PREFACE.startswith(self.buffer):
+            return
+        http2 = self.buffer.startswith(PREFACE)
+        self.switch(self.http2_factory if http2 else self.http1_factory, self.buffer)
+
+    def switch(self, factory, data=b''):
+        protocol = factory()
+        self.transport.set_protocol(protocol)
+        protocol.connection_made(self.transport)
+        if data:
+            protocol.data_received(data)
+
+    def eof_received(self):
+        # Closed before saying which protocol it speaks
+        return False
+
+    def connection_lost(self, exc):
+        pass
+
+
+class H2UpstreamResponse:
+    """The parts of aiohttp's ClientResponse the proxy reads, for one upstream HTTP/2 stream."""
+
+    def __init__(self, stream, headers):
+        self.stream = stream
+        self.headers = CIMultiDict()
+        self.status = 502
+        for name, value in headers:
+            if name == ':status':
+                self.status = int(value)
+            elif not name.startswith(':'):
+                self.headers.add(name, value)
+        self.reason = response_reason(self.status)
+        self.content = stream.body
+
+    @property
+    def content_length(self):
+        length = self.headers.get('Content-Length')
+        return int(length) if length is not None and length.isdigit() else None
+
+    async def read(self):
+        return await self.content.read()
+
+    async def text(self, encoding='utf-8'):
+        return (await self.read()).decode(encoding, 'replace')
+
+    def release(self):
+        stream = self.stream
+        if not stream.body.at_eof and stream.reset is None:
+            # Abandoned mid-body; the connection stays usable for other streams
+            stream.endpoint.reset_stream(stream, ErrorCodes.CANCEL)
+        stream.endpoint.stream_done(stream)
+
+
+class H2RequestContext:
+    """Like aiohttp's request context manager: await it, or use it with `async with`."""
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.response = None
+
+    def __await__(self):
+        return self.coro.__await__()
+
+    async def __aenter__(self):
+        self.response = await self.coro
+        return self.response
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.response.release()
+
+
+class H2UpstreamConnection(H2Endpoint):
+    """Client side of an h2c connection to one upstream, carrying many requests as concurrent streams."""
+
+    client_side = True
+
+    def __init__(self, pool, authority, window_size=1024 * 1024):
+        super().__init__(window_size, max_concurrent_streams=100)
+        self.pool = pool
+        self.authority = authority
+        self.goaway = False
+
+    @property
+    def available(self):
+        # h2's own open_outbound_streams walks every stream, so count the ones still in use here
+        return (not self.closed and not self.goaway
+                and len(self.streams) < self.conn.remote_settings.max_concurrent_streams)
+
+    def handle_event(self, event):
+        if isinstance(event, ResponseReceived):
+            stream = self.streams.get(event.stream_id)
+            if stream is not None and not stream.response.done():
+                stream.response.set_result(event.headers)
+        else:
+            # Interim responses and trailers have nothing for the proxy to relay
+            super().handle_event(event)
+
+    def stream_reset(self, stream, error_code):
+        super().stream_reset(stream, error_code)
+        if not stream.response.done():
+            stream.response.set_exception(ConnectionResetError(f"upstream reset the stream ({error_code!s})"))
+        self.pool.wake()
+
+    def connection_terminated(self, event):
+        self.goaway = True
+        for stream in list(self.streams.values()):
+            # Streams past the last one the upstream processed were never seen by it
+            if event.last_stream_id is not None and stream.stream_id > event.last_stream_id:
+                self.stream_reset(stream, ErrorCodes.REFUSED_STREAM)
+        if not self.streams:
+            self.transport.close()
+        self.pool.wake()
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        for stream in list(self.streams.values()):
+            if not stream.response.done():
+                stream.response.set_exception(ConnectionResetError("upstream connection lost"))
+        self.streams.clear()
+        self.pool.connection_lost(self)
+
+    def stream_done(self, stream):
+        self.streams.pop(stream.stream_id, None)
+        if self.goaway and not self.streams:
+            self.transport.close()
+        self.pool.wake()
+
+    async def request(self, method, path, headers, data, timing):
+        stream_id = self.conn.get_next_available_stream_id()
+        stream = self.streams[stream_id] = H2Stream(self, stream_id)
+        stream.response = self.loop.create_future()
+        self.streams_total += 1
+        authority = self.authority
+        fields = []
+        for name, value in headers.items():
+            name = name.lower()
+            if name == 'host':
+                authority = value
+            elif name not in CONNECTION_HEADERS and name != 'content-length':
+                fields.append((name, value))
+        fields[:0] = [(':method', method), (':scheme', 'http'), (':authority', authority), (':path', path)]
+        try:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                if data:
+                    fields.append(('content-length', str(len(data))))
+                self.send_headers(stream, fields, end_stream=not data)
+                if data:
+                    await self.send_data(stream, data, end_stream=True)
+            elif data is None:
+                self.send_headers(stream, fields, end_stream=True)
+            else:
+                self.send_headers(stream, fields)
+                async for chunk in data:
+                    await self.send_data(stream, chunk)
+                await self.send_data(stream, b'', end_stream=True)
+            headers = await stream.response
+        except BaseException:
+            self.reset_stream(stream, ErrorCodes.CANCEL)
+            self.stream_done(stream)
+            raise
+        if timing is not None:
+            timing.ttfb = time.perf_counter() - timing.request_start
+        return H2UpstreamResponse(stream, headers)
+
+
+class H2UpstreamPool:
+    """
+    h2c (HTTP/2 over cleartext, prior knowledge) connections to upstreams
+    given as h2c://host:port. Requests to one upstream are multiplexed as
+    streams over a single connection; another is opened, up to
+    `max_connections_per_host`, only once every existing one is at the
+    upstream's concurrent stream limit. Beyond that, requests queue.
+    """
+
+    def __init__(self, connect_timeout=10, max_connections_per_host=1, window_size=1024 * 1024):
+        self.connect_timeout = connect_timeout
+        self.max_connections_per_host = max_connections_per_host
+        self.window_size = window_size
+        # (host, port) -> [H2UpstreamConnection]
+        self.connections = {}
+        self.connecting = {}
+        self.waiter = None
+        self.created = 0
+        self.requests = 0
+
+    def request(self, method, url, headers=None, data=None, allow_redirects=False, trace_request_ctx=None, **kwargs):
+        # Redirects are always relayed as-is, like the aiohttp session is told to
+        return H2RequestContext(self._request(method, url, headers or {}, data, trace_request_ctx))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    async def _request(self, method, url, headers, data, timing):
+        parts = urlsplit(url)
+        path = url[len(f'{parts.scheme}://{parts.netloc}'):] or '/'
+        if timing is not None:
+            timing.request_start = time.perf_counter()
+        connection = await self.acquire(parts.hostname or 'localhost', parts.port or 80, timing)
+        self.requests += 1
+        return await connection.request(method, path, headers, data, timing)
+
+    async def acquire(self, host, port, timing):
+        key = (host, port)
+        while True:
+            connections = self.connections.setdefault(key, [])
+            for connection in connections:
+                if connection.available:
+                    return connection
+            if len(connections) + (key in self.connecting) < self.max_connections_per_host:
+                await self.connect(key, timing)
+                continue
+            if key in self.connecting:
+                # A burst of requests shares the connection being opened
+                await asyncio.shield(self.connecting[key])
+                continue
+            if self.waiter is None or self.waiter.done():
+                self.waiter = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self.waiter)
+
+    async def connect(self, key, timing):
+        loop = asyncio.get_running_loop()
+        future = self.connecting[key] = loop.create_future()
+        host, port = key
+        authority = host if port == 80 else f'{host}:{port}'
+        start = time.perf_counter()
+        try:
+            _, connection = await asyncio.wait_for(
+                loop.create_connection(lambda: H2UpstreamConnection(self, authority, self.window_size), host, port),
+                self.connect_timeout,
+            )
+        finally:
+            del self.connecting[key]
+            future.set_result(None)
+        self.created += 1
+        self.connections[key].append(connection)
+        if timing is not None:
+            timing.connect_start = start
+            timing.connect = time.perf_counter() - start
+
+    def connection_lost(self, connection):
+        for connections in self.connections.values():
+            if connection in connections:
+                connections.remove(connection)
+        self.wake()
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def close(self):
+        for connections in self.connections.values():
+            for connection in list(connections):
+                connection.close()
+        self.connections.clear()
+
+    def stats(self):
+        connections = [connection for group in self.connections.values() for connection in group]
+        return {
+            'connections': len(connections),
+            'active_streams': sum(len(connection.streams) for connection in connections),
+            'created': self.created,
+            'requests': self.requests,
+        }
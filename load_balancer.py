@@ -0,0 +1,161 @@
+import itertools
+import random
+import time
+import zlib
+from http.cookies import SimpleCookie
+
+# Policy names follow Caddy's lb_policy so one config drives both proxies
+POLICIES = ('round_robin', 'least_conn', 'random_choose', 'header', 'cookie')
+DEFAULT_POLICY = 'round_robin'
+
+# Upstream statuses counted as failures by passive health tracking
+UNHEALTHY_STATUSES = frozenset([502, 503, 504])
+
+
+def parse_target(target):
+    """
+    Normalize a route target into (upstreams, policy, key).
+
+    A target is either a single upstream string, or a dict such as
+    {'upstreams': ['http://127.0.0.1:3000', 'http://127.0.0.1:3001'],
+     'policy': 'header', 'key': 'X-User'}. `key` names the header or cookie
+    that the 'header' and 'cookie' policies hash on.
+    """
+    if isinstance(target, str):
+        return [target], DEFAULT_POLICY, None
+    upstreams = [upstream for upstream in target.get('upstreams', []) if upstream]
+    if not upstreams:
+        raise ValueError("a route needs at least one upstream")
+    policy = target.get('policy') or DEFAULT_POLICY
+    if policy not in POLICIES:
+        raise ValueError(f"unknown load balancing policy '{policy}'")
+    key = target.get('key')
+    if policy in ('header', 'cookie') and not key:
+        raise ValueError(f"the '{policy}' policy needs a key")
+    return upstreams, policy, key
+
+
+def make_target(upstreams, policy=DEFAULT_POLICY, key=None):
+    """Inverse of parse_target: keep single-upstream round-robin routes as plain strings."""
+    if len(upstreams) == 1 and policy == DEFAULT_POLICY:
+        return upstreams[0]
+    target = {'upstreams': list(upstreams), 'policy': policy}
+    if key:
+        target['key'] = key
+    return target
+
+
+def describe_target(target):
+    upstreams, policy, key = parse_target(target)
+    if len(upstreams) == 1 and isinstance(target, str):
+        return target
+    return f"{', '.join(upstreams)} ({policy}{' ' + key if key else ''})"
+
+
+class Upstream:
+    __slots__ = ('url', 'active', 'requests', 'failures', 'consecutive_failures', 'ejections', 'ejected_until')
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.active = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def stats(self, now):
+        return {
+            'url': self.url,
+            'active': self.active,
+            'requests': self.requests,
+            'failures': self.failures,
+            'ejections': self.ejections,
+            'ejected': self.ejected_until > now,
+        }
+
+
+class UpstreamGroup:
+    """
+    The upstreams of one route and the policy for choosing between them.
+
+    Passive health tracking: after `max_fails` consecutive failures
+    (connection errors or 502/503/504), an upstream is left out of
+    selection for `fail_timeout` seconds. If every upstream is ejected,
+    all of them are tried again rather than failing the request.
+    """
+
+    def __init__(self, upstreams, policy=DEFAULT_POLICY, key=None, max_fails=3, fail_timeout=10.0):
+        self.upstreams = [Upstream(url) for url in upstreams]
+        self.policy = policy
+        self.key = key
+        self.max_fails = max_fails
+        self.fail_timeout = fail_timeout
+        self.counter = itertools.count()
+        self.select_fn = getattr(self, f'_select_{policy}')
+
+    @classmethod
+    def from_target(cls, target, **kwargs):
+        upstreams, policy, key = parse_target(target)
+        return cls(upstreams, policy, key, **kwargs)
+
+    def available(self, now):
+        healthy = [upstream for upstream in self.upstreams if upstream.ejected_until <= now]
+        return healthy or self.upstreams
+
+    def select(self, request):
+        upstreams = self.available(time.monotonic())
+        if len(upstreams) == 1:
+            return upstreams[0]
+        return self.select_fn(upstreams, request)
+
+    def _select_round_robin(self, upstreams, request):
+        return upstreams[next(self.counter) % len(upstreams)]
+
+    def _select_least_conn(self, upstreams, request):
+        fewest = min(upstream.active for upstream in upstreams)
+        candidates = [upstream for upstream in upstreams if upstream.active == fewest]
+        return candidates[next(self.counter) % len(candidates)]
+
+    def _select_random_choose(self, upstreams, request):
+        first, second = random.sample(upstreams, 2)
+        return first if first.active <= second.active else second
+
+    def _select_header(self, upstreams, request):
+        return self._hash(upstreams, request.headers.get(self.key), request)
+
+    def _select_cookie(self, upstreams, request):
+        value = None
+        for header in request.headers.getall('Cookie', ()):
+            morsel = SimpleCookie(header).get(self.key)
+            if morsel is not None:
+                value = morsel.value
+                break
+        return self._hash(upstreams, value, request)
+
+    def _hash(self, upstreams, value, request):
+        if not value:
+            return self._select_round_robin(upstreams, request)
+        # Rendezvous hashing: losing an upstream only moves the keys that mapped to it
+        data = value.encode('utf-8', 'surrogateescape')
+        return max(upstreams, key=lambda upstream: zlib.crc32(upstream.url.encode('utf-8'), zlib.crc32(data)))
+
+    def acquire(self, upstream):
+        upstream.active += 1
+        upstream.requests += 1
+
+    def release(self, upstream, ok):
+        upstream.active -= 1
+        if ok:
+            upstream.consecutive_failures = 0
+            return
+        upstream.failures += 1
+        upstream.consecutive_failures += 1
+        if upstream.consecutive_failures >= self.max_fails:
+            upstream.consecutive_failures = 0
+            upstream.ejections += 1
+            upstream.ejected_until = time.monotonic() + self.fail_timeout
+
+    def stats(self):
+        now = time.monotonic()
+        return [upstream.stats(now) for upstream in self.upstreams]
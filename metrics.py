@@ -0,0 +1,380 @@
+import math
+import re
+import time
+from array import array
+
+# Log-linear buckets: exact up to 2*SUB_BUCKETS, then SUB_BUCKETS per power of two (~3% error)
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Values are microseconds; 2**36 us is about 19 hours
+MAX_VALUE_BITS = 36
+BUCKET_COUNT = (MAX_VALUE_BITS - SUB_BUCKET_BITS) * SUB_BUCKETS + 2 * SUB_BUCKETS
+
+# Bucket boundaries (seconds) used for the Prometheus exposition of the latency histograms
+PROMETHEUS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+
+
+def bucket_index(value):
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return min(shift * SUB_BUCKETS + (value >> shift), BUCKET_COUNT - 1)
+
+
+def bucket_bounds(index):
+    """Lowest and highest value counted in bucket `index`."""
+    if index < 2 * SUB_BUCKETS:
+        return index, index
+    shift = index // SUB_BUCKETS - 1
+    mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class Histogram:
+    """
+    HDR-style latency histogram over integer microseconds.
+
+    Counts live in one preallocated array, so recording is an index
+    computation and an increment with no allocation and no lock. It is
+    written from the proxy loop only. Readers on other threads take
+    `snapshot()` copies and may see a count a request or two behind.
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * BUCKET_COUNT))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def record_seconds(self, seconds):
+        self.record(seconds * 1000000)
+
+    def snapshot(self):
+        copy = Histogram.__new__(Histogram)
+        copy.counts = array('Q', self.counts)
+        copy.count = self.count
+        copy.total = self.total
+        copy.max = self.max
+        return copy
+
+    def merge(self, other):
+        counts = self.counts
+        for index, value in enumerate(other.counts):
+            if value:
+                counts[index] += value
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct):
+        """Value (microseconds) at or below which `pct` percent of recordings fall."""
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(pct / 100.0 * self.count))
+        seen = 0
+        for index, value in enumerate(self.counts):
+            if value:
+                seen += value
+                if seen >= rank:
+                    low, high = bucket_bounds(index)
+                    return min((low + high) // 2, self.max)
+        return self.max
+
+    def cumulative(self, bounds_us):
+        """Cumulative counts at or below each bound, for Prometheus 'le' buckets."""
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds_us:
+            last = bucket_index(int(bound))
+            while index <= last:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+
+class UpstreamTiming:
+    """Per-request timestamps filled in by the upstream pool's trace hooks."""
+
+    __slots__ = ('request_start', 'connect_start', 'connect', 'ttfb')
+
+    def __init__(self):
+        self.request_start = None
+        self.connect_start = None
+        self.connect = None
+        self.ttfb = None
+
+
+class RouteMetrics:
+    __slots__ = ('requests', 'statuses', 'bytes_in', 'bytes_out', 'connect', 'ttfb', 'total',
+                 'tunnels', 'tunnels_active', 'tunnels_idle_closed', 'tunnel_bytes')
+
+    def __init__(self):
+        self.requests = 0
+        self.statuses = [0] * len(STATUS_CLASSES)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.connect = Histogram()
+        self.ttfb = Histogram()
+        self.total = Histogram()
+        # Upgraded (e.g. WebSocket) connections; tunnel_bytes is [up, down], updated while they are open
+        self.tunnels = 0
+        self.tunnels_active = 0
+        self.tunnels_idle_closed = 0
+        self.tunnel_bytes = [0, 0]
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ProxyMetrics:
+    """Per-route counters and latency histograms for the Python proxy."""
+
+    def __init__(self, prefix='wildcaddy_proxy'):
+        self.prefix = prefix
+        self.routes = {}
+        self.started = time.time()
+        # coding -> [responses, bytes_in, bytes_out, cpu_seconds] for on-the-fly compression
+        self.compression = {}
+
+    def route(self, pattern):
+        metrics = self.routes.get(pattern)
+        if metrics is None:
+            metrics = self.routes[pattern] = RouteMetrics()
+        return metrics
+
+    def observe(self, pattern, status, bytes_in, bytes_out, total, timing=None):
+        metrics = self.route(pattern)
+        metrics.requests += 1
+        status_class = status // 100 - 1
+        if 0 <= status_class < len(STATUS_CLASSES):
+            metrics.statuses[status_class] += 1
+        metrics.bytes_in += bytes_in
+        metrics.bytes_out += bytes_out
+        metrics.total.record_seconds(total)
+        if timing is not None:
+            if timing.connect is not None:
+                metrics.connect.record_seconds(timing.connect)
+            if timing.ttfb is not None:
+                metrics.ttfb.record_seconds(timing.ttfb)
+
+    def tunnel_opened(self, pattern):
+        metrics = self.route(pattern)
+        metrics.tunnels += 1
+        metrics.tunnels_active += 1
+        return metrics
+
+    def tunnel_closed(self, pattern, reason):
+        metrics = self.route(pattern)
+        metrics.tunnels_active -= 1
+        if reason == 'idle':
+            metrics.tunnels_idle_closed += 1
+
+    def compressed(self, coding, bytes_in, bytes_out, cpu_seconds):
+        counters = self.compression.get(coding)
+        if counters is None:
+            counters = self.compression[coding] = [0, 0, 0, 0.0]
+        counters[0] += 1
+        counters[1] += bytes_in
+        counters[2] += bytes_out
+        counters[3] += cpu_seconds
+
+    def compression_summary(self):
+        """{coding: {'responses', 'bytes_in', 'bytes_out', 'ratio', 'cpu_ms', 'mb_per_cpu_s'}}"""
+        summary = {}
+        for coding, (responses, bytes_in, bytes_out, cpu) in list(self.compression.items()):
+            summary[coding] = {
+                'responses': responses,
+                'bytes_in': bytes_in,
+                'bytes_out': bytes_out,
+                'ratio': round(bytes_out / bytes_in, 4) if bytes_in else None,
+                'cpu_ms': round(cpu * 1000, 3),
+                'mb_per_cpu_s': round(bytes_in / cpu / 1e6, 2) if cpu else None,
+            }
+        return summary
+
+    def summary(self):
+        """{pattern: {'requests', 'p50_ms', 'p95_ms', 'p99_ms', ...}} from snapshots of the histograms."""
+        summary = {}
+        for pattern, metrics in list(self.routes.items()):
+            total = metrics.total.snapshot()
+            ttfb = metrics.ttfb.snapshot()
+            summary[pattern] = {
+                'requests': metrics.requests,
+                'statuses': dict(zip(STATUS_CLASSES, metrics.statuses)),
+                'bytes_in': metrics.bytes_in,
+                'bytes_out': metrics.bytes_out,
+                'p50_ms': total.percentile(50) / 1000,
+                'p95_ms': total.percentile(95) / 1000,
+                'p99_ms': total.percentile(99) / 1000,
+                'ttfb_p50_ms': ttfb.percentile(50) / 1000,
+                'ttfb_p99_ms': ttfb.percentile(99) / 1000,
+                'tunnels': metrics.tunnels,
+                'tunnels_active': metrics.tunnels_active,
+                'tunnel_bytes_up': metrics.tunnel_bytes[0],
+                'tunnel_bytes_down': metrics.tunnel_bytes[1],
+            }
+        return summary
+
+    def render_prometheus(self):
+        prefix = self.prefix
+        bounds_us = [bound * 1000000 for bound in PROMETHEUS_BUCKETS]
+        lines = [
+            f'# HELP {prefix}_requests_total Requests handled per route and status class.',
+            f'# TYPE {prefix}_requests_total counter',
+        ]
+        routes = list(self.routes.items())
+        for pattern, metrics in routes:
+            route = escape_label(pattern)
+            for status_class, count in zip(STATUS_CLASSES, metrics.statuses):
+                if count:
+                    lines.append(f'{prefix}_requests_total{{route="{route}",code="{status_class}"}} {count}')
+        for name, attr in (('request_bytes_total', 'bytes_in'), ('response_bytes_total', 'bytes_out')):
+            lines.append(f'# TYPE {prefix}_{name} counter')
+            for pattern, metrics in routes:
+                lines.append(f'{prefix}_{name}{{route="{escape_label(pattern)}"}} {getattr(metrics, attr)}')
+
+        compression = list(self.compression.items())
+        if compression:
+            lines.append(f'# HELP {prefix}_compressed_responses_total Responses compressed on the fly, per coding.')
+            lines.append(f'# TYPE {prefix}_compressed_responses_total counter')
+            for coding, counters in compression:
+                lines.append(f'{prefix}_compressed_responses_total{{encoding="{coding}"}} {counters[0]}')
+            lines.append(f'# TYPE {prefix}_compression_bytes_total counter')
+            for coding, counters in compression:
+                lines.append(f'{prefix}_compression_bytes_total{{encoding="{coding}",direction="in"}} {counters[1]}')
+                lines.append(f'{prefix}_compression_bytes_total{{encoding="{coding}",direction="out"}} {counters[2]}')
+            lines.append(f'# TYPE {prefix}_compression_cpu_seconds_total counter')
+            for coding, counters in compression:
+                lines.append(f'{prefix}_compression_cpu_seconds_total{{encoding="{coding}"}} {counters[3]:.6f}')
+
+        lines.append(f'# TYPE {prefix}_tunnels_active gauge')
+        for pattern, metrics in routes:
+            lines.append(f'{prefix}_tunnels_active{{route="{escape_label(pattern)}"}} {metrics.tunnels_active}')
+        for name, attr in (('tunnels_total', 'tunnels'), ('tunnels_idle_closed_total', 'tunnels_idle_closed')):
+            lines.append(f'# TYPE {prefix}_{name} counter')
+            for pattern, metrics in routes:
+                lines.append(f'{prefix}_{name}{{route="{escape_label(pattern)}"}} {getattr(metrics, attr)}')
+        lines.append(f'# TYPE {prefix}_tunnel_bytes_total counter')
+        for pattern, metrics in routes:
+            route = escape_label(pattern)
+            for direction, count in zip(('up', 'down'), metrics.tunnel_bytes):
+                lines.append(f'{prefix}_tunnel_bytes_total{{route="{route}",direction="{direction}"}} {count}')
+
+        for name, attr, help_text in (
+            ('upstream_connect_seconds', 'connect', 'Time to open a new upstream connection.'),
+            ('upstream_ttfb_seconds', 'ttfb', 'Time from sending the upstream request to its response headers.'),
+            ('request_duration_seconds', 'total', 'Total time to proxy a request, body included.'),
+        ):
+            metric = f'{prefix}_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} histogram')
+            for pattern, metrics in routes:
+                histogram = getattr(metrics, attr).snapshot()
+                route = escape_label(pattern)
+                for bound, count in zip(PROMETHEUS_BUCKETS, histogram.cumulative(bounds_us)):
+                    lines.append(f'{metric}_bucket{{route="{route}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{route="{route}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{route="{route}"}} {histogram.total / 1000000:.6f}')
+                lines.append(f'{metric}_count{{route="{route}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)')
+_LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_prometheus(text, names=None):
+    """Yield (name, labels, value) samples from Prometheus text format, optionally only for `names`."""
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = _SAMPLE_RE.match(line)
+        if match is None:
+            continue
+        name = match.group(1)
+        if names is not None and name not in names:
+            continue
+        labels = dict(_LABEL_RE.findall(match.group(2) or ''))
+        try:
+            value = float(match.group(3))
+        except ValueError:
+            continue
+        yield name, labels, value
+
+
+def caddy_host_buckets(text, metric='caddy_http_request_duration_seconds'):
+    """
+    Collapse Caddy's per-host request duration histogram into
+    {host: {le: cumulative count}}, summed over code, method and handler.
+    Needs `metrics.per_host` in Caddy's config.
+    """
+    hosts = {}
+    for _, labels, value in parse_prometheus(text, {metric + '_bucket'}):
+        host = labels.get('host')
+        if not host:
+            continue
+        le = float(labels.get('le', 'inf'))
+        buckets = hosts.setdefault(host, {})
+        buckets[le] = buckets.get(le, 0) + value
+    return hosts
+
+
+def bucket_delta(current, previous):
+    """Per-host bucket counts accumulated since the previous scrape."""
+    if not previous:
+        return current
+    delta = {}
+    for host, buckets in current.items():
+        before = previous.get(host, {})
+        delta[host] = {le: count - before.get(le, 0) for le, count in buckets.items()}
+    return delta
+
+
+def bucket_quantile(q, buckets):
+    """Prometheus histogram_quantile over {le: cumulative count}; seconds, or None without data."""
+    bounds = sorted(buckets.items())
+    if not bounds or bounds[-1][1] <= 0:
+        return None
+    total = bounds[-1][1]
+    rank = q * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound, count in bounds:
+        if count >= rank:
+            if math.isinf(bound):
+                return previous_bound
+            if count == previous_count:
+                return bound
+            return previous_bound + (bound - previous_bound) * (rank - previous_count) / (count - previous_count)
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def host_latency_summary(buckets_by_host, interval):
+    """{host: {'rps', 'p50_ms', 'p95_ms', 'p99_ms'}} for a window of bucket deltas."""
+    summary = {}
+    for host, buckets in buckets_by_host.items():
+        count = max(buckets.values()) if buckets else 0
+        if count <= 0:
+            continue
+        summary[host] = {'rps': count / interval if interval else 0.0}
+        for name, q in (('p50_ms', 0.5), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+            value = bucket_quantile(q, buckets)
+            summary[host][name] = value * 1000 if value is not None else None
+    return summary
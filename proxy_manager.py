@@ -2,69 +2,157 @@ import sys
 import os
 import subprocess
 import platform
-import requests
 import threading
 import time
 from PyQt6.QtWidgets import QApplication, QMessageBox
-from PyQt6.QtCore import QObject, pyqtSignal, QThread
-from gui.main_window import MainWindow
+from PyQt6.QtCore import QObject, pyqtSignal, QThread, QTimer
+from caddy_admin import CaddyAdminClient, CaddyAdminError, DEFAULT_ADMIN_ADDRESS, reload_with_cli, timed
+from caddy_config import CaddyConfigCompiler
+from caddy_fetcher import CaddyInstaller, DownloadError
+from caddy_log import CaddyLogPipeline, format_record
+from caddy_readiness import CaddyStartupError, READY_LOG_MARKER, wait_until_ready
 from config_manager import ConfigManager
+from health_checker import HealthChecker
 from hosts_manager import HostsManager
-from utils import get_data_dir
+from metrics import bucket_delta, caddy_host_buckets, host_latency_summary
+from utils import binary_is_current, get_data_dir
 
 class CaddyDownloader(QThread):
     progress = pyqtSignal(int)
     finished = pyqtSignal(str)
     error = pyqtSignal(str)
 
-    def __init__(self, url, local_path):
+    def __init__(self, local_path, cache_dir, version='latest', segments=4):
         super().__init__()
-        self.url = url
         self.local_path = local_path
+        self.installer = CaddyInstaller(local_path, cache_dir, version, segments, self.report_progress)
+        self.last_percent = None
+
+    def report_progress(self, downloaded, total):
+        # Without a Content-Length there is no percentage to show
+        percent = int(downloaded * 100 / total) if total else 0
+        if percent != self.last_percent:
+            self.last_percent = percent
+            self.progress.emit(min(percent, 99))
 
     def run(self):
         try:
-            response = requests.get(self.url, stream=True)
-            response.raise_for_status()
-
-            total_size = int(response.headers.get('content-length', 0))
-            block_size = 1024  # 1 KB
-            downloaded = 0
-
             self.progress.emit(0)  # Emit initial progress
 
-            with open(self.local_path, 'wb') as f:
-                for data in response.iter_content(block_size):
-                    f.write(data)
-                    downloaded += len(data)
-                    progress = int((downloaded / total_size) * 100)
-                    self.progress.emit(progress)
-
-            os.chmod(self.local_path, 0o755)  # Make the file executable
+            self.installer.install()
             self.progress.emit(100)  # Emit final progress
             self.finished.emit(self.local_path)
 
-        except requests.RequestException as e:
+        except (DownloadError, OSError) as e:
             self.error.emit(f"Failed to download Caddy: {str(e)}")
 
+class CaddyReadinessProbe(QThread):
+    ready = pyqtSignal(float)  # seconds until ready
+    failed = pyqtSignal(str)
+
+    def __init__(self, process, ports, deadline, ready_event):
+        super().__init__()
+        self.process = process
+        self.ports = ports
+        self.deadline = deadline
+        self.ready_event = ready_event
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        try:
+            elapsed = wait_until_ready(
+                self.process,
+                self.ports,
+                deadline=self.deadline,
+                ready_event=self.ready_event,
+                cancel_event=self.cancel_event,
+            )
+            self.ready.emit(elapsed)
+        except CaddyStartupError as e:
+            self.failed.emit(str(e))
+
+    def cancel(self):
+        self.cancel_event.set()
+
+class HealthCheckWorker(QThread):
+    results = pyqtSignal(dict)
+    upstreams = pyqtSignal(list)
+
+    def __init__(self, health_checker, domains, force, admin_address=None):
+        super().__init__()
+        self.health_checker = health_checker
+        self.domains = domains
+        self.force = force
+        self.admin_address = admin_address
+
+    def run(self):
+        self.results.emit(self.health_checker.check_all(self.domains, force=self.force))
+        if self.admin_address:
+            # Own client: requests sessions are not shared across threads
+            try:
+                self.upstreams.emit(CaddyAdminClient(self.admin_address, timeout=2).upstreams())
+            except CaddyAdminError:
+                pass
+
+class MetricsScrapeWorker(QThread):
+    scraped = pyqtSignal(float, dict)  # monotonic time, {host: {le: cumulative count}}
+
+    def __init__(self, admin_address):
+        super().__init__()
+        self.admin_address = admin_address
+
+    def run(self):
+        try:
+            text = CaddyAdminClient(self.admin_address, timeout=2).metrics()
+        except CaddyAdminError:
+            return
+        self.scraped.emit(time.monotonic(), caddy_host_buckets(text))
+
 class CaddyManager(QObject):
     caddy_started = pyqtSignal()
     caddy_stopped = pyqtSignal()
     caddy_error = pyqtSignal(str)
     caddy_download_progress = pyqtSignal(int)
     caddy_log = pyqtSignal(str)
+    caddy_log_batch = pyqtSignal(list)  # LogRecords parsed from Caddy's output
     caddy_status = pyqtSignal(bool, str)
+    caddy_reloaded = pyqtSignal(str, float)  # reload method, latency in ms
+    health_updated = pyqtSignal(dict)  # {domain: {'domain': HealthResult, 'upstream': HealthResult}}
+    upstreams_updated = pyqtSignal(list)  # Caddy's per-upstream counters from /reverse_proxy/upstreams
+    metrics_updated = pyqtSignal(dict)  # {host: {'rps', 'p50_ms', 'p95_ms', 'p99_ms'}} since the last scrape
     initialization_complete = pyqtSignal()  # New signal for initialization completion
 
-    def __init__(self, config_manager):
+    def __init__(self, config_manager, admin_address=DEFAULT_ADMIN_ADDRESS, startup_timeout=15.0,
+                 health_interval=30, caddy_version='latest', config_format='json', metrics_interval=2):
         super().__init__()
         self.config_manager = config_manager
         self.caddy_process = None
         self.data_dir = get_data_dir()
         self.bins_folder = os.path.join(self.data_dir, 'bins')
         self.caddy_path = None
-        self.log_thread = None
-        self.stop_log_thread = False
+        self.caddy_version = caddy_version
+        self.log_pipeline = None
+        self.admin = CaddyAdminClient(admin_address)
+        self.config_compiler = CaddyConfigCompiler(admin_address, fmt=config_format)
+        self.applied_hash = None
+        self.applied_domains = {}
+        self.last_reload_ms = None
+        self.startup_timeout = startup_timeout
+        self.startup_probe = None
+        self.ready_event = threading.Event()
+        self.time_to_ready_ms = None
+        self.health_checker = HealthChecker()
+        self.health_worker = None
+        self.status_requested = False
+        self.health_timer = QTimer(self)
+        self.health_timer.setInterval(health_interval * 1000)
+        self.health_timer.timeout.connect(self.refresh_health)
+        # Caddy's metrics are only scraped while someone is looking at them
+        self.metrics_worker = None
+        self.metrics_previous = None
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.setInterval(int(metrics_interval * 1000))
+        self.metrics_timer.timeout.connect(self.scrape_metrics)
 
     def initialize(self):
         if not os.path.exists(self.bins_folder):
@@ -73,27 +161,16 @@ class CaddyManager(QObject):
         caddy_filename = 'caddy.exe' if platform.system() == 'Windows' else 'caddy'
         self.caddy_path = os.path.join(self.bins_folder, caddy_filename)
 
-        if not os.path.exists(self.caddy_path):
+        # Installed for another version, or 'latest' not checked for a day
+        if not binary_is_current(self.caddy_path, self.caddy_version):
             self.download_caddy()
         else:
             self.caddy_download_progress.emit(100)
             self.start_caddy()
 
     def download_caddy(self):
-        system = platform.system().lower()
-        machine = platform.machine().lower()
-
-        if system == 'darwin':
-            url = f'https://caddyserver.com/api/download?os=darwin&arch={machine}'
-        elif system == 'windows':
-            url = f'https://caddyserver.com/api/download?os=windows&arch={machine}'
-        elif system == 'linux':
-            url = f'https://caddyserver.com/api/download?os=linux&arch={machine}'
-        else:
-            self.caddy_error.emit(f"Unsupported operating system: {system}")
-            return
-
-        self.downloader = CaddyDownloader(url, self.caddy_path)
+        self.downloader = CaddyDownloader(self.caddy_path, os.path.join(self.data_dir, 'cache', 'caddy'),
+                                          self.caddy_version)
         self.downloader.progress.connect(self.caddy_download_progress)
         self.downloader.finished.connect(self.on_download_finished)
         self.downloader.error.connect(self.caddy_error)
@@ -103,105 +180,158 @@ class CaddyManager(QObject):
         self.caddy_path = path
         self.start_caddy()
 
-    def generate_caddyfile(self):
-        caddyfile_content = """
-{
-    admin off
-    local_certs
-}
-"""
-        for domain, target in self.config_manager.get_domains().items():
-            caddyfile_content += f"""
-{domain} {{
-    tls internal
-    reverse_proxy {target}
-}}
-"""
-        caddyfile_path = os.path.join(self.data_dir, 'Caddyfile')
-        with open(caddyfile_path, 'w') as f:
-            f.write(caddyfile_content)
-        return caddyfile_path
+    def generate_config(self):
+        """Render the config and write it only if its content hash changed."""
+        domains = dict(self.config_manager.get_domains())
+        content, content_hash = self.config_compiler.render(domains)
+        config_path = os.path.join(self.data_dir, self.config_compiler.filename)
+        self.config_compiler.write(config_path, content, content_hash)
+        return config_path, content, content_hash, domains
 
     def start_caddy(self):
         if self.caddy_path is None:
             self.caddy_error.emit("Cannot start Caddy: executable not found.")
+            self.initialization_complete.emit()
             return
 
-        caddyfile_path = self.generate_caddyfile()
+        config_path, _, content_hash, domains = self.generate_config()
         try:
+            self.ready_event.clear()
             self.caddy_process = subprocess.Popen(
-                [self.caddy_path, 'run', '--config', caddyfile_path],
+                [self.caddy_path, 'run', '--config', config_path],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                universal_newlines=True
             )
-            # Wait a short time to check for immediate failures
-            time.sleep(2)
-            if self.caddy_process.poll() is not None:
-                # Caddy stopped immediately, probably due to an error
-                stdout, stderr = self.caddy_process.communicate()
-                error_message = f"Caddy failed to start. Exit code: {self.caddy_process.returncode}\n"
-                if stdout:
-                    error_message += f"Stdout: {stdout}\n"
-                if stderr:
-                    error_message += f"Stderr: {stderr}"
-                self.caddy_error.emit(error_message)
-            else:
-                self.caddy_started.emit()
-                self.start_log_thread()
-        except subprocess.SubprocessError as e:
+        except (OSError, subprocess.SubprocessError) as e:
             self.caddy_error.emit(f"Failed to start Caddy: {str(e)}")
-        finally:
-            self.initialization_complete.emit()  # Signal that initialization is complete
+            self.initialization_complete.emit()
+            return
+
+        self.applied_hash = content_hash
+        self.applied_domains = domains
+
+        # Drain the pipes right away so Caddy never blocks on a full pipe
+        self.start_log_pipeline()
+
+        # Probe readiness off the GUI thread; signals are emitted when it resolves
+        self.startup_probe = CaddyReadinessProbe(
+            self.caddy_process, self.readiness_ports(), self.startup_timeout, self.ready_event
+        )
+        self.startup_probe.ready.connect(self.on_caddy_ready)
+        self.startup_probe.failed.connect(self.on_caddy_start_failed)
+        self.startup_probe.start()
+
+    def readiness_ports(self):
+        ports = [int(self.admin.address.rsplit(':', 1)[1])]
+        if self.config_manager.get_domains():
+            ports.append(443)
+        return ports
+
+    def on_caddy_ready(self, elapsed):
+        self.time_to_ready_ms = elapsed * 1000
+        self.caddy_log.emit(f"Caddy ready in {self.time_to_ready_ms:.0f} ms")
+        self.caddy_started.emit()
+        self.health_timer.start()
+        self.initialization_complete.emit()
+
+    def on_caddy_start_failed(self, reason):
+        error_message = f"Caddy failed to start: {reason}\n"
+        if self.caddy_process is not None and self.caddy_process.poll() is not None:
+            # The process is gone, so the pipeline drains the pipes to EOF
+            error_message += f"Exit code: {self.caddy_process.returncode}\n"
+            if self.log_pipeline is not None:
+                self.log_pipeline.stop()
+                for record in self.log_pipeline.buffer.tail(20):
+                    error_message += f"{format_record(record)}\n"
+            self.caddy_process = None
+        self.caddy_error.emit(error_message)
+        self.initialization_complete.emit()
 
     def stop_caddy(self):
+        if self.startup_probe is not None:
+            self.startup_probe.cancel()
+            self.startup_probe.wait()
+            self.startup_probe = None
+
+        self.health_timer.stop()
+        self.metrics_previous = None
+
         if self.caddy_process:
-            print("Stopping Caddy process...")  # Debug information
-            self.stop_log_thread = True
-            
-            # Wait for the log thread to finish
-            if self.log_thread:
-                print("Waiting for log thread to finish...")  # Debug information
-                self.log_thread.join(timeout=5)  # Set a timeout of 5 seconds
-                
-            print("Terminating Caddy process...")  # Debug information
             self.caddy_process.terminate()  # Terminate the Caddy process
             self.caddy_process.wait()  # Wait for the process to exit
-            print("Caddy process terminated.")  # Debug information
+
+            # The pipes are at EOF now, so the pipeline finishes promptly
+            if self.log_pipeline is not None:
+                self.log_pipeline.stop()
             self.caddy_process = None
             self.caddy_stopped.emit()
 
+    def is_running(self):
+        return self.caddy_process is not None and self.caddy_process.poll() is None
 
     def reload_caddy(self):
+        """
+        Push the current config into the running Caddy process without
+        restarting it, so in-flight connections survive. Falls back to
+        `caddy reload`, and only starts Caddy if it is not running at all.
+        """
+        if not self.is_running():
+            self.start_caddy()
+            return
+
+        config_path, content, content_hash, domains = self.generate_config()
+        if content_hash == self.applied_hash:
+            self.caddy_log.emit("Caddy config unchanged; reload skipped")
+            return
+
+        try:
+            elapsed_ms, method = self.push_config(content, domains)
+        except CaddyAdminError as admin_error:
+            try:
+                elapsed_ms = timed(reload_with_cli, self.caddy_path, config_path, self.admin.address)
+                method = 'caddy reload'
+            except (CaddyAdminError, OSError, subprocess.SubprocessError) as e:
+                self.caddy_error.emit(f"Failed to reload Caddy: {str(admin_error)}; fallback failed: {str(e)}")
+                return
+
+        self.applied_hash = content_hash
+        self.applied_domains = domains
+        self.last_reload_ms = elapsed_ms
+        self.caddy_log.emit(f"Caddy config reloaded via {method} in {elapsed_ms:.1f} ms")
+        self.caddy_reloaded.emit(method, elapsed_ms)
+
+    def push_config(self, content, domains):
+        """Apply the new config through the admin API; returns (elapsed_ms, method)."""
+        patches = None
+        if self.config_compiler.fmt == 'json':
+            patches = self.config_compiler.route_patches(self.applied_domains, domains)
+
+        if patches:
+            def apply_patches():
+                for method, path, body in patches:
+                    self.admin.apply(method, path, body)
+            return timed(apply_patches), f'admin API ({len(patches)} route patches)'
+        if self.config_compiler.fmt == 'json':
+            return timed(self.admin.load_json, content), 'admin API'
+        return timed(self.admin.load_caddyfile, content), 'admin API'
+
+    def restart_caddy(self):
         try:
             self.stop_caddy()
             self.start_caddy()
         except Exception as e:
-            self.caddy_error.emit(f"Failed to reload Caddy: {str(e)}")
-
-    def start_log_thread(self):
-        self.stop_log_thread = False
-        self.log_thread = threading.Thread(target=self.log_output)
-        self.log_thread.start()
-
-    def log_output(self):
-        while not self.stop_log_thread:
-            if self.caddy_process is not None:
-                output = self.caddy_process.stdout.readline()
-                if output:  # Check if there is output
-                    self.caddy_log.emit(output.strip())
-
-                # Only read from stderr if the process is still running
-                if self.caddy_process.poll() is None:
-                    error = self.caddy_process.stderr.readline()
-                    if error:  # Check if there is an error
-                        self.caddy_log.emit(f"ERROR: {error.strip()}")
-                else:
-                    break  # Exit if the process has terminated
-            else:
-                break  # Exit if the process is None
+            self.caddy_error.emit(f"Failed to restart Caddy: {str(e)}")
 
+    def start_log_pipeline(self):
+        self.log_pipeline = CaddyLogPipeline(self.caddy_process)
+        self.log_pipeline.subscribe(self.on_log_batch)
+        self.log_pipeline.start()
 
+    def on_log_batch(self, records):
+        # Called on the pipeline thread; the signal hands the batch to the GUI thread
+        if not self.ready_event.is_set() and any(READY_LOG_MARKER in record.message for record in records):
+            self.ready_event.set()
+        self.caddy_log_batch.emit(records)
 
     def check_status(self):
         if not self.caddy_process:
@@ -212,28 +342,65 @@ class CaddyManager(QObject):
             self.caddy_status.emit(False, f"Caddy has stopped with return code {self.caddy_process.returncode}")
             return
 
-        # Check if Caddy is responding to any of the configured domains
-        domains = self.config_manager.get_domains().keys()
-        if not domains:
+        if not self.config_manager.get_domains():
             self.caddy_status.emit(False, "No domains configured")
             return
 
-        for domain in domains:
-            try:
-                response = requests.get(f"https://{domain}", timeout=5, verify=False)
-                if response.status_code == 200:
-                    self.caddy_status.emit(True, f"Caddy is running and responding to HTTPS requests for {domain}")
-                    return
-                else:
-                    self.caddy_status.emit(False, f"Caddy is running but returned status code {response.status_code} for {domain}")
-                    return
-            except requests.RequestException as e:
-                continue  # Try the next domain if this one fails
-
-        # If we've tried all domains and none worked
-        self.caddy_status.emit(False, "Caddy is running but not responding to any configured domains")
+        self.status_requested = True
+        self.refresh_health(force=True)
+
+    def refresh_health(self, force=False):
+        domains = self.config_manager.get_domains()
+        if not domains or (self.health_worker is not None and self.health_worker.isRunning()):
+            return
+        admin_address = self.admin.address if self.is_running() else None
+        self.health_worker = HealthCheckWorker(self.health_checker, dict(domains), force, admin_address)
+        self.health_worker.results.connect(self.on_health_results)
+        self.health_worker.upstreams.connect(self.upstreams_updated.emit)
+        self.health_worker.start()
+
+    def on_health_results(self, results):
+        self.health_updated.emit(results)
+        if not self.status_requested:
+            return
+        self.status_requested = False
+
+        responding = [domain for domain, result in results.items() if result['domain'].ok]
+        if len(responding) == len(results):
+            self.caddy_status.emit(True, f"Caddy is running and responding to HTTPS requests for all {len(results)} domains")
+        elif responding:
+            self.caddy_status.emit(False, f"Caddy is running and responding for {len(responding)} of {len(results)} domains")
+        else:
+            self.caddy_status.emit(False, "Caddy is running but not responding to any configured domains")
+
+    def set_metrics_active(self, active):
+        if active:
+            self.metrics_previous = None
+            self.scrape_metrics()
+            self.metrics_timer.start()
+        else:
+            self.metrics_timer.stop()
+
+    def scrape_metrics(self):
+        if not self.is_running() or (self.metrics_worker is not None and self.metrics_worker.isRunning()):
+            return
+        self.metrics_worker = MetricsScrapeWorker(self.admin.address)
+        self.metrics_worker.scraped.connect(self.on_metrics_scraped)
+        self.metrics_worker.start()
+
+    def on_metrics_scraped(self, now, buckets):
+        previous = self.metrics_previous
+        self.metrics_previous = (now, buckets)
+        if previous is None:
+            # Caddy's histograms are cumulative since start; rates need two scrapes
+            return
+        interval = now - previous[0]
+        self.metrics_updated.emit(host_latency_summary(bucket_delta(buckets, previous[1]), interval))
 
 def main():
+    # The main window pulls in every dialog; import it only once a GUI is actually wanted
+    from gui.main_window import MainWindow
+
     app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False)  # Prevent app from quitting when main window is closed
 
@@ -263,6 +430,7 @@ def main():
     exit_code = app.exec()
 
     caddy_manager.stop_caddy()
+    config_manager.flush()
     sys.exit(exit_code)
 
 if __name__ == "__main__":
@@ -1,67 +1,619 @@
 import asyncio
-from aiohttp import web, ClientSession, TCPConnector
+import time
+from urllib.parse import urlsplit
+from aiohttp import ClientConnectionError, ClientError, ClientTimeout, web
+from capture import TrafficCapture
+from certificates import CertificateStore
+from compression import Compressor
+from http2 import H2ServerConnection, H2UpstreamPool, HTTPListener
+from load_balancer import UNHEALTHY_STATUSES, UpstreamGroup
+from metrics import ProxyMetrics, UpstreamTiming
+from multidict import CIMultiDict
 from PyQt6.QtCore import QThread, pyqtSignal
+from response_cache import ResponseCache, etag_matches, parse_cache_control, parse_http_date
+from route_table import RouteTable
+from single_flight import SingleFlight
+from tunnel import Tunnel, is_upgrade_request, render_request_head
+from upstream_pool import UpstreamPool
+
+# Errors that mean the upstream is down or too slow; others are the proxy's or the client's doing
+UPSTREAM_FAILURES = (ClientConnectionError, ConnectionError, asyncio.TimeoutError)
+
+HOP_BY_HOP_HEADERS = frozenset([
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade',
+])
+
+
+def filter_hop_by_hop(headers):
+    """Copy headers, dropping hop-by-hop ones and any named in Connection."""
+    excluded = set(HOP_BY_HOP_HEADERS)
+    for value in headers.getall('Connection', ()):
+        excluded.update(token.strip().lower() for token in value.split(','))
+
+    filtered = CIMultiDict()
+    for name, value in headers.items():
+        if name.lower() not in excluded:
+            filtered.add(name, value)
+    return filtered
+
+
+def has_response_body(method, status):
+    return method != 'HEAD' and status >= 200 and status not in (204, 304)
+
+
+UNSAFE_METHODS = frozenset(['POST', 'PUT', 'DELETE', 'PATCH'])
+
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+# Request key holding the metrics.UpstreamTiming passed to the upstream pool's trace hooks
+TIMING_KEY = 'wildcaddy_timing'
+# Response key with the body bytes written by stream_response
+BODY_BYTES_KEY = 'wildcaddy_body_bytes'
+# Request key holding the capture.BodySample when bodies are captured
+SAMPLE_KEY = 'wildcaddy_body_sample'
+
+
+class UpgradeTail:
+    """Stands in for aiohttp's payload parser to collect what it buffered past an upgrade request."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def feed_data(self, data):
+        self.data += data
+        return False, b''
+
+    def feed_eof(self):
+        pass
+
 
 class ProxyServer(QThread):
     server_started = pyqtSignal()
 
-    def __init__(self):
+    def __init__(self, host='0.0.0.0', port=80, pool_limit=100, pool_limit_per_host=20,
+                 keepalive_timeout=30, dns_cache_ttl=300, streaming=True, stream_chunk_size=64 * 1024,
+                 cache_max_bytes=0, cache_max_entry_bytes=8 * 1024 * 1024, cache_default=True,
+                 coalesce=False, max_fails=3, fail_timeout=10.0, metrics_port=None,
+                 caddy_metrics_url=None, tunnel_idle_timeout=300.0, tunnel_buffer_size=64 * 1024,
+                 tunnel_handshake_timeout=30.0, http2=False, ssl_context=None, h2_max_concurrent_streams=128,
+                 h2_window_size=1024 * 1024, h2c_connections_per_host=1, compress=False, compress_min_size=1024,
+                 compress_types=None, compress_levels=None, compress_workers=None,
+                 compress_cache_max_bytes=32 * 1024 * 1024, tls=False, tls_dir=None, tls_max_contexts=256,
+                 capture_dir=None, capture_body_limit=0, capture_segment_bytes=64 * 1024 * 1024,
+                 capture_max_segments=None, capture_keep_credentials=False):
         super().__init__()
         self.app = web.Application()
         self.app.router.add_route('*', '/{path:.*}', self.handle)
-        self.routes = {}
+        self.route_table = RouteTable()
+        self.routes = self.route_table.routes
         self.loop = None
         self.runner = None
+        self.host = host
+        self.port = port
+        self.streaming = streaming
+        self.stream_chunk_size = stream_chunk_size
+        self.pool = UpstreamPool(
+            limit=pool_limit,
+            limit_per_host=pool_limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            dns_cache_ttl=dns_cache_ttl,
+        )
+        # Response caching is off unless given a size; routes can opt in or out individually
+        self.cache = ResponseCache(cache_max_bytes, cache_max_entry_bytes) if cache_max_bytes else None
+        self.cache_default = cache_default
+        self.cache_routes = {}
+        # Identical concurrent GET/HEADs share one upstream fetch
+        self.single_flight = SingleFlight(chunk_size=stream_chunk_size) if coalesce else None
+        # pattern -> (target, UpstreamGroup), rebuilt when a route's target changes
+        self.upstream_groups = {}
+        self.max_fails = max_fails
+        self.fail_timeout = fail_timeout
+        self.metrics = ProxyMetrics()
+        # br/zstd/gzip for clients that accept them, encoded off the event loop
+        self.compressor = Compressor(min_size=compress_min_size, types=compress_types, levels=compress_levels,
+                                     workers=compress_workers, cache_max_bytes=compress_cache_max_bytes,
+                                     metrics=self.metrics) if compress else None
+        # Prometheus endpoint on localhost; Caddy's own metrics are appended when a URL is given
+        self.metrics_port = metrics_port
+        self.caddy_metrics_url = caddy_metrics_url
+        self.metrics_runner = None
+        # Upgraded connections (WebSocket, dev server HMR) relayed as raw bytes
+        self.tunnels = set()
+        self.tunnel_idle_timeout = tunnel_idle_timeout
+        self.tunnel_buffer_size = tunnel_buffer_size
+        self.tunnel_handshake_timeout = tunnel_handshake_timeout
+        # HTTP/2 alongside HTTP/1.1 on the same port: h2c with prior knowledge, or h2 via ALPN when given TLS
+        self.http2 = http2
+        self.ssl_context = ssl_context
+        # HTTPS with certificates from a local CA, issued as routes are added and picked by SNI
+        self.certificates = None
+        if tls and ssl_context is None:
+            self.certificates = CertificateStore(tls_dir, tls_max_contexts,
+                                                 allow=lambda name: self.route_table.lookup_host(name) is not None)
+            self.ssl_context = self.certificates.server_context
+        self.h2_max_concurrent_streams = h2_max_concurrent_streams
+        self.h2_window_size = h2_window_size
+        self.h2_listener = None
+        self.h2_connections = set()
+        self.h2_counters = {'failed_streams': 0}
+        # Upstreams given as h2c://host:port share one multiplexed HTTP/2 connection each
+        self.h2c_pool = H2UpstreamPool(self.pool.connect_timeout, h2c_connections_per_host, h2_window_size)
+        # Opt-in record of proxied traffic for replay.py, written off the event loop
+        self.capture = TrafficCapture(capture_dir, capture_segment_bytes, capture_max_segments, capture_body_limit,
+                                      keep_credentials=capture_keep_credentials) if capture_dir else None
 
     async def handle(self, request):
-        host = request.headers.get('Host')
-        if host in self.routes:
-            target = self.routes[host]
-            url = f"{target}{request.path_qs}"
-            headers = dict(request.headers)
+        route = self.route_table.lookup(request.host, request.path)
+        if route is not None:
+            start = time.perf_counter()
+            timing = request[TIMING_KEY] = UpstreamTiming()
+            if self.capture is not None and self.capture.body_limit:
+                request[SAMPLE_KEY] = self.capture.sample()
+            group = self.upstream_group(route)
+            upstream = group.select(request)
+            url = f"{upstream.url}{request.path_qs}"
+            headers = filter_hop_by_hop(request.headers)
             headers.pop('Host', None)
 
-            async with ClientSession(connector=TCPConnector(ssl=False)) as session:
-                try:
-                    async with session.request(
-                            method=request.method,
-                            url=url,
-                            headers=headers,
-                            data=await request.read(),
-                            allow_redirects=False,
-                    ) as resp:
-                        headers = dict(resp.headers)
-                        headers.pop('Transfer-Encoding', None)
-
-                        return web.StreamResponse(
-                            status=resp.status,
-                            headers=headers
-                        ).send_headers(
-                        ).write(
-                            await resp.read()
-                        )
-                except Exception as e:
-                    return web.Response(text=f"Error: {str(e)}", status=500)
+            session = self.h2c_pool if upstream.url.startswith('h2c://') else await self.pool.start()
+            group.acquire(upstream)
+            response = None
+            upstream_failed = False
+            try:
+                response = await self.dispatch(request, session, url, headers, route)
+                return response
+            except Exception as e:
+                # A client hanging up mid-response raises connection errors too; that is not the upstream's fault
+                transport = request.transport
+                upstream_failed = (isinstance(e, UPSTREAM_FAILURES)
+                                   and transport is not None and not transport.is_closing())
+                response = web.Response(text=f"Error: {str(e)}", status=500)
+                return response
+            finally:
+                status = response.status if response is not None else 499
+                group.release(upstream, not upstream_failed and status not in UNHEALTHY_STATUSES)
+                elapsed = time.perf_counter() - start
+                # Streamed responses are complete here; buffered ones report their body size
+                bytes_out = response.get(BODY_BYTES_KEY, response.content_length or 0) if response is not None else 0
+                # A tunnel's lifetime is not a request latency; tunnels have their own metrics
+                if status != 101:
+                    self.metrics.observe(route.pattern, status, request.content.total_bytes, bytes_out, elapsed, timing)
+                if self.capture is not None:
+                    self.capture.record(request, route.pattern, upstream.url, status, response,
+                                        request.content.total_bytes, bytes_out, elapsed, request.get(SAMPLE_KEY))
         return web.Response(text="Not Found", status=404)
 
+    def upstream_group(self, route):
+        entry = self.upstream_groups.get(route.pattern)
+        if entry is None or entry[0] is not route.target:
+            group = UpstreamGroup.from_target(route.target, max_fails=self.max_fails, fail_timeout=self.fail_timeout)
+            entry = self.upstream_groups[route.pattern] = (route.target, group)
+        return entry[1]
+
+    async def dispatch(self, request, session, url, headers, route):
+        if is_upgrade_request(request):
+            return await self.forward_upgrade(request, url, headers, route)
+        if self.cache is not None and self.cache_enabled(route.pattern):
+            if self.cache.is_cacheable_request(request.method, request.headers):
+                return await self.forward_cached(request, session, url, headers)
+            if request.method in UNSAFE_METHODS:
+                self.cache.invalidate(self.cache.primary_key(request.host, request.path_qs))
+            self.cache.counters['bypassed'] += 1
+        if self.single_flight is not None and self.single_flight.is_eligible(request.method, request):
+            return await self.forward_coalesced(request, session, url, headers)
+        if self.streaming:
+            return await self.forward_streaming(request, session, url, headers)
+        return await self.forward_buffered(request, session, url, headers)
+
+    async def forward_buffered(self, request, session, url, headers):
+        held = self.compressed_copy(request, headers)
+        data = await request.read()
+        sample = request.get(SAMPLE_KEY)
+        if sample is not None:
+            sample.take_request(data)
+        async with session.request(
+                method=request.method,
+                url=url,
+                headers=headers,
+                data=data,
+                allow_redirects=False,
+                trace_request_ctx=request.get(TIMING_KEY),
+        ) as resp:
+            if held is not None and resp.status == 304:
+                return self.compressed_copy_response(request, held, resp)
+            headers = filter_hop_by_hop(resp.headers)
+            headers.pop('Content-Length', None)
+            return await self.buffered_response(request, resp.status, resp.reason, headers, await resp.read())
+
+    async def buffered_response(self, request, status, reason, headers, body):
+        """A complete response, compressed for clients that accept it."""
+        if self.compressor is not None:
+            coding = self.compressor.choose(request, status, headers)
+            if coding is not None:
+                headers, body = await self.compressor.encode_body(request, coding, headers, body)
+        sample = request.get(SAMPLE_KEY)
+        if sample is not None:
+            sample.take_response(body)
+        return web.Response(status=status, reason=reason, headers=headers, body=body)
+
+    def compressed_copy(self, request, headers):
+        """
+        A compressed copy of this URL held from an earlier response, if any.
+        The upstream request is made conditional on its ETag, so an
+        unchanged asset is neither transferred nor compressed again.
+        """
+        if self.compressor is None or request.method != 'GET' or request.body_exists:
+            return None
+        if 'Range' in request.headers or any(name in request.headers for name in CONDITIONAL_HEADERS):
+            # The client's own conditional or range request goes through untouched
+            return None
+        entry = self.compressor.held(request)
+        if entry is not None:
+            headers['If-None-Match'] = entry.etag
+        return entry
+
+    def compressed_copy_response(self, request, entry, resp):
+        """The held body under the upstream's 304 headers, which belong to this client's response."""
+        self.compressor.cache.counters['revalidated'] += 1
+        headers = filter_hop_by_hop(resp.headers)
+        headers.popall('Content-Length', None)
+        headers.setdefault('ETag', entry.etag)
+        headers = self.compressor.encoded_headers(headers, self.compressor.negotiate(request), entry.representation)
+        return web.Response(status=200, headers=headers, body=entry.body)
+
+    async def forward_streaming(self, request, session, url, headers):
+        # Request bodies without a Content-Length are re-chunked by the client
+        data = self.iter_request_body(request) if request.body_exists else None
+        held = self.compressed_copy(request, headers)
+
+        async with session.request(
+                method=request.method,
+                url=url,
+                headers=headers,
+                data=data,
+                allow_redirects=False,
+                trace_request_ctx=request.get(TIMING_KEY),
+        ) as resp:
+            if held is not None and resp.status == 304:
+                return self.compressed_copy_response(request, held, resp)
+            return await self.relay_response(request, resp)
+
+    async def relay_response(self, request, resp, head=()):
+        """Stream an upstream response to the client, starting with any chunks already read into `head`."""
+        async def chunks():
+            for chunk in head:
+                yield chunk
+            async for chunk in resp.content.iter_chunked(self.stream_chunk_size):
+                yield chunk
+
+        return await self.stream_response(request, resp.status, resp.reason, filter_hop_by_hop(resp.headers), chunks())
+
+    async def stream_response(self, request, status, reason, headers, chunks):
+        if self.compressor is not None:
+            coding = self.compressor.choose(request, status, headers)
+            if coding is not None:
+                headers, chunks = await self.compressor.encode_stream(request, coding, headers, chunks)
+        # HTTP/2 streams bring their own response type
+        new_response = getattr(request, 'new_stream_response', web.StreamResponse)
+        response = new_response(status=status, reason=reason)
+        response.headers.extend(headers)
+        if 'Content-Length' not in response.headers and has_response_body(request.method, status):
+            response.enable_chunked_encoding()
+        await response.prepare(request)
+
+        sent = 0
+        sample = request.get(SAMPLE_KEY)
+        try:
+            async for chunk in chunks:
+                # write() waits for the client transport to drain
+                await response.write(chunk)
+                sent += len(chunk)
+                if sample is not None:
+                    sample.take_response(chunk)
+        except Exception:
+            # Headers are already sent, so the only option left is to drop the connection
+            response.force_close()
+            raise
+        finally:
+            response[BODY_BYTES_KEY] = sent
+        await response.write_eof()
+        return response
+
+    async def forward_coalesced(self, request, session, url, headers):
+        key = self.single_flight.key(request.method, request.host, request.path_qs, request.headers)
+        flight, reader = self.single_flight.join(
+            key,
+            lambda: session.request(request.method, url, headers=headers, allow_redirects=False,
+                                    trace_request_ctx=request.get(TIMING_KEY)),
+            filter_hop_by_hop,
+        )
+        try:
+            status, reason, response_headers = await flight.wait_response()
+            return await self.stream_response(request, status, reason, response_headers, reader)
+        finally:
+            reader.close()
+
+    async def forward_upgrade(self, request, url, headers, route):
+        tunnel = Tunnel(route.pattern, url, self.tunnel_idle_timeout, self.tunnel_buffer_size,
+                        self.metrics.route(route.pattern).tunnel_bytes)
+        parts = urlsplit(url)
+        target = url[len(f'{parts.scheme}://{parts.netloc}'):] or '/'
+        upgraded = False
+        try:
+            host = await tunnel.connect(self.pool.connect_timeout)
+            head = render_request_head(request.method, target, host, headers, request.headers['Upgrade'])
+            status, reason, response_headers = await tunnel.handshake(head, self.tunnel_handshake_timeout)
+            if status != 101:
+                # Refused; relay the upstream's answer as an ordinary response
+                body = await tunnel.read_body(response_headers, has_response_body(request.method, status))
+                response_headers = filter_hop_by_hop(response_headers)
+                response_headers.popall('Content-Length', None)
+                return web.Response(status=status, reason=reason, headers=response_headers, body=body)
+            upgraded = True
+        except (OSError, ValueError, asyncio.TimeoutError) as e:
+            return web.Response(text=f"Bad Gateway: {str(e) or type(e).__name__}", status=502)
+        finally:
+            if not upgraded:
+                tunnel.close('refused')
+
+        response = web.StreamResponse(status=101, reason=reason)
+        response.headers.extend(filter_hop_by_hop(response_headers))
+        response.headers['Connection'] = 'Upgrade'
+        response.headers['Upgrade'] = response_headers.get('Upgrade', request.headers['Upgrade'])
+        self.tunnels.add(tunnel)
+        self.metrics.tunnel_opened(route.pattern)
+        try:
+            await response.prepare(request)
+            # Bytes the client sent after its request head belong to the new protocol
+            tail = UpgradeTail()
+            request.protocol.set_parser(tail)
+            tunnel.start(request.transport, bytes(tail.data))
+            await tunnel.closed
+        finally:
+            tunnel.close('shutdown')
+            self.tunnels.discard(tunnel)
+            self.metrics.tunnel_closed(route.pattern, tunnel.close_reason)
+        response.force_close()
+        return response
+
+    def get_tunnel_stats(self):
+        return [tunnel.stats() for tunnel in self.tunnels]
+
+    def get_coalesce_stats(self):
+        return self.single_flight.stats() if self.single_flight is not None else None
+
+    async def forward_cached(self, request, session, url, headers):
+        cache = self.cache
+        primary = cache.primary_key(request.host, request.path_qs)
+        entry = cache.lookup(primary, request.headers)
+        now = time.time()
+        if entry is not None and entry.is_fresh(now) and 'no-cache' not in parse_cache_control(request.headers):
+            cache.counters['hits'] += 1
+            return await self.cached_response(request, entry, now)
+
+        if entry is not None and entry.has_validators():
+            # Revalidate what we hold; the client's own validators are answered from the entry afterwards
+            for name in CONDITIONAL_HEADERS:
+                headers.popall(name, None)
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        else:
+            entry = None
+
+        async with session.get(url, headers=headers, allow_redirects=False,
+                               trace_request_ctx=request.get(TIMING_KEY)) as resp:
+            if resp.status == 304 and entry is not None:
+                cache.refresh(entry, filter_hop_by_hop(resp.headers))
+                return await self.cached_response(request, entry, time.time())
+
+            cache.counters['misses'] += 1
+            lifetime = cache.storable(resp.status, resp.headers)
+            length = resp.content_length
+            if lifetime is None or (length is not None and length > cache.max_entry_bytes):
+                return await self.relay_response(request, resp)
+
+            chunks = []
+            size = 0
+            async for chunk in resp.content.iter_chunked(self.stream_chunk_size):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > cache.max_entry_bytes:
+                    # Too big to keep after all; send what we have and stream the rest
+                    return await self.relay_response(request, resp, chunks)
+
+            entry = cache.store(primary, request.headers, resp.status, resp.reason,
+                                filter_hop_by_hop(resp.headers), b''.join(chunks), lifetime)
+            if entry is None:
+                return await self.relay_response(request, resp, chunks)
+            return await self.cached_response(request, entry, time.time())
+
+    async def cached_response(self, request, entry, now):
+        headers = CIMultiDict(entry.headers)
+        headers['Age'] = str(int(entry.age(now)))
+        if self.not_modified(request, entry):
+            for name in ('Content-Type', 'Content-Encoding'):
+                headers.popall(name, None)
+            return web.Response(status=304, headers=headers)
+        # Serve straight from the stored buffer
+        return await self.buffered_response(request, entry.status, entry.reason, headers, entry.view)
+
+    def not_modified(self, request, entry):
+        if entry.status != 200:
+            return False
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag_matches(if_none_match, entry.etag)
+        since = parse_http_date(request.headers.get('If-Modified-Since'))
+        modified = parse_http_date(entry.last_modified)
+        return since is not None and modified is not None and modified <= since
+
+    def cache_enabled(self, pattern):
+        return self.cache_routes.get(pattern, self.cache_default)
+
+    def set_route_cache(self, pattern, enabled):
+        """Turn response caching on or off for one route; None restores the default."""
+        if enabled is None:
+            self.cache_routes.pop(pattern, None)
+        else:
+            self.cache_routes[pattern] = bool(enabled)
+
+    def get_cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
+
+    def get_compression_stats(self):
+        if self.compressor is None:
+            return None
+        return {'encodings': self.metrics.compression_summary(), 'cache': self.compressor.stats()}
+
+    async def iter_request_body(self, request):
+        sample = request.get(SAMPLE_KEY)
+        async for chunk in request.content.iter_chunked(self.stream_chunk_size):
+            if sample is not None:
+                sample.take_request(chunk)
+            yield chunk
+
+    def clear_caches(self):
+        # Stored responses may come from an old target
+        if self.cache is not None:
+            self.cache.clear()
+        if self.compressor is not None and self.compressor.cache is not None:
+            self.compressor.cache.clear()
+
     def add_route(self, domain, target):
-        self.routes[domain] = target
+        if self.certificates is not None:
+            self.certificates.ensure(domain)
+        self.route_table.add(domain, target)
+        self.clear_caches()
 
     def remove_route(self, domain):
-        if domain in self.routes:
-            del self.routes[domain]
+        self.route_table.remove(domain)
+        self.cache_routes.pop(domain, None)
+        self.upstream_groups.pop(domain, None)
+        self.clear_caches()
+
+    def set_routes(self, routes):
+        """Replace every route at once, resetting the same state add_route and remove_route do."""
+        if self.certificates is not None:
+            for domain in routes:
+                self.certificates.ensure(domain)
+        for domain in set(self.route_table.routes) - set(routes):
+            self.cache_routes.pop(domain, None)
+            self.upstream_groups.pop(domain, None)
+        self.route_table.replace(routes)
+        self.clear_caches()
 
     def get_routes(self):
         return self.routes
 
-    async def start_server(self):
+    def get_upstream_stats(self):
+        """Per-route, per-upstream traffic counters: {pattern: [upstream stats]}."""
+        return {pattern: group.stats() for pattern, (_, group) in self.upstream_groups.items()}
+
+    def get_metrics(self):
+        return self.metrics.summary()
+
+    async def handle_metrics(self, request):
+        text = self.metrics.render_prometheus()
+        if self.caddy_metrics_url:
+            session = await self.pool.start()
+            try:
+                async with session.get(self.caddy_metrics_url, timeout=ClientTimeout(total=2)) as resp:
+                    if resp.status == 200:
+                        text += await resp.text()
+            except (ClientError, asyncio.TimeoutError) as e:
+                text += f"# Caddy metrics unavailable: {str(e)}\n"
+        return web.Response(text=text, content_type='text/plain', charset='utf-8',
+                            headers={'Cache-Control': 'no-store'})
+
+    async def start_metrics_server(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        self.metrics_runner = web.AppRunner(app, access_log=None)
+        await self.metrics_runner.setup()
+        await web.TCPSite(self.metrics_runner, '127.0.0.1', self.metrics_port).start()
+        print(f"Proxy metrics on http://127.0.0.1:{self.metrics_port}/metrics")
+
+    def get_pool_stats(self):
+        return self.pool.stats()
+
+    def get_capture_stats(self):
+        return self.capture.stats() if self.capture is not None else None
+
+    def get_tls_stats(self):
+        return self.certificates.stats() if self.certificates is not None else None
+
+    def get_http2_stats(self):
+        return {
+            'connections': len(self.h2_connections),
+            'active_streams': sum(len(connection.streams) for connection in self.h2_connections),
+            **self.h2_counters,
+            'upstream': self.h2c_pool.stats(),
+        }
+
+    def new_h2_connection(self):
+        return H2ServerConnection(self.handle, self.h2_window_size, self.h2_max_concurrent_streams,
+                                  self.h2_connections, self.h2_counters)
+
+    async def start_http2_listener(self, sock=None, reuse_port=False):
+        if self.certificates is not None:
+            self.certificates.set_alpn_protocols(['h2', 'http/1.1'])
+        elif self.ssl_context is not None:
+            self.ssl_context.set_alpn_protocols(['h2', 'http/1.1'])
+        # Connections that turn out to be HTTP/1.1 go to the aiohttp server as usual
+        http1 = self.runner.server
+        loop = asyncio.get_running_loop()
+        factory = lambda: HTTPListener(http1, self.new_h2_connection)
+        if sock is not None:
+            self.h2_listener = await loop.create_server(factory, sock=sock, ssl=self.ssl_context)
+        else:
+            self.h2_listener = await loop.create_server(factory, self.host, self.port, ssl=self.ssl_context,
+                                                        reuse_port=reuse_port or None)
+
+    async def start_server(self, sock=None, reuse_port=False):
+        await self.pool.start()
         self.runner = web.AppRunner(self.app)
         await self.runner.setup()
-        site = web.TCPSite(self.runner, '0.0.0.0', 80)
-        await site.start()
-        print("Proxy server started on http://localhost:80")
+        if self.http2:
+            await self.start_http2_listener(sock, reuse_port)
+        else:
+            if sock is not None:
+                # Pre-bound socket shared with other worker processes
+                site = web.SockSite(self.runner, sock, ssl_context=self.ssl_context)
+            else:
+                site = web.TCPSite(self.runner, self.host, self.port, ssl_context=self.ssl_context,
+                                   reuse_port=reuse_port or None)
+            await site.start()
+        if self.metrics_port:
+            await self.start_metrics_server()
+        scheme = 'https' if self.ssl_context is not None else 'http'
+        print(f"Proxy server started on {scheme}://localhost:{self.port}" + (" (HTTP/2 enabled)" if self.http2 else ""))
         self.server_started.emit()
 
+    async def shutdown(self):
+        # Open tunnels would otherwise hold up the runner's cleanup
+        for tunnel in list(self.tunnels):
+            tunnel.close('shutdown')
+        if self.h2_listener is not None:
+            self.h2_listener.close()
+            self.h2_listener = None
+        for connection in list(self.h2_connections):
+            connection.close()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+            self.metrics_runner = None
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+        await self.pool.close()
+        await self.h2c_pool.close()
+        if self.compressor is not None:
+            self.compressor.close()
+        if self.capture is not None:
+            self.capture.close()
+
     def run(self):
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
@@ -69,7 +621,10 @@ class ProxyServer(QThread):
         self.loop.run_forever()
 
     def stop(self):
-        if self.loop:
-            self.loop.call_soon_threadsafe(self.loop.stop)
-        if self.runner:
-            self.loop.run_until_complete(self.runner.cleanup())
\ No newline at end of file
+        if self.loop and self.loop.is_running():
+            # The loop runs on the proxy thread, so schedule cleanup there
+            future = asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop)
+            try:
+                future.result(timeout=10)
+            finally:
+                self.loop.call_soon_threadsafe(self.loop.stop)
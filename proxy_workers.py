@@ -0,0 +1,203 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from certificates import CertificateStore
+from proxy_server import ProxyServer
+
+
+def _apply_message(server, message):
+    command = message[0]
+    if command == 'add':
+        server.add_route(message[1], message[2])
+    elif command == 'remove':
+        server.remove_route(message[1])
+    elif command == 'cache':
+        server.set_route_cache(message[1], message[2])
+    elif command == 'set':
+        server.set_routes(message[1])
+
+
+def worker_main(index, sock, host, port, reuse_port, routes, cache_routes, control, proxy_kwargs):
+    """Entry point of one proxy worker process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor decides when workers stop
+
+    if proxy_kwargs.get('metrics_port'):
+        # Each worker keeps its own metrics, served on metrics_port + index
+        proxy_kwargs = dict(proxy_kwargs, metrics_port=proxy_kwargs['metrics_port'] + index)
+    server = ProxyServer(host=host, port=port, **proxy_kwargs)
+    server.route_table.update(routes)
+    for pattern, enabled in cache_routes.items():
+        server.set_route_cache(pattern, enabled)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server.loop = loop
+
+    def read_control():
+        # Route updates arrive over the pipe and are applied on the event loop
+        while True:
+            try:
+                message = control.recv()
+            except (EOFError, OSError):
+                message = ('stop',)
+            if message[0] == 'stop':
+                loop.call_soon_threadsafe(loop.stop)
+                return
+            loop.call_soon_threadsafe(_apply_message, server, message)
+
+    threading.Thread(target=read_control, daemon=True).start()
+    loop.run_until_complete(server.start_server(sock=sock, reuse_port=reuse_port))
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(server.shutdown())
+        loop.close()
+
+
+class ProxyWorkerPool:
+    """
+    Runs ProxyServer in N worker processes so proxy traffic is not limited to
+    one core or to the GUI process's GIL.
+
+    With SO_REUSEPORT (Linux, BSD, macOS) each worker binds its own socket
+    and the kernel spreads connections across them. Otherwise one socket is
+    bound here and handed to every worker. Route changes reach workers over
+    a control pipe, and a supervisor thread restarts workers that die.
+    """
+
+    def __init__(self, host='0.0.0.0', port=80, workers=None, reuse_port=None, restart_delay=0.5, **proxy_kwargs):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT') if reuse_port is None else reuse_port
+        self.restart_delay = restart_delay
+        self.proxy_kwargs = proxy_kwargs
+        self.routes = {}
+        self.cache_routes = {}
+        self.processes = [None] * self.workers
+        self.controls = [None] * self.workers
+        self.sock = None
+        self.restarts = 0
+        # Exit code of each worker's last unexpected exit, None while it never died
+        self.exit_codes = [None] * self.workers
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.supervisor = None
+        # fork keeps startup cheap; spawn is the only option on Windows
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.context = multiprocessing.get_context(method)
+        # Certificates are issued here, once, so workers only ever load them from disk
+        self.certificates = CertificateStore(proxy_kwargs.get('tls_dir')) if proxy_kwargs.get('tls') else None
+
+    def _bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(1024)
+        sock.setblocking(False)
+        return sock
+
+    def _spawn(self, index):
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=worker_main,
+            args=(index, self.sock, self.host, self.port, self.reuse_port, dict(self.routes), dict(self.cache_routes), receiver, self.proxy_kwargs),
+            name=f'wildcaddy-proxy-{index}',
+            daemon=True,
+        )
+        process.start()
+        receiver.close()
+        self.processes[index] = process
+        self.controls[index] = sender
+
+    def start(self):
+        if not self.reuse_port:
+            self.sock = self._bind()
+        with self.lock:
+            for index in range(self.workers):
+                self._spawn(index)
+        self.supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self.supervisor.start()
+
+    def _supervise(self):
+        while not self.stopping.wait(self.restart_delay):
+            with self.lock:
+                for index, process in enumerate(self.processes):
+                    if process is not None and not process.is_alive() and not self.stopping.is_set():
+                        self.exit_codes[index] = process.exitcode
+                        self.controls[index].close()
+                        self._spawn(index)
+                        self.restarts += 1
+
+    def _send_all(self, message):
+        # Callers hold self.lock, so a worker respawned by the supervisor gets either the old
+        # routes and then this message, or the new routes already
+        for control in self.controls:
+            if control is None:
+                continue
+            try:
+                control.send(message)
+            except (BrokenPipeError, OSError):
+                # The supervisor restarts the worker with the current routes
+                pass
+
+    def _broadcast(self, message):
+        with self.lock:
+            self._send_all(message)
+
+    def add_route(self, domain, target):
+        if self.certificates is not None:
+            self.certificates.ensure(domain)
+        with self.lock:
+            self.routes[domain] = target
+            self._send_all(('add', domain, target))
+
+    def remove_route(self, domain):
+        with self.lock:
+            if self.routes.pop(domain, None) is not None:
+                self._send_all(('remove', domain))
+
+    def set_routes(self, routes):
+        if self.certificates is not None:
+            for domain in routes:
+                self.certificates.ensure(domain)
+        with self.lock:
+            self.routes = dict(routes)
+            self._send_all(('set', self.routes))
+
+    def set_route_cache(self, pattern, enabled):
+        with self.lock:
+            self.cache_routes[pattern] = enabled
+            self._send_all(('cache', pattern, enabled))
+
+    def get_routes(self):
+        return self.routes
+
+    def stats(self):
+        with self.lock:
+            alive = sum(1 for process in self.processes if process is not None and process.is_alive())
+        return {'workers': self.workers, 'alive': alive, 'restarts': self.restarts,
+                'exit_codes': list(self.exit_codes), 'reuse_port': self.reuse_port}
+
+    def stop(self, timeout=5):
+        self.stopping.set()
+        if self.supervisor is not None:
+            self.supervisor.join()
+        self._broadcast(('stop',))
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            if process is not None:
+                process.join(max(0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+        for control in self.controls:
+            if control is not None:
+                control.close()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
@@ -0,0 +1,202 @@
+"""
+Replay traffic recorded by ProxyServer's capture mode (capture_dir)
+against a target, and compare latencies with the captured ones.
+
+    python replay.py CAPTURE_DIR --target http://127.0.0.1:8080
+    python replay.py CAPTURE_DIR --target http://127.0.0.1:3000 --speed 10 --route app.test
+    python replay.py capture-....jsonl --target http://127.0.0.1:8080 --speed 0 --json
+
+Requests keep their captured method, path, Host header, headers and any
+captured body, and are sent in the order they completed at their
+original pace, `--speed` times faster, or as fast as `--concurrency`
+allows with --speed 0. Credentials redacted at capture time are left
+out. Segments are read through mmap and merged in time order, so
+captures larger than memory replay fine. The report gives captured and
+replayed p50/p95 per route, the latency deltas and how many statuses
+changed.
+"""
+import argparse
+import asyncio
+import base64
+import heapq
+import json
+import sys
+import time
+from operator import itemgetter
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+
+from capture import REDACTED, parse_header_block, read_segment, segment_paths
+
+# Recomputed or meaningless on a new connection
+SKIPPED_HEADERS = frozenset([
+    'connection', 'keep-alive', 'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade',
+    'content-length',
+])
+
+
+def load_records(path, routes=None, methods=None):
+    """Captured records from every segment under `path`, in completion time order."""
+    segments = [read_segment(segment) for segment in segment_paths(path)]
+    for record in heapq.merge(*segments, key=itemgetter('ts')):
+        # Upgraded connections were relayed as raw bytes and cannot be replayed as requests
+        if record['status'] == 101:
+            continue
+        if routes and record['route'] not in routes:
+            continue
+        if methods and record['method'] not in methods:
+            continue
+        yield record
+
+
+def request_body(record):
+    body = record.get('request_body')
+    if body:
+        return base64.b64decode(body['data']), not body['truncated']
+    return b'', not record['bytes_in']
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Replay:
+    def __init__(self, target, speed=1.0, concurrency=64, timeout=30.0, host=None):
+        self.target = target.rstrip('/')
+        self.speed = speed
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.host = host
+        # route -> [(captured ms, replayed ms)]
+        self.latencies = {}
+        self.counters = {'requests': 0, 'errors': 0, 'status_changed': 0, 'partial_bodies': 0, 'late': 0}
+        self.elapsed = 0.0
+
+    async def send(self, session, record):
+        headers = [(name, value) for name, value in parse_header_block(record['request_headers'])
+                   if name.lower() not in SKIPPED_HEADERS and value != REDACTED]
+        if self.host:
+            headers = [(name, self.host if name.lower() == 'host' else value) for name, value in headers]
+        body, complete = request_body(record)
+        if not complete:
+            self.counters['partial_bodies'] += 1
+        start = time.perf_counter()
+        try:
+            async with session.request(record['method'], self.target + record['path'], headers=headers,
+                                       data=body or None, allow_redirects=False) as resp:
+                await resp.read()
+                status = resp.status
+        except (ClientError, asyncio.TimeoutError):
+            self.counters['errors'] += 1
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        if status != record['status']:
+            self.counters['status_changed'] += 1
+        self.latencies.setdefault(record['route'], []).append((record['duration_ms'], elapsed))
+
+    async def run(self, records):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = TCPConnector(limit=self.concurrency)
+        tasks = set()
+
+        async def send(session, record):
+            try:
+                await self.send(session, record)
+            finally:
+                semaphore.release()
+
+        async with ClientSession(connector=connector, timeout=ClientTimeout(total=self.timeout),
+                                 auto_decompress=False, skip_auto_headers=('User-Agent', 'Accept-Encoding')) as session:
+            first = started = None
+            for record in records:
+                if first is None:
+                    first, started = record['ts'], time.perf_counter()
+                if self.speed:
+                    delay = (record['ts'] - first) / self.speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    elif delay < -0.01:
+                        self.counters['late'] += 1
+                await semaphore.acquire()
+                self.counters['requests'] += 1
+                task = asyncio.create_task(send(session, record))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        self.elapsed = time.perf_counter() - started if started is not None else 0.0
+
+    def route_report(self, pairs):
+        captured = sorted(pair[0] for pair in pairs)
+        replayed = sorted(pair[1] for pair in pairs)
+        deltas = sorted(pair[1] - pair[0] for pair in pairs)
+        return {
+            'requests': len(pairs),
+            'captured_p50_ms': round(percentile(captured, 50), 3),
+            'captured_p95_ms': round(percentile(captured, 95), 3),
+            'replayed_p50_ms': round(percentile(replayed, 50), 3),
+            'replayed_p95_ms': round(percentile(replayed, 95), 3),
+            'delta_p50_ms': round(percentile(deltas, 50), 3),
+            'delta_p95_ms': round(percentile(deltas, 95), 3),
+        }
+
+    def report(self):
+        everything = [pair for pairs in self.latencies.values() for pair in pairs]
+        return {
+            'target': self.target,
+            'speed': self.speed,
+            'seconds': round(self.elapsed, 3),
+            **self.counters,
+            'overall': self.route_report(everything),
+            'routes': {route: self.route_report(pairs) for route, pairs in sorted(self.latencies.items())},
+        }
+
+
+def print_report(report):
+    print(f"Replayed {report['requests']} requests against {report['target']} in {report['seconds']} s "
+          f"(speed {report['speed'] or 'max'}): {report['errors']} errors, "
+          f"{report['status_changed']} status changes, {report['late']} sent late, "
+          f"{report['partial_bodies']} with partial bodies")
+    print(f"{'route':<32} {'requests':>8} {'captured p50/p95 ms':>22} {'replayed p50/p95 ms':>22} {'delta p50/p95 ms':>20}")
+    for route, row in list(report['routes'].items()) + [('(all)', report['overall'])]:
+        print(f"{route:<32} {row['requests']:>8} "
+              f"{row['captured_p50_ms']:>10} / {row['captured_p95_ms']:<9} "
+              f"{row['replayed_p50_ms']:>10} / {row['replayed_p95_ms']:<9} "
+              f"{row['delta_p50_ms']:>9} / {row['delta_p95_ms']:<8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='replay.py', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', help="capture directory or a single segment file")
+    parser.add_argument('--target', required=True, help="base URL to send requests to, e.g. http://127.0.0.1:8080")
+    parser.add_argument('--speed', type=float, default=1.0, help="time compression factor; 0 sends as fast as possible")
+    parser.add_argument('--concurrency', type=int, default=64, help="requests in flight at most")
+    parser.add_argument('--timeout', type=float, default=30.0, help="seconds per request")
+    parser.add_argument('--host', help="send this Host header instead of the captured one")
+    parser.add_argument('--route', action='append', help="only replay this route pattern (repeatable)")
+    parser.add_argument('--method', action='append', help="only replay this method (repeatable)")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+    if args.speed < 0:
+        parser.error("--speed must be 0 or more")
+
+    replay = Replay(args.target, args.speed, args.concurrency, args.timeout, args.host)
+    records = load_records(args.capture, set(args.route or ()), {method.upper() for method in args.method or ()})
+    try:
+        asyncio.run(replay.run(records))
+    except KeyboardInterrupt:
+        pass
+    report = replay.report()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
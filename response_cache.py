@@ -0,0 +1,243 @@
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+from multidict import CIMultiDict
+
+CACHEABLE_STATUSES = frozenset([200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501])
+
+# Headers a 304 may not override when refreshing a stored response
+NOT_UPDATED_ON_304 = frozenset(['content-length', 'content-encoding', 'content-type', 'transfer-encoding'])
+
+# Heuristic freshness is capped as suggested by RFC 7234 4.2.2
+MAX_HEURISTIC_LIFETIME = 24 * 3600
+
+
+def parse_cache_control(headers):
+    """Return Cache-Control directives as {name: value or True}."""
+    directives = {}
+    for value in headers.getall('Cache-Control', ()):
+        for part in value.split(','):
+            name, sep, arg = part.strip().partition('=')
+            if name:
+                directives[name.lower()] = arg.strip().strip('"') if sep else True
+    return directives
+
+
+def parse_http_date(value):
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _seconds(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers, directives, now):
+    """Seconds a response stays fresh in a shared cache, per RFC 7234 4.2.1."""
+    if 'no-cache' in directives:
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        if name in directives:
+            return _seconds(directives[name]) or 0
+    expires = headers.get('Expires')
+    if expires is not None:
+        expires_at = parse_http_date(expires)
+        date = parse_http_date(headers.get('Date')) or now
+        return max(0, expires_at - date) if expires_at is not None else 0
+    last_modified = parse_http_date(headers.get('Last-Modified'))
+    if last_modified is not None:
+        date = parse_http_date(headers.get('Date')) or now
+        return min(MAX_HEURISTIC_LIFETIME, max(0, (date - last_modified) / 10))
+    return 0
+
+
+def etag_matches(header, etag):
+    """Weak comparison of an If-None-Match header against a stored ETag."""
+    if not header or not etag:
+        return False
+    if header.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == opaque:
+            return True
+    return False
+
+
+class CacheEntry:
+    """One stored response. `body` is served through `view` so hits never copy it."""
+
+    __slots__ = ('key', 'status', 'reason', 'headers', 'body', 'view', 'stored_at',
+                 'initial_age', 'lifetime', 'etag', 'last_modified', 'size')
+
+    def __init__(self, key, status, reason, headers, body, lifetime, now, initial_age=0):
+        self.key = key
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.view = memoryview(body)
+        self.stored_at = now
+        self.initial_age = initial_age
+        self.lifetime = lifetime
+        self.etag = headers.get('ETag')
+        self.last_modified = headers.get('Last-Modified')
+        self.size = len(body) + sum(len(k) + len(v) for k, v in headers.items())
+
+    def age(self, now):
+        return self.initial_age + max(0, now - self.stored_at)
+
+    def is_fresh(self, now):
+        return self.age(now) < self.lifetime
+
+    def has_validators(self):
+        return bool(self.etag or self.last_modified)
+
+
+class ResponseCache:
+    """
+    Shared (proxy) HTTP cache following RFC 7234, held in memory.
+
+    Entries live in an LRU bounded by `max_bytes` of body and headers;
+    responses larger than `max_entry_bytes` are never stored. A URL's
+    stored responses are split by the request headers its `Vary` header
+    names. Stale entries with an ETag or Last-Modified are revalidated
+    with a conditional request instead of being fetched again.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entry_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.entries = OrderedDict()
+        # primary key -> header names from the stored response's Vary
+        self.vary = {}
+        # primary key -> keys of its stored variants
+        self.variants = {}
+        self.current_bytes = 0
+        self.counters = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stores': 0,
+                         'evictions': 0, 'invalidations': 0, 'bypassed': 0}
+
+    @staticmethod
+    def primary_key(host, path_qs):
+        return (host.lower(), path_qs)
+
+    @staticmethod
+    def _vary_values(names, request_headers):
+        return tuple(','.join(request_headers.getall(name, ())) for name in names)
+
+    def is_cacheable_request(self, method, request_headers):
+        if method != 'GET' or 'Range' in request_headers or 'Authorization' in request_headers:
+            return False
+        return 'no-store' not in parse_cache_control(request_headers)
+
+    def lookup(self, primary, request_headers):
+        names = self.vary.get(primary)
+        if names is None:
+            return None
+        entry = self.entries.get((primary, self._vary_values(names, request_headers)))
+        if entry is not None:
+            self.entries.move_to_end(entry.key)
+        return entry
+
+    def storable(self, status, response_headers):
+        """Return the response's freshness lifetime, or None if it must not be stored."""
+        if status not in CACHEABLE_STATUSES or 'Set-Cookie' in response_headers:
+            return None
+        directives = parse_cache_control(response_headers)
+        if 'no-store' in directives or 'private' in directives:
+            return None
+        vary = response_headers.get('Vary', '')
+        if '*' in vary:
+            return None
+        now = time.time()
+        lifetime = freshness_lifetime(response_headers, directives, now)
+        if lifetime <= 0 and not ('ETag' in response_headers or 'Last-Modified' in response_headers):
+            return None
+        return lifetime
+
+    def store(self, primary, request_headers, status, reason, response_headers, body, lifetime):
+        if len(body) > self.max_entry_bytes:
+            return None
+        names = tuple(name.strip() for name in response_headers.get('Vary', '').split(',') if name.strip())
+        if self.vary.get(primary, names) != names:
+            # The upstream changed its Vary; variants under the old names can no longer be selected
+            self.invalidate(primary)
+        key = (primary, self._vary_values(names, request_headers))
+        self._discard(key)
+        self.vary[primary] = names
+
+        headers = CIMultiDict(response_headers)
+        headers.popall('Content-Length', None)
+        initial_age = _seconds(headers.popall('Age', [None])[0]) or 0
+        entry = CacheEntry(key, status, reason, headers, bytes(body), lifetime, time.time(), initial_age)
+        self.entries[key] = entry
+        self.variants.setdefault(primary, set()).add(key)
+        self.current_bytes += entry.size
+        self.counters['stores'] += 1
+        self._evict()
+        return entry
+
+    def refresh(self, entry, response_headers):
+        """Apply a 304 Not Modified to a stored entry, per RFC 7234 4.3.4."""
+        for name in set(response_headers.keys()):
+            if name.lower() not in NOT_UPDATED_ON_304:
+                entry.headers.popall(name, None)
+                entry.headers.extend((name, value) for value in response_headers.getall(name))
+        entry.headers.popall('Age', None)
+        now = time.time()
+        entry.stored_at = now
+        entry.initial_age = _seconds(response_headers.get('Age')) or 0
+        entry.lifetime = freshness_lifetime(entry.headers, parse_cache_control(entry.headers), now)
+        entry.etag = entry.headers.get('ETag')
+        entry.last_modified = entry.headers.get('Last-Modified')
+        size = len(entry.body) + sum(len(k) + len(v) for k, v in entry.headers.items())
+        self.current_bytes += size - entry.size
+        entry.size = size
+        self.counters['revalidated'] += 1
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.current_bytes -= entry.size
+        primary = key[0]
+        keys = self.variants.get(primary)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.variants[primary]
+                self.vary.pop(primary, None)
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self.entries:
+            self._discard(next(iter(self.entries)))
+            self.counters['evictions'] += 1
+
+    def invalidate(self, primary):
+        """Drop every variant stored for a URL, e.g. after an unsafe request to it."""
+        keys = self.variants.get(primary)
+        if keys:
+            self.counters['invalidations'] += 1
+            for key in list(keys):
+                self._discard(key)
+        self.vary.pop(primary, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.vary.clear()
+        self.variants.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats.update(entries=len(self.entries), bytes=self.current_bytes, max_bytes=self.max_bytes)
+        return stats
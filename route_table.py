@@ -0,0 +1,216 @@
+from collections import namedtuple
+
+RouteMatch = namedtuple('RouteMatch', ['pattern', 'target'])
+
+
+def normalize_host(host):
+    """Lower-case a Host header value and strip any port and trailing dot."""
+    if not host:
+        return ''
+    host = host.strip().lower()
+    if host.startswith('['):
+        # IPv6 literal, e.g. [::1]:8080
+        end = host.find(']')
+        return host[1:end] if end != -1 else host[1:]
+    if host.count(':') == 1:
+        host = host.split(':', 1)[0]
+    return host.rstrip('.')
+
+
+def split_pattern(pattern):
+    """Split a route pattern such as '*.app.test/api' into (host, path_prefix)."""
+    host, sep, path = pattern.partition('/')
+    path_prefix = '/' + path.rstrip('/') if sep and path.strip('/') else ''
+    return host.strip().lower().rstrip('.'), path_prefix
+
+
+def path_matches(path, prefix):
+    if not prefix:
+        return True
+    if not path.startswith(prefix):
+        return False
+    return len(path) == len(prefix) or path[len(prefix)] == '/'
+
+
+class _PathRules:
+    """Targets registered for one host pattern, longest path prefix first."""
+
+    __slots__ = ('rules',)
+
+    def __init__(self):
+        self.rules = []
+
+    def add(self, path_prefix, pattern, target):
+        # A new list swapped in, so a concurrent match sees the old rules or the new ones
+        rules = [rule for rule in self.rules if rule[1].pattern != pattern]
+        rules.append((path_prefix, RouteMatch(pattern, target)))
+        rules.sort(key=lambda rule: len(rule[0]), reverse=True)
+        self.rules = rules
+
+    def remove(self, pattern):
+        self.rules = [rule for rule in self.rules if rule[1].pattern != pattern]
+        return not self.rules
+
+    def match(self, path):
+        for prefix, route in self.rules:
+            if path is None or path_matches(path, prefix):
+                return route
+        return None
+
+
+class _TrieNode:
+    __slots__ = ('children', 'wildcard', 'suffix')
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.suffix = None
+
+
+class _CompiledRoutes:
+    """
+    Lookup structure for the route dict: exact hosts in a dict, wildcard
+    and suffix patterns in a trie of reversed labels. Patterns are added
+    and removed in place, in O(labels).
+    """
+
+    def __init__(self, routes):
+        self.exact = {}
+        self.root = _TrieNode()
+        for pattern, target in routes.items():
+            self.add(pattern, target)
+
+    def add(self, pattern, target):
+        host, path_prefix = split_pattern(pattern)
+        if host.startswith('*.'):
+            node = self._node(host[2:])
+            if node.wildcard is None:
+                node.wildcard = _PathRules()
+            node.wildcard.add(path_prefix, pattern, target)
+        elif host.startswith('.'):
+            node = self._node(host[1:])
+            if node.suffix is None:
+                node.suffix = _PathRules()
+            node.suffix.add(path_prefix, pattern, target)
+        else:
+            rules = self.exact.get(host)
+            if rules is None:
+                rules = _PathRules()
+                rules.add(path_prefix, pattern, target)
+                self.exact[host] = rules
+            else:
+                rules.add(path_prefix, pattern, target)
+
+    def remove(self, pattern):
+        host, _ = split_pattern(pattern)
+        if not host.startswith('.') and not host.startswith('*.'):
+            rules = self.exact.get(host)
+            if rules is not None and rules.remove(pattern):
+                del self.exact[host]
+            return
+
+        # Find the node, remembering the path so emptied nodes can be pruned
+        path = []
+        node = self.root
+        for label in reversed((host[2:] if host.startswith('*.') else host[1:]).split('.')):
+            child = node.children.get(label)
+            if child is None:
+                return
+            path.append((node, label))
+            node = child
+        if host.startswith('*.'):
+            if node.wildcard is not None and node.wildcard.remove(pattern):
+                node.wildcard = None
+        elif node.suffix is not None and node.suffix.remove(pattern):
+            node.suffix = None
+        for parent, label in reversed(path):
+            if node.children or node.wildcard is not None or node.suffix is not None:
+                break
+            del parent.children[label]
+            node = parent
+
+    def _node(self, host):
+        node = self.root
+        for label in reversed(host.split('.')):
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = _TrieNode()
+            node = child
+        return node
+
+    def lookup(self, host, path):
+        rules = self.exact.get(host)
+        if rules is not None:
+            route = rules.match(path)
+            if route is not None:
+                return route
+
+        # Walk the reversed labels, remembering patterns from least to most specific
+        labels = host.split('.')
+        candidates = []
+        node = self.root
+        remaining = len(labels)
+        for label in reversed(labels):
+            node = node.children.get(label)
+            if node is None:
+                break
+            remaining -= 1
+            if node.suffix is not None:
+                candidates.append(node.suffix)
+            if remaining == 1 and node.wildcard is not None:
+                candidates.append(node.wildcard)
+
+        for rules in reversed(candidates):
+            route = rules.match(path)
+            if route is not None:
+                return route
+        return None
+
+
+class RouteTable:
+    """
+    Host routing table supporting exact hosts, '*.example.test' wildcards
+    (exactly one extra label), '.example.test' suffixes (the domain and any
+    subdomain) and optional path prefixes such as 'example.test/api'.
+
+    `add` and `remove` change the compiled table in place in O(labels),
+    each step a single assignment. Bulk changes (`update`, `replace`)
+    recompile once and swap the table in, so lookups from the proxy loop
+    never see a partial update.
+    """
+
+    def __init__(self, routes=None):
+        self.routes = dict(routes or {})
+        self._compiled = _CompiledRoutes(self.routes)
+
+    def add(self, pattern, target):
+        self.routes[pattern] = target
+        self._compiled.add(pattern, target)
+
+    def remove(self, pattern):
+        if pattern in self.routes:
+            del self.routes[pattern]
+            self._compiled.remove(pattern)
+
+    def update(self, routes):
+        self.routes.update(routes)
+        self.rebuild()
+
+    def replace(self, routes):
+        """Swap in a whole new set of routes with one rebuild; `routes` stays the same dict object."""
+        self.routes.clear()
+        self.routes.update(routes)
+        self.rebuild()
+
+    def rebuild(self):
+        self._compiled = _CompiledRoutes(self.routes)
+
+    def lookup(self, host, path='/'):
+        return self._compiled.lookup(normalize_host(host), path or '/')
+
+    def lookup_host(self, host):
+        """A route for `host` under any path prefix, e.g. to decide whether to serve it at all."""
+        return self._compiled.lookup(normalize_host(host), None)
+
+    def __len__(self):
+        return len(self.routes)
@@ -0,0 +1,179 @@
+import asyncio
+
+COALESCE_METHODS = frozenset(['GET', 'HEAD'])
+
+# Request headers that can change the upstream response, and so must match for requests to share a fetch
+DEFAULT_KEY_HEADERS = ('Accept', 'Accept-Encoding', 'Accept-Language', 'Authorization', 'Cookie', 'Range')
+# Always part of the key: a conditional request's 304 or 412 is no answer for an unconditional one
+CONDITIONAL_KEY_HEADERS = ('If-None-Match', 'If-Modified-Since', 'If-Unmodified-Since', 'If-Range')
+
+
+class Flight:
+    """
+    One upstream fetch shared by every request that joined it.
+
+    The fetch runs in its own task and appends body chunks as they arrive.
+    Each reader walks the chunks at its own pace, so a slow client does not
+    hold up the others. Late joiners replay the body from the start until
+    it grows past `max_replay_bytes`. After that the flight takes no new
+    readers, and chunks every reader has passed are dropped.
+    """
+
+    def __init__(self, key, max_replay_bytes):
+        self.key = key
+        self.max_replay_bytes = max_replay_bytes
+        self.status = None
+        self.reason = None
+        self.headers = None
+        self.chunks = []
+        self.base = 0
+        self.size = 0
+        self.joinable = True
+        self.done = False
+        self.error = None
+        self.task = None
+        # reader -> absolute index of the next chunk it will read
+        self.positions = {}
+        self._changed = asyncio.get_running_loop().create_future()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.get_running_loop().create_future()
+        changed.set_result(None)
+
+    def set_response(self, status, reason, headers):
+        self.status, self.reason, self.headers = status, reason, headers
+        self._notify()
+
+    def feed(self, chunk):
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if self.joinable and self.size > self.max_replay_bytes:
+            self.joinable = False
+        self._notify()
+
+    def finish(self, error=None):
+        self.error = error
+        self.done = True
+        self.joinable = False
+        self._notify()
+
+    async def wait_response(self):
+        while self.status is None and not self.done:
+            await asyncio.shield(self._changed)
+        if self.status is None:
+            raise self.error or ConnectionError('upstream fetch ended without a response')
+        return self.status, self.reason, self.headers
+
+    def reader(self):
+        return FlightReader(self)
+
+    def leave(self, reader):
+        self.positions.pop(reader, None)
+        if not self.positions and not self.done and not self.joinable and self.task is not None:
+            # Nobody is left to receive the body and nobody else can join
+            self.task.cancel()
+
+    def _trim(self):
+        lowest = min(self.positions.values())
+        if lowest > self.base:
+            del self.chunks[:lowest - self.base]
+            self.base = lowest
+
+
+class FlightReader:
+    """Async iterator over a flight's body for one client. `close()` must be called when done."""
+
+    def __init__(self, flight):
+        self.flight = flight
+        flight.positions[self] = flight.base
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        flight = self.flight
+        while True:
+            index = flight.positions[self]
+            if index < flight.base + len(flight.chunks):
+                chunk = flight.chunks[index - flight.base]
+                flight.positions[self] = index + 1
+                if not flight.joinable and index == flight.base:
+                    flight._trim()
+                return chunk
+            if flight.done:
+                if flight.error is not None:
+                    raise flight.error
+                raise StopAsyncIteration
+            await asyncio.shield(flight._changed)
+
+    def close(self):
+        self.flight.leave(self)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical idempotent requests into one upstream
+    fetch. Requests share a fetch when method, host, path and query, and
+    the `key_headers` all match.
+    """
+
+    def __init__(self, key_headers=DEFAULT_KEY_HEADERS, max_replay_bytes=4 * 1024 * 1024, chunk_size=64 * 1024):
+        self.key_headers = tuple(key_headers) + tuple(
+            name for name in CONDITIONAL_KEY_HEADERS if name not in key_headers)
+        self.max_replay_bytes = max_replay_bytes
+        self.chunk_size = chunk_size
+        self.flights = {}
+        self.counters = {'fetches': 0, 'collapsed': 0, 'errors': 0}
+
+    def is_eligible(self, method, request):
+        return method in COALESCE_METHODS and not request.body_exists
+
+    def key(self, method, host, path_qs, headers):
+        return (method, host.lower(), path_qs) + tuple(
+            ','.join(headers.getall(name, ())) for name in self.key_headers
+        )
+
+    def join(self, key, open_upstream, filter_headers):
+        """
+        Return (flight, reader) for `key`, starting a fetch with
+        `open_upstream()` (an async context manager yielding an aiohttp
+        response) if none is in progress.
+        """
+        flight = self.flights.get(key)
+        if flight is not None and flight.joinable:
+            self.counters['collapsed'] += 1
+        else:
+            flight = Flight(key, self.max_replay_bytes)
+            self.flights[key] = flight
+            self.counters['fetches'] += 1
+            flight.task = asyncio.ensure_future(self._fetch(flight, open_upstream, filter_headers))
+        return flight, flight.reader()
+
+    async def _fetch(self, flight, open_upstream, filter_headers):
+        error = None
+        try:
+            async with open_upstream() as resp:
+                flight.set_response(resp.status, resp.reason, filter_headers(resp.headers))
+                async for chunk in resp.content.iter_chunked(self.chunk_size):
+                    flight.feed(chunk)
+                    if not flight.joinable:
+                        self._release(flight)
+                        if not flight.positions:
+                            break
+        except asyncio.CancelledError:
+            error = ConnectionError('upstream fetch cancelled')
+        except Exception as e:
+            self.counters['errors'] += 1
+            error = e
+        finally:
+            self._release(flight)
+            flight.finish(error)
+
+    def _release(self, flight):
+        if self.flights.get(flight.key) is flight:
+            del self.flights[flight.key]
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats['in_flight'] = len(self.flights)
+        return stats
@@ -0,0 +1,152 @@
+import hashlib
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from caddy_fetcher import BinaryFetcher, CaddyInstaller, DownloadError, caddy_release
+from utils import binary_is_current, read_install_record
+
+BINARY = b'#!/bin/sh\necho caddy\n' * 1000
+
+
+def release_archive(payload):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as archive:
+        for name, data in (('caddy', payload), ('LICENSE', b'Apache-2.0')):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+class ReleaseServer(ThreadingHTTPServer):
+    """A stand-in for GitHub's release API and downloads that, like some mirrors, refuses HEAD."""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ReleaseHandler)
+        self.files = {}
+        self.requests = []
+        self.latest = None
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def publish(self, version, payload, checksum=None):
+        release = caddy_release(version, self.url + '/download')
+        archive = release_archive(payload)
+        checksum = checksum or hashlib.sha512(archive).hexdigest()
+        self.files[release.archive_url[len(self.url):]] = archive
+        self.files[release.checksums_url[len(self.url):]] = f'{checksum}  {release.archive_name}\n'.encode()
+        self.latest = version
+        return release
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ReleaseHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.server.requests.append(('HEAD', self.path))
+        self.send_response(405)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path))
+        if self.path == '/api/latest':
+            body = f'{{"tag_name": "v{self.server.latest}"}}'.encode()
+        else:
+            body = self.server.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CaddyInstallerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ReleaseServer()
+        self.directory = tempfile.TemporaryDirectory()
+        self.dest_path = os.path.join(self.directory.name, 'caddy')
+        self.cache_dir = os.path.join(self.directory.name, 'cache')
+
+    def tearDown(self):
+        self.server.close()
+        self.directory.cleanup()
+
+    def installer(self, version='latest'):
+        return CaddyInstaller(self.dest_path, self.cache_dir, version, segments=4,
+                              releases_api=self.server.url + '/api', releases_url=self.server.url + '/download')
+
+    def test_installs_latest_verified_against_checksums(self):
+        self.server.publish('2.8.4', BINARY)
+        self.assertEqual(self.installer().install(), '2.8.4')
+        with open(self.dest_path, 'rb') as f:
+            self.assertEqual(f.read(), BINARY)
+        self.assertTrue(os.access(self.dest_path, os.X_OK))
+        self.assertEqual(read_install_record(self.dest_path)['version'], '2.8.4')
+        self.assertTrue(binary_is_current(self.dest_path, 'latest'))
+        self.assertFalse(binary_is_current(self.dest_path, '2.9.0'))
+        # HEAD was refused, so the archive came down in one plain GET
+        self.assertIn(('HEAD', '/download/v2.8.4/' + caddy_release('2.8.4').archive_name), self.server.requests)
+        self.assertFalse(os.listdir(os.path.join(self.cache_dir, 'downloads')))
+
+    def test_checksum_mismatch_installs_nothing(self):
+        self.server.publish('2.8.4', BINARY, checksum='0' * 128)
+        with self.assertRaises(DownloadError):
+            self.installer().install()
+        self.assertFalse(os.path.exists(self.dest_path))
+        self.assertIsNone(read_install_record(self.dest_path))
+
+    def test_version_change_reinstalls_and_cache_skips_network(self):
+        self.server.publish('2.8.4', BINARY)
+        self.installer('2.8.4').install()
+        self.server.publish('2.9.0', BINARY + b'# 2.9.0\n')
+        self.assertEqual(self.installer('2.9.0').install(), '2.9.0')
+        with open(self.dest_path, 'rb') as f:
+            self.assertTrue(f.read().endswith(b'# 2.9.0\n'))
+
+        self.server.requests.clear()
+        self.assertEqual(self.installer('v2.8.4').install(), '2.8.4')
+        with open(self.dest_path, 'rb') as f:
+            self.assertEqual(f.read(), BINARY)
+        self.assertEqual(self.server.requests, [])
+
+
+class BinaryFetcherTest(unittest.TestCase):
+    def test_head_refused_falls_back_to_get(self):
+        with tempfile.TemporaryDirectory() as directory:
+            server = ReleaseServer()
+            try:
+                server.files['/file'] = BINARY
+                dest_path = os.path.join(directory, 'file')
+                path, sha256 = BinaryFetcher(server.url + '/file', dest_path,
+                                             checksum=hashlib.sha256(BINARY).hexdigest()).fetch()
+            finally:
+                server.close()
+            self.assertEqual(sha256, hashlib.sha256(BINARY).hexdigest())
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), BINARY)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,298 @@
+import asyncio
+import ssl
+from urllib.parse import urlsplit
+
+from multidict import CIMultiDict
+
+# h2c has to be negotiated hop by hop, so it is never tunneled
+UNTUNNELED_PROTOCOLS = frozenset(['h2c'])
+
+MAX_HEAD_BYTES = 64 * 1024
+# Upstreams that refuse an upgrade answer with a normal response; it is buffered up to this size
+MAX_REFUSAL_BYTES = 1024 * 1024
+
+UP, DOWN = 0, 1
+
+
+def is_upgrade_request(request):
+    """True for body-less requests asking to switch protocols, e.g. WebSocket or a dev server's HMR socket."""
+    upgrade = request.headers.get('Upgrade')
+    if not upgrade or request.body_exists:
+        return False
+    tokens = {token.strip().lower() for value in request.headers.getall('Connection', ()) for token in value.split(',')}
+    return 'upgrade' in tokens and upgrade.split(',')[0].strip().lower() not in UNTUNNELED_PROTOCOLS
+
+
+def render_request_head(method, path_qs, host, headers, upgrade):
+    lines = [f'{method} {path_qs} HTTP/1.1', f'Host: {host}']
+    lines.extend(f'{name}: {value}' for name, value in headers.items())
+    lines += ['Connection: Upgrade', f'Upgrade: {upgrade}', '', '']
+    return '\r\n'.join(lines).encode('utf-8', 'surrogateescape')
+
+
+def parse_response_head(head):
+    """Return (status, reason, headers) from a response head without its final blank line."""
+    lines = head.decode('utf-8', 'surrogateescape').split('\r\n')
+    version, _, rest = lines[0].partition(' ')
+    code, _, reason = rest.partition(' ')
+    if not version.startswith('HTTP/') or not code.isdigit():
+        raise ValueError(f"malformed upstream status line: {lines[0][:100]!r}")
+    headers = CIMultiDict()
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers.add(name.strip(), value.strip())
+    return int(code), reason, headers
+
+
+def decode_chunked(data):
+    """Decode a complete chunked body, or return None if `data` does not hold all of it yet."""
+    body = bytearray()
+    pos = 0
+    while True:
+        end = data.find(b'\r\n', pos)
+        if end < 0:
+            return None
+        size = int(bytes(data[pos:end]).split(b';', 1)[0], 16)
+        pos = end + 2
+        if size == 0:
+            # Either the blank line right away or trailers followed by one
+            return bytes(body) if data.find(b'\r\n\r\n', pos - 2) >= 0 else None
+        if len(data) < pos + size + 2:
+            return None
+        body += data[pos:pos + size]
+        pos += size + 2
+
+
+class TunnelEnd(asyncio.BufferedProtocol):
+    """
+    One connection of a tunnel. Reads land in a reusable buffer and are
+    written straight to the peer's transport. While the peer's transport
+    is backed up, reading from this side is paused.
+    """
+
+    def __init__(self, tunnel, direction, buffer_size):
+        self.tunnel = tunnel
+        self.direction = direction
+        self.buffer_size = buffer_size
+        self.view = memoryview(bytearray(buffer_size))
+        self.transport = None
+        self.peer = None
+        self.received = 0
+        # Data read before the relay starts, i.e. during the upstream handshake
+        self.pending = bytearray()
+        self.waiter = None
+        self.eof = False
+        self.lost = False
+        # The HTTP server's protocol, for a client connection taken over after the 101
+        self.original_protocol = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint):
+        return self.view
+
+    def buffer_updated(self, nbytes):
+        if self.peer is None:
+            self.pending += self.view[:nbytes]
+            self._wake()
+            return
+        self.received += nbytes
+        tunnel = self.tunnel
+        tunnel.byte_counts[self.direction] += nbytes
+        tunnel.last_activity = tunnel.loop.time()
+        peer_transport = self.peer.transport
+        peer_transport.write(self.view[:nbytes])
+        if peer_transport.get_write_buffer_size():
+            # The transport may keep unsent bytes by reference, so this buffer cannot be reused
+            self.view = memoryview(bytearray(self.buffer_size))
+
+    def eof_received(self):
+        self.eof = True
+        self._wake()
+        if self.peer is None:
+            return True
+        if self.peer.eof or not self.peer.transport.can_write_eof():
+            self.tunnel.close('closed')
+            return True
+        # Half-close: pass the FIN on and keep relaying the other direction
+        self.peer.transport.write_eof()
+        return True
+
+    def pause_writing(self):
+        if self.peer is not None:
+            self.peer.transport.pause_reading()
+
+    def resume_writing(self):
+        peer = self.peer
+        if peer is not None and not peer.eof and not peer.transport.is_closing():
+            peer.transport.resume_reading()
+
+    def connection_lost(self, exc):
+        self.lost = True
+        self._wake()
+        if self.original_protocol is not None:
+            # Let the HTTP server that accepted the connection finish its bookkeeping
+            self.original_protocol.connection_lost(exc)
+        self.tunnel.close('error' if exc is not None else 'closed')
+
+    def _wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def wait_data(self):
+        if self.eof or self.lost:
+            raise ConnectionError("upstream closed the connection during the upgrade")
+        self.waiter = self.tunnel.loop.create_future()
+        await self.waiter
+
+
+class Tunnel:
+    """
+    Relays raw bytes both ways between a client connection, taken over
+    from the HTTP server once the upstream answered 101 Switching
+    Protocols, and that upstream connection. It closes when either side
+    does, or after `idle_timeout` seconds without traffic either way.
+
+    `byte_counts` is a [up, down] list the relay adds to as it goes, so
+    metrics include tunnels that are still open.
+    """
+
+    def __init__(self, route, upstream_url, idle_timeout=300.0, buffer_size=64 * 1024, byte_counts=None):
+        self.loop = asyncio.get_running_loop()
+        self.route = route
+        self.upstream_url = upstream_url
+        self.idle_timeout = idle_timeout
+        self.byte_counts = byte_counts if byte_counts is not None else [0, 0]
+        self.client = TunnelEnd(self, UP, buffer_size)
+        self.upstream = TunnelEnd(self, DOWN, buffer_size)
+        self.opened = self.loop.time()
+        self.last_activity = self.opened
+        self.closed = self.loop.create_future()
+        self.close_reason = None
+        self.idle_handle = None
+
+    async def connect(self, timeout):
+        """Open the upstream connection; returns the value for its Host header."""
+        parts = urlsplit(self.upstream_url)
+        secure = parts.scheme in ('https', 'wss')
+        context = None
+        if secure:
+            # Like the upstream pool, certificates of local upstreams are not verified
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        await asyncio.wait_for(
+            self.loop.create_connection(lambda: self.upstream, parts.hostname,
+                                        parts.port or (443 if secure else 80), ssl=context),
+            timeout,
+        )
+        return parts.netloc
+
+    async def handshake(self, head, timeout):
+        """Send the upgrade request; returns (status, reason, headers) of the upstream's final response."""
+        self.upstream.transport.write(head)
+        return await asyncio.wait_for(self._read_response(), timeout)
+
+    async def _read_response(self):
+        upstream = self.upstream
+        while True:
+            end = upstream.pending.find(b'\r\n\r\n')
+            if end < 0:
+                if len(upstream.pending) > MAX_HEAD_BYTES:
+                    raise ValueError("upstream response head too large")
+                await upstream.wait_data()
+                continue
+            head = bytes(upstream.pending[:end])
+            del upstream.pending[:end + 4]
+            status, reason, headers = parse_response_head(head)
+            # Skip interim responses such as 100 Continue
+            if status == 101 or status >= 200:
+                return status, reason, headers
+
+    async def read_body(self, headers, expected=True):
+        """Body of a refused upgrade, framed by Content-Length, chunked encoding or EOF."""
+        upstream = self.upstream
+        length = headers.get('Content-Length')
+        chunked = 'chunked' in headers.get('Transfer-Encoding', '').lower()
+        if not expected or length == '0':
+            return b''
+        while True:
+            data = upstream.pending
+            if chunked:
+                body = decode_chunked(data)
+                if body is not None:
+                    return body
+            elif length is not None and len(data) >= int(length):
+                return bytes(data[:int(length)])
+            if len(data) > MAX_REFUSAL_BYTES:
+                raise ValueError("upstream refusal body too large")
+            if upstream.eof or upstream.lost:
+                if chunked or length is not None:
+                    raise ConnectionError("upstream closed the connection mid-response")
+                return bytes(data)
+            await upstream.wait_data()
+
+    def start(self, transport, tail=b''):
+        """Take over the client `transport` and start relaying."""
+        client, upstream = self.client, self.upstream
+        client.original_protocol = transport.get_protocol()
+        client.transport = transport
+        transport.set_protocol(client)
+        client.peer, upstream.peer = upstream, client
+
+        # Bytes that arrived with the handshake on either side go first
+        if upstream.pending:
+            self.byte_counts[DOWN] += len(upstream.pending)
+            upstream.received += len(upstream.pending)
+            transport.write(bytes(upstream.pending))
+            upstream.pending.clear()
+        if tail:
+            self.byte_counts[UP] += len(tail)
+            client.received += len(tail)
+            upstream.transport.write(tail)
+        if upstream.eof or upstream.lost or transport.is_closing():
+            self.close('closed')
+            return
+
+        # The HTTP server may have paused reading while it buffered the tail
+        transport.resume_reading()
+        self.last_activity = self.loop.time()
+        self.idle_handle = self.loop.call_later(self.idle_timeout, self._check_idle)
+
+    def _check_idle(self):
+        idle = self.loop.time() - self.last_activity
+        if idle >= self.idle_timeout:
+            self.close('idle')
+        else:
+            # Re-armed only when it fires, so traffic never touches the timer
+            self.idle_handle = self.loop.call_later(self.idle_timeout - idle, self._check_idle)
+
+    def close(self, reason):
+        if self.close_reason is not None:
+            return
+        self.close_reason = reason
+        if self.idle_handle is not None:
+            self.idle_handle.cancel()
+        for end in (self.client, self.upstream):
+            if end.transport is None:
+                continue
+            if reason in ('idle', 'shutdown'):
+                # An idle peer may never drain what is buffered for it
+                end.transport.abort()
+            else:
+                end.transport.close()
+        if not self.closed.done():
+            self.closed.set_result(reason)
+
+    def stats(self):
+        now = self.loop.time()
+        return {
+            'route': self.route,
+            'upstream': self.upstream_url,
+            'bytes_up': self.client.received,
+            'bytes_down': self.upstream.received,
+            'age_s': now - self.opened,
+            'idle_s': now - self.last_activity,
+        }
@@ -0,0 +1,96 @@
+import time
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, TraceConfig
+
+
+class UpstreamPool:
+    """
+    Long-lived upstream connection pool shared by every proxied request.
+    Connections are kept alive and reused per upstream (host, port) instead of
+    opening a new TCP connection for each hit.
+    """
+
+    def __init__(self, limit=100, limit_per_host=20, keepalive_timeout=30,
+                 dns_cache_ttl=300, connect_timeout=10):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.connect_timeout = connect_timeout
+        self.session = None
+        self.created = 0
+        self.reused = 0
+
+    async def start(self):
+        if self.session is None or self.session.closed:
+            trace_config = TraceConfig()
+            trace_config.on_connection_create_end.append(self._on_connection_created)
+            trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+            trace_config.on_request_start.append(self._on_request_start)
+            trace_config.on_connection_create_start.append(self._on_connection_create_start)
+            trace_config.on_request_end.append(self._on_request_end)
+
+            connector = TCPConnector(
+                ssl=False,
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+            self.session = ClientSession(
+                connector=connector,
+                timeout=ClientTimeout(total=None, sock_connect=self.connect_timeout),
+                trace_configs=[trace_config],
+                # Bodies are relayed as-is, Content-Encoding included
+                auto_decompress=False,
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _on_connection_created(self, session, context, params):
+        self.created += 1
+        timing = context.trace_request_ctx
+        if timing is not None and timing.connect_start is not None:
+            timing.connect = time.perf_counter() - timing.connect_start
+
+    # Requests pass a metrics.UpstreamTiming as trace_request_ctx to have these filled in
+    async def _on_request_start(self, session, context, params):
+        timing = context.trace_request_ctx
+        if timing is not None:
+            timing.request_start = time.perf_counter()
+
+    async def _on_connection_create_start(self, session, context, params):
+        timing = context.trace_request_ctx
+        if timing is not None:
+            timing.connect_start = time.perf_counter()
+
+    async def _on_request_end(self, session, context, params):
+        # Fired once the response headers have been read
+        timing = context.trace_request_ctx
+        if timing is not None and timing.request_start is not None:
+            timing.ttfb = time.perf_counter() - timing.request_start
+
+    async def _on_connection_reused(self, session, context, params):
+        self.reused += 1
+
+    def stats(self):
+        in_use = 0
+        idle = 0
+        if self.session is not None and not self.session.closed:
+            connector = self.session.connector
+            # aiohttp does not expose these counts publicly
+            in_use = len(getattr(connector, '_acquired', ()))
+            idle = sum(len(conns) for conns in getattr(connector, '_conns', {}).values())
+        return {
+            'in_use': in_use,
+            'idle': idle,
+            'created': self.created,
+            'reused': self.reused,
+            'limit': self.limit,
+            'limit_per_host': self.limit_per_host,
+        }
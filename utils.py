@@ -1,18 +1,25 @@
+import json
 import os
+import stat
 import sys
+import tempfile
+import time
 
 def get_data_dir():
     """
     Get the path to the Wild Caddy data directory in the user's Application Support folder.
-    Create the directory if it doesn't exist.
+    Create the directory if it doesn't exist. WILDCADDY_DATA_DIR overrides
+    the location, e.g. for headless runs on build agents.
     """
-    # Get the Application Support directory
-    app_support_dir = os.path.join(
-        os.path.expanduser("~"), "Library", "Application Support"
-    )
+    data_dir = os.environ.get("WILDCADDY_DATA_DIR")
+    if not data_dir:
+        # Get the Application Support directory
+        app_support_dir = os.path.join(
+            os.path.expanduser("~"), "Library", "Application Support"
+        )
 
-    # Create a directory specifically for Wild Caddy
-    data_dir = os.path.join(app_support_dir, "Wild Caddy")
+        # Create a directory specifically for Wild Caddy
+        data_dir = os.path.join(app_support_dir, "Wild Caddy")
 
     try:
         if not os.path.exists(data_dir):
@@ -21,3 +28,51 @@ def get_data_dir():
         raise OSError(f"Failed to create directory '{data_dir}': {str(e)}")
 
     return data_dir
+
+
+def atomic_write(path, data, mode='w', permissions=None):
+    """
+    Write `data` to `path` atomically: write a temp file in the same directory,
+    fsync it and rename it over the target, so readers never see a partial file.
+    `permissions` sets the file mode, e.g. 0o600 for private keys.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if permissions is None:
+            # mkstemp creates 0600 files; keep the target's permissions instead
+            permissions = stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else 0o644
+        os.chmod(tmp_path, permissions)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_install_record(path):
+    """The JSON record kept next to a downloaded binary (`<path>.json`), or None."""
+    try:
+        with open(path + '.json', 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def binary_is_current(path, version, max_age=24 * 3600):
+    """
+    True if the binary at `path` was installed for `version`. A pinned
+    version must match exactly; 'latest' counts as current for `max_age`
+    seconds after it was last resolved. Reading the record needs no
+    network or downloader imports, so it is cheap on every start.
+    """
+    record = read_install_record(path)
+    if record is None or not os.path.exists(path):
+        return False
+    if version == 'latest':
+        return record.get('requested') == 'latest' and time.time() - record.get('checked', 0) < max_age
+    return record.get('version') == version.lstrip('v')